@@ -3,12 +3,20 @@ from langchain.chains import LLMChain
 from langchain.chains import RetrievalQA
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.messages import SystemMessage
-from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
 from langchain_core.pydantic_v1 import BaseModel, Field # Definición del Schema
 
-from llm import llm
-from memory import prompt, memory
-from vector_db import initialize_faiss, documents, embeddings
+import threading
+from collections import OrderedDict
+
+from langchain_core.runnables import RunnableLambda
+
+from llm import llm, governor
+from memory import build_prompt, prompt, memory, memory_for
+from vector_db import embeddings
+from ingestion import load_or_build_corpus_index
+from faq_store import FaqStore
+from tenants import DEFAULT_TENANT
 # NUEVOS IMPORTS:
 from prompt_template import CLASSIFIER_TEMPLATE, CLASSIFIER_SCHEMA 
 
@@ -43,9 +51,10 @@ intent_chain = CLASSIFIER_PROMPT | llm | classification_parser
 # ==============================================================================
 # Cadenas de Respuesta RAG (Tu código existente - sin cambios)
 # ==============================================================================
-# initialize faiss vectordb
+# initialize faiss vectordb: persisted on disk and memory-mapped, so every
+# worker process on the host shares the same index and docstore pages
 try:
-    docsearch = initialize_faiss(documents, embeddings)
+    docsearch = load_or_build_corpus_index(embeddings)
     print("INFO: FAISS/Vector DB inicializado correctamente.")
 except Exception as e:
     print(f"ERROR: No se pudo inicializar FAISS/Vector DB: {e}")
@@ -68,28 +77,213 @@ qa_chain = RetrievalQA.from_chain_type(
 )
 
 
-# Function to process the response of the custom LLM
-def generate_response_from_llm(question, context, documents):
-    """Use the custom LLM to generate a response."""
-    # Match the question and the content of the retrieved documents
+# Stateless response chain (no shared memory) used for batch processing
+batch_response_chain = prompt | llm | StrOutputParser()
+
+# Stateless chains with a tenant's persona in the system prompt (see tenants.py)
+_persona_chains = {}
+_persona_chains_lock = threading.Lock()
+
+
+def response_chain_for(persona=""):
+    """Stateless response chain for the persona (the shared one if empty)."""
+    if not persona:
+        return batch_response_chain
+    with _persona_chains_lock:
+        chain = _persona_chains.get(persona)
+        if chain is None:
+            chain = _persona_chains[persona] = build_prompt(persona) | llm | StrOutputParser()
+        return chain
+
+# Fallback intent when classification fails
+DEFAULT_INTENT = {"case_type": "SIMPLE_INFO", "procedure_name": "Información general"}
+
+# Answer given when the LLM is unavailable and there is no cached answer
+CANNED_ANSWER = (
+    "En este momento no puedo generar una respuesta. Por favor, intenta de nuevo "
+    "en unos minutos o acércate a la mesa de entradas del municipio."
+)
+
+# Last good answers per question, served while the circuit breaker is open
+ANSWER_CACHE_SIZE = 512
+_answer_cache = OrderedDict()
+_answer_cache_lock = threading.Lock()
+
+
+def _cache_key(question, tenant=DEFAULT_TENANT):
+    # Every tenant answers from its own corpus: keep them apart
+    return (tenant or DEFAULT_TENANT, " ".join(question.lower().split()))
+
+
+def remember_answer(question, answer, tenant=DEFAULT_TENANT):
+    """Keep the answer as the degraded response for this question."""
+    if not isinstance(answer, str) or not answer or answer == CANNED_ANSWER:
+        return
+    key = _cache_key(question, tenant)
+    with _answer_cache_lock:
+        _answer_cache[key] = answer
+        _answer_cache.move_to_end(key)
+        if len(_answer_cache) > ANSWER_CACHE_SIZE:
+            _answer_cache.popitem(last=False)
+
+
+def cached_answer(question, tenant=DEFAULT_TENANT):
+    """Last good answer of the tenant for the question, or None."""
+    with _answer_cache_lock:
+        return _answer_cache.get(_cache_key(question, tenant))
+
+
+def degraded_answer(question, tenant=DEFAULT_TENANT):
+    """Cached answer for the question, or the canned one."""
+    return cached_answer(question, tenant) or CANNED_ANSWER
+
+
+def build_human_input(question, documents):
+    """Match the question and the content of the retrieved documents."""
     combined_input = f"Pregunta: {question}\n\nDocumentos:\n"
     for doc in documents:
         combined_input += f"- {doc.page_content}\n"
-    # Execute the LLM chain with the prompt and context
-    result = chat_llm_chain.run({
-        "human_input": combined_input,
-        "chat_history": context,
-    })
+    return combined_input
 
+
+class _Fallback:
+    """Fallback for a governed call that remembers whether it was used."""
+
+    def __init__(self, question, fallback=None, tenant=DEFAULT_TENANT):
+        self.question = question
+        self.fallback = fallback
+        self.tenant = tenant
+        self.used = False
+
+    def __call__(self):
+        self.used = True
+        if self.fallback is not None:
+            return self.fallback()
+        return degraded_answer(self.question, self.tenant)
+
+
+# Function to process the response of the custom LLM
+def generate_response_from_llm(
+    question, context, documents, deadline=None, fallback=None, tenant=DEFAULT_TENANT, persona=""
+):
+    """
+    Use the custom LLM to generate a response.
+    `deadline` (time.monotonic()) bounds the call; when it passes, or the
+    LLM fails, the answer is fallback() (default: cached or canned answer).
+    The governed chain is stateless (the governor may retry it while a
+    timed-out attempt still runs); the exchange is saved to the tenant's
+    memory (see memory_for) once, after a real answer. `persona` only
+    changes the system prompt.
+    """
+    combined_input = build_human_input(question, documents)
+    degraded = _Fallback(question, fallback, tenant)
+    # Execute the LLM chain with the prompt and context
+    result = governor.call(
+        response_chain_for(persona).invoke,
+        {"human_input": combined_input, "chat_history": context},
+        fallback=degraded,
+        deadline=deadline,
+    )
+    if not degraded.used:
+        remember_answer(question, result, tenant)
+        memory_for(tenant).save_context({"human_input": combined_input}, {"text": result})
     return result
 
-def classify_intent(query: str) -> dict:
-    """Clasifica la intención del usuario usando el modelo y devuelve un JSON."""
+
+def stream_response_from_llm(
+    question, context, documents, deadline=None, fallback=None, tenant=DEFAULT_TENANT, persona=""
+):
+    """
+    Stream the answer chunk by chunk (for HTTP streaming / st.write_stream).
+    The full exchange is saved to the tenant's memory once the stream ends,
+    unless it was a fallback answer.
+    `deadline` bounds the wait for the first chunk (see generate_response_from_llm).
+    """
+    combined_input = build_human_input(question, documents)
+    degraded = _Fallback(question, fallback, tenant)
+    chunks = []
+    for chunk in governor.stream(
+        response_chain_for(persona).stream,
+        {"human_input": combined_input, "chat_history": context},
+        fallback=degraded,
+        deadline=deadline,
+    ):
+        chunks.append(chunk)
+        yield chunk
+    answer = "".join(chunks)
+    if not degraded.used:
+        remember_answer(question, answer, tenant)
+        memory_for(tenant).save_context({"human_input": combined_input}, {"text": answer})
+
+
+def generate_responses_batch(questions, documents_list, max_concurrency=8, tenant=DEFAULT_TENANT, persona=""):
+    """
+    Generate answers for many questions with bounded concurrency.
+    Items that fail are returned as the raised exception, in input order.
+    """
+    inputs = [
+        {"human_input": build_human_input(question, documents), "chat_history": []}
+        for question, documents in zip(questions, documents_list)
+    ]
+    response_chain = response_chain_for(persona)
+    governed = RunnableLambda(lambda inputs: governor.call(response_chain.invoke, inputs))
+    results = governed.batch(
+        inputs,
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True,
+    )
+    for question, result in zip(questions, results):
+        remember_answer(question, result, tenant)
+    return results
+
+def classify_intent(query: str, deadline=None, fallback=None) -> dict:
+    """
+    Clasifica la intención del usuario usando el modelo y devuelve un JSON.
+    Con `deadline` (time.monotonic()) la llamada no se extiende más allá de ese instante.
+    """
+    # El governor reintenta errores transitorios; si igual falla (o el
+    # circuito está abierto, o vence el plazo) se usa fallback() o, si no
+    # se indicó, se asume información simple para no bloquear el chat
+    return governor.call(
+        intent_chain.invoke,
+        {"query": query},
+        fallback=fallback or (lambda: dict(DEFAULT_INTENT)),
+        deadline=deadline,
+    )
+
+
+def classify_intents(queries, max_concurrency=8):
+    """Clasifica muchas consultas en lote; las que fallan usan la intención por defecto."""
+    governed = RunnableLambda(lambda inputs: governor.call(intent_chain.invoke, inputs))
+    results = governed.batch(
+        [{"query": query} for query in queries],
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True,
+    )
+    intents = []
+    for result in results:
+        if isinstance(result, Exception) or not isinstance(result, dict):
+            print(f"Error en la clasificación de intención: {result}")
+            result = dict(DEFAULT_INTENT)
+        intents.append(result)
+    return intents
+
+
+# ==============================================================================
+# Respuestas precalculadas (FAQ): sin recuperación ni LLM
+# ==============================================================================
+faq_store = FaqStore(embeddings)
+FAQ_FINGERPRINT = None
+if docsearch is not None:
     try:
-        # Aquí usamos la nueva cadena de intención
-        # Asegúrate de que 'intent_chain' esté definido globalmente justo arriba.
-        return intent_chain.invoke({"query": query}) 
+        # Se regenera en segundo plano si cambió el índice o la lista de preguntas
+        FAQ_FINGERPRINT = faq_store.ensure_current(docsearch, generate_responses_batch)
     except Exception as e:
-        # En caso de error, asume información simple para no bloquear el chat
-        print(f"Error en la clasificación de intención: {e}")
-        return {"case_type": "SIMPLE_INFO", "procedure_name": "Información general"}
\ No newline at end of file
+        print(f"ERROR: No se pudo preparar el almacén de FAQ: {e}")
+
+
+def answer_from_faq(query):
+    """Respuesta precalculada para una pregunta frecuente, o None."""
+    if FAQ_FINGERPRINT is None:
+        return None
+    return faq_store.lookup(query, FAQ_FINGERPRINT)
@@ -1,36 +1,255 @@
 #!/usr/bin/env python3
+"""
+Streaming cleaning stage between the PDF loader and the index.
+
+Pages go through one at a time (ingestion.load_pages), so memory stays
+constant whatever the size of the PDF:
+- the rules (doc/cleaning_rules.json, MIA_CLEANING_RULES) are compiled
+  once: regex removals, literal words and replacements;
+- repeated headers and footers are learned per document from its first
+  `sample_pages` pages: a line near the top or bottom of the page that
+  shows up, with the same text (case and spacing ignored), on at least
+  `header_min_share` of them and on `header_min_pages` distinct pages is
+  dropped everywhere, as are bare page numbers. Digits are ignored only in
+  page references ("Página 3 de 10", "Informe 2024 - Pág. 3"), so a line
+  such as "Costo: $ 1500" is never mistaken for a header;
+- each cleaned page is a Document with its source, page number and the
+  number of boilerplate lines removed.
+
+The CLI writes the cleaned pages as JSONL (one record per page), which
+ingestion.py also reads back, and reports pages/s:
+    python backend/chatbot/data_preprocessing.py doc/raw_data/documento.pdf --out doc/processed_data/corpus.jsonl
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
 import re
-from langchain_community.document_loaders import PyPDFLoader
+import time
+from collections import Counter
+
+from langchain_core.documents import Document
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RULES_FILE = os.getenv("MIA_CLEANING_RULES", os.path.join(BASE_DIR, "doc", "cleaning_rules.json"))
+
+DEFAULT_RULES = {
+    # Regexes removed from every page
+    "remove_patterns": [r"http\S+", r"www\.\S+"],
+    # Whole words removed (case-insensitive)
+    "remove_words": [],
+    # [pattern, replacement] pairs applied in order
+    "replacements": [[r"(\w)-\n(\w)", r"\1\2"]],
+    # A line that is only a page number
+    "page_number_pattern": r"^\s*(p[aá]g(ina)?\.?\s*)?\d+(\s*(de|/)\s*\d+)?\s*$",
+    # Lines from the top and bottom of each page considered header/footer candidates
+    "edge_lines": 3,
+    # Share of sampled pages a candidate must appear on to be boilerplate
+    "header_min_share": 0.5,
+    # ...and the minimum number of distinct pages, whatever the sample size
+    "header_min_pages": 3,
+    # Pages per document used to learn its headers and footers
+    "sample_pages": 20,
+}
+
+_DIGITS = re.compile(r"\d+")
+# "Página 3", "pág. 3 de 10", "Pag 3/10" anywhere in a header or footer line
+_PAGE_REFERENCE = re.compile(r"\bp[aá]g(ina)?\.?\s*\d+(\s*(de|/)\s*\d+)?\b", re.IGNORECASE)
+_SPACES = re.compile(r"[ \t\f\v]+")
+_LINE_BREAKS = re.compile(r"\s*\n\s*")
+_PARAGRAPHS = re.compile(r"\n{2,}")
+
+
+class CleaningRules:
+    """Compiled cleaning rules."""
+
+    def __init__(self, **rules):
+        self.config = {**DEFAULT_RULES, **rules}
+        self.remove = [re.compile(pattern) for pattern in self.config["remove_patterns"]]
+        if self.config["remove_words"]:
+            words = "|".join(map(re.escape, self.config["remove_words"]))
+            self.remove.append(re.compile(rf"\b(?:{words})\b", re.IGNORECASE))
+        self.replacements = [(re.compile(pattern), repl) for pattern, repl in self.config["replacements"]]
+        self.page_number = re.compile(self.config["page_number_pattern"], re.IGNORECASE)
+        self.edge_lines = int(self.config["edge_lines"])
+        self.header_min_share = float(self.config["header_min_share"])
+        self.header_min_pages = int(self.config["header_min_pages"])
+        self.sample_pages = int(self.config["sample_pages"])
+
+    @classmethod
+    def from_file(cls, path=RULES_FILE):
+        """Rules from a JSON file; the defaults if it does not exist."""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    def fingerprint(self):
+        """Hash of the rules (a change invalidates the index)."""
+        return hashlib.sha256(json.dumps(self.config, sort_keys=True).encode()).hexdigest()[:16]
+
+    def clean(self, text):
+        """Apply removals and replacements, then normalize whitespace."""
+        for pattern, repl in self.replacements:
+            text = pattern.sub(repl, text)
+        for pattern in self.remove:
+            text = pattern.sub("", text)
+        text = _SPACES.sub(" ", text)
+        # Keep paragraph breaks, join the lines inside a paragraph
+        paragraphs = _PARAGRAPHS.split(text.replace("\r", ""))
+        return "\n\n".join(
+            _LINE_BREAKS.sub(" ", p).strip() for p in paragraphs if p.strip()
+        )
+
+
+def edge_key(line, page_number=None):
+    """
+    Header/footer identity of a line: case and spacing ignored, and the
+    numbers too if it is a page number (`page_number`) or has a page reference.
+    """
+    key = " ".join(line.lower().split())
+    if _PAGE_REFERENCE.search(key) or (page_number is not None and page_number.match(key)):
+        return _DIGITS.sub("#", key)
+    return key
+
+
+class BoilerplateDetector:
+    """Learns the repeated top/bottom lines of one document."""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.counts = Counter()
+        self.sampled = 0
+        self.boilerplate = set()
+
+    def _edges(self, lines):
+        n = self.rules.edge_lines
+        return lines[:n] + lines[max(n, len(lines) - n):]
+
+    def observe(self, lines):
+        self.sampled += 1
+        # A set: each page counts once per line
+        self.counts.update({self._key(line) for line in self._edges(lines) if line.strip()})
+
+    def _key(self, line):
+        return edge_key(line, self.rules.page_number)
+
+    def learn(self):
+        threshold = max(2, self.rules.header_min_pages, self.rules.header_min_share * self.sampled)
+        self.boilerplate = {key for key, count in self.counts.items() if count >= threshold}
+        self.counts.clear()
+
+    def strip(self, lines):
+        """(lines without headers, footers and page numbers, number removed)."""
+        n = self.rules.edge_lines
+        kept = []
+        for i, line in enumerate(lines):
+            at_edge = i < n or i >= len(lines) - n
+            if at_edge and (self._key(line) in self.boilerplate or self.rules.page_number.match(line)):
+                continue
+            kept.append(line)
+        return kept, len(lines) - len(kept)
+
+
+class PipelineStats:
+    """Counters of a cleaning run."""
+
+    def __init__(self):
+        self.pages = self.empty_pages = self.removed_lines = 0
+        self.chars_in = self.chars_out = 0
+        self.started = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def pages_per_second(self):
+        return self.pages / self.seconds if self.seconds else 0.0
+
+    def as_dict(self):
+        return {
+            "pages": self.pages,
+            "empty_pages": self.empty_pages,
+            "removed_lines": self.removed_lines,
+            "chars_in": self.chars_in,
+            "chars_out": self.chars_out,
+            "seconds": round(self.seconds, 2),
+            "pages_per_second": round(self.pages_per_second, 1),
+        }
+
+    def __str__(self):
+        return (
+            f"{self.pages} pages in {self.seconds:.1f}s ({self.pages_per_second:.1f} pages/s), "
+            f"{self.removed_lines} boilerplate lines removed, "
+            f"{self.chars_in - self.chars_out} of {self.chars_in} characters dropped"
+        )
+
+
+def _clean_document(pages, rules, stats):
+    detector = BoilerplateDetector(rules)
+    # Only the sample is buffered; the rest of the document streams through
+    sample = list(itertools.islice(pages, rules.sample_pages))
+    for page in sample:
+        detector.observe(page.page_content.splitlines())
+    detector.learn()
+    for page in itertools.chain(sample, pages):
+        lines, removed = detector.strip(page.page_content.splitlines())
+        text = rules.clean("\n".join(lines))
+        stats.pages += 1
+        stats.removed_lines += removed
+        stats.chars_in += len(page.page_content)
+        stats.chars_out += len(text)
+        if not text:
+            stats.empty_pages += 1
+            continue
+        yield Document(page_content=text, metadata={**page.metadata, "removed_lines": removed})
+
+
+def clean_pages(pages, rules=None, stats=None):
+    """Yield the cleaned pages of a page stream (headers learned per source)."""
+    rules = rules or CleaningRules.from_file()
+    stats = stats if stats is not None else PipelineStats()
+    for _, document_pages in itertools.groupby(pages, key=lambda page: page.metadata.get("source")):
+        yield from _clean_document(document_pages, rules, stats)
 
-# Load the PDF
-loader = PyPDFLoader('backend/chatbot/doc/raw_data/documento.pdf')
-# Load the document
-documents = loader.load()  # Esto devolverá una lista de objetos de documento
 
+def write_jsonl(documents, path):
+    """Write one record per page ({"text", **metadata}); returns the count."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = path + ".tmp"
+    count = 0
+    with open(tmp, "w", encoding="utf-8") as f:
+        for doc in documents:
+            f.write(json.dumps({"text": doc.page_content, **doc.metadata}, ensure_ascii=False) + "\n")
+            count += 1
+    os.replace(tmp, path)
+    return count
 
-def process_text(text):
-    # Delete links
-    text = re.sub(r'http\S+', '', text)
 
-    # Delete specific words like
-    words_to_remove = ['elcorteingles', 'lunamar']
-    pattern = r'\b(?:' + '|'.join(map(re.escape, words_to_remove)) + r')\b'
-    text = re.sub(pattern, '', text)
+def read_jsonl(path):
+    """Yield the pages of a JSONL file written by write_jsonl."""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                yield Document(page_content=record.pop("text"), metadata=record)
 
-    # Remove unwanted special characters
-    text = re.sub(r'[^\w\sñáéíóúü]', '', text)
 
-    # Remove unnecessary line breaks
-    text = re.sub(r'\n+', ' ', text).strip()
+def main():
+    from ingestion import CORPUS_FILES, load_raw_pages
 
-    # Remove multiple spaces
-    text = re.sub(r'\s+', ' ', text)
+    parser = argparse.ArgumentParser(description="Clean PDF pages into JSONL")
+    parser.add_argument("files", nargs="*", default=CORPUS_FILES)
+    parser.add_argument("--out", default=os.path.join(BASE_DIR, "doc", "processed_data", "corpus.jsonl"))
+    parser.add_argument("--rules", default=RULES_FILE)
+    args = parser.parse_args()
 
-    return text
+    stats = PipelineStats()
+    write_jsonl(clean_pages(load_raw_pages(args.files), CleaningRules.from_file(args.rules), stats), args.out)
+    print(f"{args.out}: {stats}")
 
 
-with open('backend/chatbot/doc/processed_data/documento.txt',
-          'w', encoding='utf-8') as f:
-    for document in documents:
-        processed_text = process_text(document.page_content)
-        f.write(f"{processed_text}\n\n")
+if __name__ == "__main__":
+    main()
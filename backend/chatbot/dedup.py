@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate chunk removal at ingestion (MinHash + LSH banding).
+
+Municipal PDFs repeat disclaimers, requirement lists and legal text across
+pages and documents, so many chunks are nearly the same. Each chunk is
+reduced to word shingles and a MinHash signature; the signature is cut into
+bands and chunks sharing a band bucket become candidates. A candidate whose
+estimated Jaccard similarity with an already kept chunk reaches the
+threshold (MIA_DEDUP_THRESHOLD, 0.85 by default; above 1 disables) is
+dropped and mapped to that canonical chunk. The first occurrence, in
+corpus order, is the one kept.
+
+Only the kept chunks' signatures are held (num_perm uint32 each), never
+their shingles, so the stage runs over the chunk stream.
+
+Report for a set of files, without building the index:
+    python backend/chatbot/dedup.py doc/raw_data/documento.pdf --threshold 0.8
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+from collections import defaultdict
+
+import numpy as np
+
+THRESHOLD = float(os.getenv("MIA_DEDUP_THRESHOLD", "0.85"))
+NUM_PERM = 128
+SHINGLE_WORDS = 5
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_WORDS = re.compile(r"\w+")
+
+
+def shingles(text, size=SHINGLE_WORDS):
+    """Set of hashed word n-grams of the normalized text."""
+    words = _WORDS.findall(text.lower())
+    if len(words) < size:
+        words = words + [""] * (size - len(words))
+    return {
+        int.from_bytes(hashlib.blake2b(" ".join(words[i:i + size]).encode("utf-8"), digest_size=4).digest(), "little")
+        for i in range(len(words) - size + 1)
+    }
+
+
+def optimal_bands(threshold, num_perm=NUM_PERM):
+    """(bands, rows) whose LSH S-curve crosses 50 % closest to the threshold."""
+    best = None
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """MinHash signatures with num_perm universal hash permutations."""
+
+    def __init__(self, num_perm=NUM_PERM, seed=1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, (1 << 61) - 1, size=num_perm, dtype=np.uint64)
+
+    def signature(self, shingle_hashes):
+        values = np.fromiter(shingle_hashes, dtype=np.uint64, count=len(shingle_hashes))
+        # (a * x + b) mod p for every shingle and permutation; min per permutation
+        permuted = (np.outer(values, self.a) + self.b) % _MERSENNE_PRIME & _MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+
+class LSHIndex:
+    """Band buckets of the kept signatures."""
+
+    def __init__(self, bands, rows):
+        self.bands = bands
+        self.rows = rows
+        self.buckets = [defaultdict(list) for _ in range(bands)]
+
+    def _keys(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def candidates(self, signature):
+        found = set()
+        for band, key in self._keys(signature):
+            found.update(self.buckets[band].get(key, ()))
+        return found
+
+    def insert(self, item, signature):
+        for band, key in self._keys(signature):
+            self.buckets[band][key].append(item)
+
+
+def chunk_id(doc):
+    """Stable id of a chunk: source file, page and position in the page."""
+    meta = doc.metadata
+    return f"{os.path.basename(str(meta.get('source', '')))}:{meta.get('page', '')}:{meta.get('chunk', '')}"
+
+
+class DedupResult:
+    """Kept chunks, dropped -> canonical map and size stats."""
+
+    def __init__(self):
+        self.kept = []
+        self.canonical_of = {}
+        self.chunks_in = self.chars_in = self.chars_out = 0
+        self.seconds = 0.0
+
+    def stats(self):
+        dropped = len(self.canonical_of)
+        return {
+            "chunks_in": self.chunks_in,
+            "chunks_out": len(self.kept),
+            "dropped": dropped,
+            "index_shrink": dropped / self.chunks_in if self.chunks_in else 0.0,
+            "chars_in": self.chars_in,
+            "chars_out": self.chars_out,
+            "seconds": round(self.seconds, 2),
+        }
+
+    def __str__(self):
+        stats = self.stats()
+        return (
+            f"{stats['chunks_in']} chunks -> {stats['chunks_out']} "
+            f"({stats['dropped']} near-duplicates, index {stats['index_shrink']:.1%} smaller) "
+            f"in {stats['seconds']:.1f}s"
+        )
+
+    def write_report(self, path):
+        """Stats and the dropped -> canonical map as JSON (written atomically)."""
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"stats": self.stats(), "canonical_of": self.canonical_of}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+
+
+def dedup_chunks(documents, threshold=THRESHOLD, num_perm=NUM_PERM, shingle_size=SHINGLE_WORDS):
+    """Drop the chunks that are near-duplicates of an earlier one."""
+    result = DedupResult()
+    started = time.perf_counter()
+    if threshold > 1:
+        for doc in documents:
+            result.kept.append(doc)
+            result.chunks_in += 1
+            result.chars_in += len(doc.page_content)
+        result.chars_out = result.chars_in
+        result.seconds = time.perf_counter() - started
+        return result
+
+    hasher = MinHasher(num_perm)
+    lsh = LSHIndex(*optimal_bands(threshold, num_perm))
+    signatures = []
+    kept_ids = []
+    for doc in documents:
+        result.chunks_in += 1
+        result.chars_in += len(doc.page_content)
+        signature = hasher.signature(shingles(doc.page_content, shingle_size))
+        best, best_similarity = None, threshold
+        for candidate in lsh.candidates(signature):
+            similarity = np.count_nonzero(signatures[candidate] == signature) / num_perm
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        if best is not None:
+            result.canonical_of[chunk_id(doc)] = kept_ids[best]
+            continue
+        lsh.insert(len(signatures), signature)
+        signatures.append(signature)
+        kept_ids.append(chunk_id(doc))
+        result.kept.append(doc)
+        result.chars_out += len(doc.page_content)
+    result.seconds = time.perf_counter() - started
+    return result
+
+
+def main():
+    from ingestion import CORPUS_FILES, load_chunks
+
+    parser = argparse.ArgumentParser(description="Near-duplicate chunks of a corpus")
+    parser.add_argument("files", nargs="*", default=CORPUS_FILES)
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--report", help="write stats and the dropped -> canonical map to this JSON file")
+    args = parser.parse_args()
+
+    result = dedup_chunks(load_chunks(args.files), args.threshold)
+    print(result)
+    if args.report:
+        result.write_report(args.report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Local embedding server shared by all app processes on a host.
+
+One process owns the sentence-transformers model and listens on a Unix
+socket. Encode requests from every app worker are queued and encoded
+together: the batcher takes the first waiting request, keeps collecting
+for up to `max_wait_ms` (or until `max_batch` texts) and runs a single
+model call for the whole micro-batch.
+
+Wire format (both directions are length-prefixed):
+- request:  uint32 length + JSON {"texts": [...]}
+- response: uint32 rows + uint32 dim + rows*dim float32 (little endian),
+            or rows = ERROR_ROWS followed by uint32 length + UTF-8 message
+
+Usage (from the repository root):
+    python backend/chatbot/embedding_service.py --socket /tmp/mia-embeddings.sock
+"""
+import argparse
+import json
+import logging
+import os
+import queue
+import socketserver
+import struct
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger("mia.embeddings")
+
+MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+SOCKET_PATH = os.getenv("MIA_EMBEDDING_SOCKET", "/tmp/mia-embeddings.sock")
+ERROR_ROWS = 0xFFFFFFFF
+
+_U32 = struct.Struct("<I")
+_HEADER = struct.Struct("<II")
+
+
+def recv_exact(sock, size):
+    """Read exactly `size` bytes or raise ConnectionError."""
+    buf = bytearray(size)
+    view = memoryview(buf)
+    while size:
+        n = sock.recv_into(view, size)
+        if not n:
+            raise ConnectionError("embedding socket closed")
+        view, size = view[n:], size - n
+    return bytes(buf)
+
+
+def send_request(sock, texts):
+    payload = json.dumps({"texts": list(texts)}, ensure_ascii=False).encode("utf-8")
+    sock.sendall(_U32.pack(len(payload)) + payload)
+
+
+def read_response(sock):
+    """Matrix of float32 embeddings, or RuntimeError with the server message."""
+    rows, dim = _HEADER.unpack(recv_exact(sock, _HEADER.size))
+    if rows == ERROR_ROWS:
+        (length,) = _U32.unpack(recv_exact(sock, _U32.size))
+        raise RuntimeError(recv_exact(sock, length).decode("utf-8"))
+    data = recv_exact(sock, rows * dim * 4)
+    return np.frombuffer(data, dtype="<f4").reshape(rows, dim)
+
+
+class MicroBatcher:
+    """Groups concurrent encode calls into one model call."""
+
+    def __init__(self, encode, max_batch=64, max_wait_ms=5.0):
+        self.encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.texts = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="embedding-batcher", daemon=True).start()
+
+    def submit(self, texts):
+        future = Future()
+        self._queue.put((texts, future))
+        return future
+
+    def _collect(self):
+        pending = [self._queue.get()]
+        size = len(pending[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._collect()
+            texts = [text for item, _ in pending for text in item]
+            try:
+                vectors = np.asarray(self.encode(texts), dtype="<f4")
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            start = 0
+            for item, future in pending:
+                future.set_result(vectors[start:start + len(item)])
+                start += len(item)
+
+
+class EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    """Serves requests on one persistent client connection."""
+
+    def handle(self):
+        sock = self.request
+        while True:
+            try:
+                (length,) = _U32.unpack(recv_exact(sock, _U32.size))
+                texts = json.loads(recv_exact(sock, length).decode("utf-8"))["texts"]
+            except (ConnectionError, OSError):
+                return
+            try:
+                vectors = self.server.batcher.submit(texts).result() if texts else np.zeros((0, 0), "<f4")
+                sock.sendall(_HEADER.pack(*vectors.shape) + vectors.tobytes())
+            except OSError:
+                return
+            except Exception as e:
+                message = str(e).encode("utf-8")
+                sock.sendall(_HEADER.pack(ERROR_ROWS, 0) + _U32.pack(len(message)) + message)
+
+
+class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path, batcher):
+        self.batcher = batcher
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # Stale socket from a previous run
+        super().__init__(socket_path, EmbeddingRequestHandler)
+        os.chmod(socket_path, 0o660)
+
+
+def serve(socket_path=SOCKET_PATH, model_name=MODEL_NAME, max_batch=64, max_wait_ms=5.0):
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+    model = HuggingFaceEmbeddings(model_name=model_name)
+    batcher = MicroBatcher(model.embed_documents, max_batch, max_wait_ms)
+    server = EmbeddingServer(socket_path, batcher)
+    logger.info("Embedding server for %s listening on %s", model_name, socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+        logger.info("Served %s texts in %s batches", batcher.texts, batcher.batches)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared local embedding server")
+    parser.add_argument("--socket", default=SOCKET_PATH)
+    parser.add_argument("--model", default=MODEL_NAME)
+    parser.add_argument("--max-batch", type=int, default=64)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(args.socket, args.model, args.max_batch, args.max_wait_ms)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Precomputed answers for frequent questions, served without retrieval or LLM.
+
+An offline job answers a curated question list (doc/faq_questions.json)
+against the current corpus and stores question, answer and question
+embedding in SQLite. At request time a query whose embedding is close
+enough to a stored question (cosine >= threshold) gets the stored answer
+directly. The store records the fingerprint of the index and question list
+it was built from; when either changes it is rebuilt (in the background at
+startup) and stale answers are not served meanwhile.
+
+New answers are stored unapproved and are only served after review
+(running apps pick approvals up on restart); MIA_FAQ_REQUIRE_APPROVAL=0
+serves them as generated. A rebuild that gets no answer at all (e.g. the
+LLM is down) keeps the previous store, so it is retried on next start:
+    python backend/chatbot/faq_store.py --list
+    python backend/chatbot/faq_store.py --approve 3 7
+    python backend/chatbot/faq_store.py --rebuild
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+import numpy as np
+
+from shared_index import INDEX_DIR, index_fingerprint
+
+logger = logging.getLogger("mia.faq")
+
+FAQ_QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "doc", "faq_questions.json")
+FAQ_DB_PATH = os.path.join(INDEX_DIR, "faq.sqlite")
+FAQ_THRESHOLD = float(os.getenv("MIA_FAQ_THRESHOLD", "0.9"))
+REQUIRE_APPROVAL = os.getenv("MIA_FAQ_REQUIRE_APPROVAL", "1") == "1"
+
+
+def load_questions(path=FAQ_QUESTIONS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def faq_fingerprint(questions, index_dir=INDEX_DIR):
+    """Changes when the document index or the question list changes."""
+    digest = hashlib.sha256((index_fingerprint(index_dir) or "").encode())
+    for question in questions:
+        digest.update(question.encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+def _unit_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def build_faq_store(questions, docsearch, embeddings, generate, fingerprint,
+                    path=FAQ_DB_PATH, approved=not REQUIRE_APPROVAL):
+    """
+    Answer every question and write the store atomically.
+
+    `generate(questions, documents_list)` returns one answer (or exception)
+    per question, e.g. chain.generate_responses_batch. Failed questions are
+    left out of the store; if none was answered the store is not written
+    (the fingerprint is not stamped, so the next start tries again).
+    """
+    from vector_db import similarity_search_many
+
+    documents_list = similarity_search_many(docsearch, questions)
+    answers = generate(questions, documents_list)
+    answered = [
+        (question, answer) for question, answer in zip(questions, answers)
+        if isinstance(answer, str) and answer.strip()
+    ]
+    if not answered:
+        logger.warning("FAQ store not rebuilt: none of %s questions was answered", len(questions))
+        return 0
+    vectors = _unit_rows(embeddings.embed_documents([question for question, _ in answered]))
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    conn = sqlite3.connect(tmp)
+    conn.execute("""
+        CREATE TABLE faq (
+            id INTEGER PRIMARY KEY,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            approved INTEGER NOT NULL,
+            embedding BLOB NOT NULL
+        )
+    """)
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    rows = [
+        (question, answer, int(approved), vector.tobytes())
+        for (question, answer), vector in zip(answered, vectors)
+    ]
+    conn.executemany("INSERT INTO faq (question, answer, approved, embedding) VALUES (?, ?, ?, ?)", rows)
+    conn.execute("INSERT INTO meta (key, value) VALUES ('fingerprint', ?)", (fingerprint,))
+    conn.commit()
+    conn.close()
+    os.replace(tmp, path)
+    logger.info("FAQ store rebuilt: %s of %s questions answered", len(rows), len(questions))
+    return len(rows)
+
+
+class FaqStore:
+    """Approved FAQ answers held in memory with their unit question vectors."""
+
+    def __init__(self, embeddings, path=FAQ_DB_PATH, threshold=FAQ_THRESHOLD):
+        self.embeddings = embeddings
+        self.path = path
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.rebuilding = False
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        fingerprint, questions, answers, matrix = None, [], [], None
+        if os.path.exists(self.path):
+            conn = sqlite3.connect(self.path)
+            row = conn.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+            fingerprint = row[0] if row else None
+            rows = conn.execute("SELECT question, answer, embedding FROM faq WHERE approved = 1").fetchall()
+            conn.close()
+            if rows:
+                questions = [r[0] for r in rows]
+                answers = [r[1] for r in rows]
+                matrix = np.vstack([np.frombuffer(r[2], dtype=np.float32) for r in rows])
+        # Swap everything at once so concurrent lookups see one consistent version
+        self._data = (fingerprint, questions, answers, matrix)
+
+    @property
+    def fingerprint(self):
+        return self._data[0]
+
+    def is_current(self, fingerprint):
+        return self.fingerprint == fingerprint
+
+    def lookup(self, query, fingerprint=None):
+        """
+        Stored answer for a close enough question, or None.
+
+        Returns: {"question", "answer", "score"}
+        """
+        stored_fingerprint, questions, answers, matrix = self._data
+        if matrix is None or (fingerprint is not None and stored_fingerprint != fingerprint):
+            return None
+        scores = matrix @ _unit_rows(self.embeddings.embed_query(query))
+        best = int(np.argmax(scores))
+        with self._lock:
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {"question": questions[best], "answer": answers[best], "score": float(scores[best])}
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "faq_entries": len(self._data[1]),
+            "faq_hits": self.hits,
+            "faq_hit_rate": self.hits / total if total else 0.0,
+            "faq_rebuilding": self.rebuilding,
+        }
+
+    def ensure_current(self, docsearch, generate, questions=None, background=True):
+        """Rebuild the store if the index or the question list changed."""
+        questions = questions if questions is not None else load_questions()
+        fingerprint = faq_fingerprint(questions)
+        if self.is_current(fingerprint) or self.rebuilding:
+            return fingerprint
+
+        def rebuild():
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                # Only one of the app processes starting together pays for the LLM calls
+                with open(self.path + ".lock", "w") as lock:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                    self.reload()
+                    if not self.is_current(fingerprint):
+                        build_faq_store(questions, docsearch, self.embeddings, generate, fingerprint, self.path)
+                        self.reload()
+            except Exception:
+                logger.exception("FAQ store rebuild failed")
+            finally:
+                self.rebuilding = False
+
+        self.rebuilding = True
+        if background:
+            threading.Thread(target=rebuild, name="faq-rebuild", daemon=True).start()
+        else:
+            rebuild()
+        return fingerprint
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precomputed FAQ answers")
+    parser.add_argument("--rebuild", action="store_true", help="regenerate all answers now")
+    parser.add_argument("--list", action="store_true", help="show stored questions and approval state")
+    parser.add_argument("--approve", type=int, nargs="*", help="approve answers by id")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.approve:
+        conn = sqlite3.connect(FAQ_DB_PATH)
+        conn.executemany("UPDATE faq SET approved = 1 WHERE id = ?", [(i,) for i in args.approve])
+        conn.commit()
+        conn.close()
+    if args.rebuild:
+        from chain import docsearch, generate_responses_batch
+        from vector_db import embeddings
+
+        questions = load_questions()
+        build_faq_store(questions, docsearch, embeddings, generate_responses_batch, faq_fingerprint(questions))
+    if args.list or not (args.rebuild or args.approve):
+        conn = sqlite3.connect(FAQ_DB_PATH)
+        for faq_id, question, approved in conn.execute("SELECT id, question, approved FROM faq"):
+            print(f"{faq_id:>4} {'ok' if approved else '--'}  {question}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Measure per-worker memory of the shared FAISS index.
+
+Starts 1, 4 and 16 worker processes that open the persisted index (built
+by shared_index.load_or_build_index) either memory-mapped or fully loaded,
+touch every vector with a search, read every chunk from the docstore and
+report RSS and PSS from /proc/self/smaps_rollup. PSS splits shared pages
+between the processes that map them, so with mmap it should drop as the
+worker count grows while RSS stays flat.
+
+The embedding model is not loaded: queries are random vectors, so the
+numbers isolate the index and docstore.
+
+Usage (from the repository root, after the app has built the index once):
+    python backend/chatbot/index_rss_report.py --workers 1 4 16
+"""
+import argparse
+import multiprocessing as mp
+import os
+
+import numpy as np
+
+from shared_index import INDEX_DIR, load_shared_faiss
+
+
+def memory_kib():
+    """(rss, pss) of the current process in KiB, Linux only."""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                values[parts[0][:-1]] = int(parts[1])
+    return values.get("Rss", 0), values.get("Pss", 0)
+
+
+def _worker(index_dir, mmap, ready, go, results):
+    store = load_shared_faiss(None, index_dir, mmap=mmap)
+    queries = np.random.default_rng(os.getpid()).random((32, store.index.d), dtype=np.float32)
+    store.index.search(queries, 4)
+    for i in range(store.index.ntotal):
+        store.docstore.search(store.index_to_docstore_id[i])
+    ready.wait()  # All workers loaded: measure with the pages shared
+    go.wait()
+    results.put(memory_kib())
+
+
+def measure(index_dir, workers, mmap):
+    """Average (rss, pss) in MiB over `workers` concurrent processes."""
+    ctx = mp.get_context("spawn")
+    ready, go = ctx.Barrier(workers), ctx.Barrier(workers + 1)
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(target=_worker, args=(index_dir, mmap, ready, go, results))
+        for _ in range(workers)
+    ]
+    for p in procs:
+        p.start()
+    go.wait()
+    samples = [results.get() for _ in procs]
+    for p in procs:
+        p.join()
+    rss = sum(s[0] for s in samples) / len(samples) / 1024
+    pss = sum(s[1] for s in samples) / len(samples) / 1024
+    return rss, pss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'workers':>8}{'RSS MiB':>12}{'PSS MiB':>12}{'total PSS':>12}")
+    for mmap in (False, True):
+        for workers in args.workers:
+            rss, pss = measure(args.index_dir, workers, mmap)
+            mode = "mmap" if mmap else "load"
+            print(f"{mode:<8}{workers:>8}{rss:>12.1f}{pss:>12.1f}{pss * workers:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
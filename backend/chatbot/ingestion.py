@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Corpus loading for the index.
+
+Nothing here is kept at module level: the pages are read only when the
+index has to be (re)built and are released once it is written. Whether a
+rebuild is needed is decided from a fingerprint of the source files and
+the cleaning rules, so a process that finds an up-to-date index never
+parses the PDFs at all.
+
+PDF and text files are read page by page through the cleaning stage
+(data_preprocessing.py); JSONL files it wrote are taken as already clean.
+Pages are then split into chunks (text_splitter.split_documents) and
+near-duplicate chunks are dropped (dedup.py) before embedding; the dedup
+stats and dropped -> canonical map are written next to the index.
+MIA_CORPUS_FILES (separated by os.pathsep) replaces the default corpus.
+"""
+import hashlib
+import logging
+import os
+
+from data_preprocessing import CleaningRules, PipelineStats, clean_pages, read_jsonl
+from dedup import THRESHOLD, dedup_chunks
+from shared_index import INDEX_DIR, load_or_build_index
+from text_splitter import split_documents
+
+logger = logging.getLogger("mia.ingestion")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_FILES = (
+    os.environ["MIA_CORPUS_FILES"].split(os.pathsep)
+    if os.getenv("MIA_CORPUS_FILES")
+    else [os.path.join(BASE_DIR, "doc", "raw_data", "documento.pdf")]
+)
+
+# Bumped when the way pages become indexed documents changes
+PIPELINE_VERSION = "3"
+DEDUP_REPORT = "dedup.json"
+
+
+def resolve(path):
+    """Corpus paths are relative to this directory."""
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+
+
+def load_raw_pages(paths=CORPUS_FILES):
+    """Yield the pages of PDF or text files one at a time, as extracted."""
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader
+
+    for path in paths:
+        path = resolve(path)
+        loader = PyPDFLoader(path) if path.lower().endswith(".pdf") else TextLoader(path, encoding="utf-8")
+        yield from loader.lazy_load()
+
+
+def load_pages(paths=CORPUS_FILES, rules=None, stats=None):
+    """Yield the cleaned pages of the source files one at a time."""
+    for path in paths:
+        if path.lower().endswith(".jsonl"):
+            yield from read_jsonl(resolve(path))
+        else:
+            yield from clean_pages(load_raw_pages([path]), rules, stats)
+
+
+def load_chunks(paths=CORPUS_FILES, rules=None, stats=None):
+    """Yield the chunks of the cleaned pages, with their page metadata."""
+    return split_documents(load_pages(paths, rules, stats))
+
+
+def load_documents(paths=CORPUS_FILES, rules=None, threshold=THRESHOLD, report_path=None):
+    """Documents to index for these source files (cleaned, chunked, deduplicated)."""
+    stats = PipelineStats()
+    result = dedup_chunks(load_chunks(paths, rules or CleaningRules.from_file(), stats), threshold)
+    logger.info("Cleaning: %s", stats)
+    logger.info("Dedup: %s", result)
+    if report_path:
+        os.makedirs(os.path.dirname(report_path), exist_ok=True)
+        result.write_report(report_path)
+    return result.kept
+
+
+def source_fingerprint(paths=CORPUS_FILES, rules=None, threshold=THRESHOLD):
+    """Hash of the source files, the cleaning rules, the dedup threshold and the pipeline version."""
+    rules = rules or CleaningRules.from_file()
+    digest = hashlib.sha256(f"{PIPELINE_VERSION}:{rules.fingerprint()}:{threshold}".encode())
+    for path in paths:
+        digest.update(os.path.basename(path).encode("utf-8") + b"\0")
+        with open(resolve(path), "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def load_or_build_corpus_index(embeddings, paths=CORPUS_FILES, index_dir=INDEX_DIR):
+    """Open the index of these files, loading and indexing them only if it is stale."""
+    return load_or_build_index(
+        lambda: load_documents(paths, report_path=os.path.join(index_dir, DEDUP_REPORT)),
+        embeddings,
+        index_dir,
+        fingerprint=source_fingerprint(paths),
+    )
@@ -1,16 +1,10 @@
 #!/usr/bin/env python3
-import os
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+from llm_governor import LLMGovernor
+from llm_providers import create_llm
 
-# Retrieve the API key from the environment variable
-API_KEY = os.getenv('GOOGLE_API_KEY')
+# Instantiate the chat model of the configured provider (MIA_LLM_PROVIDER:
+# gemini by default, fake for offline/load tests, openai for a local endpoint)
+llm = create_llm()
 
-# Instantiate the Google Generative AI model
-llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-flash",
-    api_key=API_KEY,
-    temperature=0,
-    streaming=True,
-    callbacks=[StreamingStdOutCallbackHandler()]
-)
+# Every call to the llm goes through this governor (see llm_governor.py)
+governor = LLMGovernor.from_env()
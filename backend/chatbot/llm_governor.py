@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+"""
+Governor for every call made to the LLM.
+
+Calls go through, in order:
+- a circuit breaker: after `failure_threshold` consecutive failures calls
+  are rejected for `reset_timeout` seconds, then one trial call decides
+  whether it closes again; rejected calls use the caller's fallback
+- a global concurrency semaphore (time spent waiting is the queue wait)
+- a token bucket limiting the request rate sent to the provider
+- a per-call timeout, shortened to the caller's deadline if one is given
+- retries with full-jitter exponential backoff for retryable errors
+  (rate limits, 5xx, timeouts, connection errors)
+
+Only those provider errors count as breaker failures. Any other error
+(a 4xx, a malformed JSON answer the output parser rejects) means the
+provider did answer, so it is neither retried nor held against it.
+Governed functions may run more than once and a timed-out attempt keeps
+running in its worker, so they must not have side effects such as
+writing conversation memory; callers do that once with the result.
+"""
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+logger = logging.getLogger("mia.llm")
+
+
+class LLMTimeoutError(TimeoutError):
+    """The LLM did not answer within the call timeout."""
+
+
+class CircuitOpenError(RuntimeError):
+    """The circuit breaker is open and the call was not attempted."""
+
+
+# HTTP statuses of transient provider errors
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+# Client exceptions of transient errors that carry no status, by class name
+# so that the optional provider packages need not be imported
+RETRYABLE_TYPES = frozenset({
+    # openai
+    "APIConnectionError", "APITimeoutError",
+    # httpx
+    "ConnectError", "ReadTimeout", "TimeoutException", "RemoteProtocolError",
+    # google.api_core (also carry their status in `code`)
+    "ResourceExhausted", "ServiceUnavailable", "DeadlineExceeded",
+})
+
+
+def _status_code(error):
+    """HTTP status of a provider exception, if it has one."""
+    for holder in (error, getattr(error, "response", None)):
+        status = getattr(holder, "status_code", None)
+        if isinstance(status, int):
+            return status
+    # google.api_core exceptions keep the HTTP status in `code`
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable(error):
+    """Transient provider errors worth retrying; bad requests and parse errors are not."""
+    while error is not None:
+        if isinstance(error, (TimeoutError, ConnectionError)):
+            return True
+        status = _status_code(error)
+        if status is not None:
+            return status in RETRYABLE_STATUS
+        if any(cls.__name__ in RETRYABLE_TYPES for cls in type(error).__mro__):
+            return True
+        # LangChain integrations may wrap the client exception
+        error = error.__cause__
+    return False
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout=None):
+        """
+        Block until a token is available; returns the seconds waited, or
+        None (without taking a token) if none frees up within `timeout`.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            if timeout is not None and waited + delay > timeout:
+                return None
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """closed -> open after N consecutive failures -> half_open after a cooldown."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.opens = 0
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._trial_running = False
+
+    def record_neutral(self):
+        """An outcome that says nothing about the provider: only frees the trial slot."""
+        with self._lock:
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opens += 1
+                    logger.warning("LLM circuit breaker opened after %s failures", self._failures)
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+
+class LLMGovernor:
+    """Wraps LLM calls with concurrency, rate, timeout, retry and breaker control."""
+
+    def __init__(
+        self,
+        max_concurrency=8,
+        rate_per_second=5.0,
+        burst=10,
+        timeout=60.0,
+        max_retries=3,
+        base_delay=0.5,
+        max_delay=8.0,
+        breaker=None,
+    ):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Timed-out calls keep running in their worker; leave headroom for them
+        self._executor = ThreadPoolExecutor(max_concurrency * 2, thread_name_prefix="llm")
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0, "successes": 0, "failures": 0, "retries": 0,
+            "timeouts": 0, "rejected": 0, "degraded": 0,
+            "queue_wait_total": 0.0, "queue_wait_max": 0.0,
+        }
+
+    @classmethod
+    def from_env(cls):
+        """Limits from MIA_LLM_* environment variables."""
+        return cls(
+            max_concurrency=int(os.getenv("MIA_LLM_MAX_CONCURRENCY", "8")),
+            rate_per_second=float(os.getenv("MIA_LLM_RATE_PER_SECOND", "5")),
+            burst=int(os.getenv("MIA_LLM_BURST", "10")),
+            timeout=float(os.getenv("MIA_LLM_TIMEOUT", "60")),
+            max_retries=int(os.getenv("MIA_LLM_MAX_RETRIES", "3")),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("MIA_LLM_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.getenv("MIA_LLM_BREAKER_RESET", "30")),
+            ),
+        )
+
+    # ------------------------------------------------------------------
+    # Metrics
+    # ------------------------------------------------------------------
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+    def _record_wait(self, seconds):
+        with self._lock:
+            self._stats["queue_wait_total"] += seconds
+            self._stats["queue_wait_max"] = max(self._stats["queue_wait_max"], seconds)
+
+    def metrics(self):
+        """Counters, queue wait (ms) and breaker state."""
+        with self._lock:
+            stats = dict(self._stats)
+        calls = stats.pop("calls")
+        wait_total = stats.pop("queue_wait_total")
+        stats.update({
+            "calls": calls,
+            "queue_wait_avg_ms": 1000 * wait_total / calls if calls else 0.0,
+            "queue_wait_max_ms": 1000 * stats.pop("queue_wait_max"),
+            "breaker_state": self.breaker.state,
+            "breaker_opens": self.breaker.opens,
+        })
+        return stats
+
+    # ------------------------------------------------------------------
+    # Calls
+    # ------------------------------------------------------------------
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def _remaining(deadline):
+        """Seconds left before the deadline (None without one)."""
+        return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+    def _acquire(self, deadline=None):
+        """Take a concurrency slot and a rate token; False if the deadline passes first."""
+        start = time.monotonic()
+        if deadline is None:
+            self._slots.acquire()
+        elif start >= deadline or not self._slots.acquire(timeout=self._remaining(deadline)):
+            self._record_wait(time.monotonic() - start)
+            return False
+        if self.bucket.acquire(timeout=self._remaining(deadline)) is None:
+            self._slots.release()
+            self._record_wait(time.monotonic() - start)
+            return False
+        self._record_wait(time.monotonic() - start)
+        return True
+
+    def _wait_for_retry(self, attempt, deadline):
+        """Backoff and rate token before a retry, both capped by the deadline; False if no time is left."""
+        if deadline is None:
+            time.sleep(self._backoff(attempt))
+            self.bucket.acquire()
+            return True
+        time.sleep(min(self._backoff(attempt), self._remaining(deadline)))
+        # An attempt that starts with no time left is a wasted provider call
+        return self._remaining(deadline) > 0 and self.bucket.acquire(timeout=self._remaining(deadline)) is not None
+
+    def _attempt_timeout(self, deadline):
+        """Timeout for the next attempt and whether the deadline is what limits it."""
+        if deadline is None:
+            return self.timeout, False
+        remaining = max(0.0, deadline - time.monotonic())
+        return min(self.timeout, remaining), remaining < self.timeout
+
+    def _can_retry(self, attempt, error, deadline):
+        if attempt == self.max_retries or not is_retryable(error):
+            return False
+        return deadline is None or time.monotonic() < deadline
+
+    def _record_outcome(self, error, cut_by_deadline):
+        """Breaker bookkeeping for a failed call: only provider errors count."""
+        # Running out of the caller's budget says nothing about the provider
+        if not cut_by_deadline and is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_neutral()
+
+    def _degrade(self, error, fallback):
+        if fallback is None:
+            raise error
+        self._count("degraded")
+        return fallback()
+
+    def call(self, fn, *args, fallback=None, deadline=None, **kwargs):
+        """
+        Run fn(*args, **kwargs) under the governor.
+
+        If the breaker is open or every attempt fails, returns fallback()
+        when given, otherwise raises the last error (CircuitOpenError when
+        the call was rejected). `deadline` is a time.monotonic() value: no
+        attempt, queue wait or backoff runs past it.
+        """
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("rejected")
+            return self._degrade(CircuitOpenError("LLM circuit breaker is open"), fallback)
+
+        if not self._acquire(deadline):
+            # Free the half-open trial this call may hold: it never reached the provider
+            self.breaker.record_neutral()
+            self._count("timeouts")
+            return self._degrade(LLMTimeoutError("Deadline passed waiting for an LLM slot"), fallback)
+        try:
+            for attempt in range(self.max_retries + 1):
+                timeout, cut_by_deadline = self._attempt_timeout(deadline)
+                future = self._executor.submit(fn, *args, **kwargs)
+                try:
+                    result = future.result(timeout=timeout)
+                except FutureTimeout:
+                    self._count("timeouts")
+                    error = LLMTimeoutError(f"LLM call exceeded {timeout:g}s")
+                except Exception as e:
+                    cut_by_deadline = False
+                    error = e
+                else:
+                    self.breaker.record_success()
+                    self._count("successes")
+                    return result
+                if not self._can_retry(attempt, error, deadline):
+                    break
+                if not self._wait_for_retry(attempt, deadline):
+                    break
+                self._count("retries")
+        finally:
+            self._slots.release()
+
+        self._record_outcome(error, cut_by_deadline)
+        self._count("failures")
+        logger.warning("LLM call failed: %s", error)
+        return self._degrade(error, fallback)
+
+    def stream(self, fn, *args, fallback=None, deadline=None, **kwargs):
+        """
+        Governed version of a streaming call (fn returns an iterator).
+
+        Retries only happen before the first chunk; after that an error is
+        raised to the consumer. Each chunk must arrive within the timeout.
+        With the breaker open, yields fallback() as a single chunk.
+        `deadline` bounds the wait for the first chunk; once the answer is
+        flowing it is allowed to finish.
+        """
+        self._count("calls")
+        if not self.breaker.allow():
+            self._count("rejected")
+            yield self._degrade(CircuitOpenError("LLM circuit breaker is open"), fallback)
+            return
+
+        if not self._acquire(deadline):
+            # Free the half-open trial this call may hold: it never reached the provider
+            self.breaker.record_neutral()
+            self._count("timeouts")
+            yield self._degrade(LLMTimeoutError("Deadline passed waiting for an LLM slot"), fallback)
+            return
+        try:
+            for attempt in range(self.max_retries + 1):
+                started = False
+                first_timeout, cut_by_deadline = self._attempt_timeout(deadline)
+                try:
+                    for chunk in self._iter_with_timeout(fn(*args, **kwargs), first_timeout):
+                        started = True
+                        yield chunk
+                except Exception as e:
+                    if isinstance(e, FutureTimeout):
+                        self._count("timeouts")
+                        stalled = self.timeout if started else first_timeout
+                        e = LLMTimeoutError(f"LLM stream stalled for {stalled:g}s")
+                    cut_by_deadline = cut_by_deadline and not started and isinstance(e, LLMTimeoutError)
+                    error = e
+                    if started or not self._can_retry(attempt, error, deadline):
+                        break
+                    if not self._wait_for_retry(attempt, deadline):
+                        break
+                    self._count("retries")
+                else:
+                    self.breaker.record_success()
+                    self._count("successes")
+                    return
+        finally:
+            self._slots.release()
+
+        self._record_outcome(error, cut_by_deadline)
+        self._count("failures")
+        logger.warning("LLM stream failed: %s", error)
+        if started:
+            raise error
+        yield self._degrade(error, fallback)
+
+    def _iter_with_timeout(self, iterator, first_timeout=None):
+        """Re-yield chunks from a worker thread, failing if one takes too long."""
+        chunks = queue.Queue()
+        done = object()
+
+        def pump():
+            try:
+                for chunk in iterator:
+                    chunks.put((chunk, None))
+                chunks.put((done, None))
+            except Exception as e:
+                chunks.put((None, e))
+
+        self._executor.submit(pump)
+        timeout = self.timeout if first_timeout is None else first_timeout
+        while True:
+            try:
+                chunk, error = chunks.get(timeout=timeout)
+            except queue.Empty:
+                raise FutureTimeout()
+            if error is not None:
+                raise error
+            if chunk is done:
+                return
+            timeout = self.timeout
+            yield chunk
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Registry of chat model providers, selected with MIA_LLM_PROVIDER.
+
+- gemini   Google Gemini (default; needs GOOGLE_API_KEY)
+- fake     deterministic local model for load tests and offline runs
+- openai   any OpenAI-compatible HTTP endpoint (vLLM, llama.cpp server,
+           Ollama...) at MIA_LLM_BASE_URL; needs langchain-openai
+
+New providers register a factory with @register_provider("name").
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+PROVIDERS: Dict[str, Callable[[], BaseChatModel]] = {}
+DEFAULT_PROVIDER = "gemini"
+LLM_TIMEOUT = float(os.getenv("MIA_LLM_TIMEOUT", "60"))
+
+
+def register_provider(name):
+    """Decorator registering a zero-argument factory that returns a chat model."""
+    def decorator(factory):
+        PROVIDERS[name] = factory
+        return factory
+    return decorator
+
+
+def create_llm(name=None):
+    """Build the chat model of the configured provider."""
+    name = name or os.getenv("MIA_LLM_PROVIDER", DEFAULT_PROVIDER)
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown LLM provider '{name}'. Available: {', '.join(sorted(PROVIDERS))}")
+    return PROVIDERS[name]()
+
+
+# ==============================================================================
+# Deterministic local model
+# ==============================================================================
+APPOINTMENT_WORDS = ("turno", "cita", "agendar", "reservar")
+COMPLEX_CASE_WORDS = ("queja", "reclamo", "denuncia", "emergencia", "urgente", "demanda")
+FILLER_WORDS = (
+    "el", "trámite", "requiere", "presentar", "documento", "de", "identidad",
+    "en", "la", "mesa", "entradas", "del", "municipio", "con", "turno", "previo",
+)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Deterministic chat model: the same input always gives the same output.
+
+    Waits `latency_ms` before the first token and then emits
+    `tokens_per_second`. Classifier prompts (they ask for the JSON schema)
+    get a valid intent JSON chosen with keyword rules; any other prompt
+    gets an answer of `answer_tokens` words derived from the input hash.
+    """
+
+    latency_ms: float = 200.0
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "mia-fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {
+            "latency_ms": self.latency_ms,
+            "tokens_per_second": self.tokens_per_second,
+            "answer_tokens": self.answer_tokens,
+        }
+
+    @staticmethod
+    def _last_human_text(messages: List[BaseMessage]) -> str:
+        for message in reversed(messages):
+            if message.type == "human":
+                return message.content if isinstance(message.content, str) else str(message.content)
+        return ""
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        text = self._last_human_text(messages)
+        if "Consulta del Ciudadano:" in text:
+            return [self._classify(text.rsplit("Consulta del Ciudadano:", 1)[1].strip())]
+        rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+        return [rng.choice(FILLER_WORDS) + " " for _ in range(self.answer_tokens)]
+
+    @staticmethod
+    def _classify(query: str) -> str:
+        lowered = query.lower()
+        if any(word in lowered for word in APPOINTMENT_WORDS):
+            case_type = "APPOINTMENT"
+        elif any(word in lowered for word in COMPLEX_CASE_WORDS):
+            case_type = "COMPLEX_CASE"
+        else:
+            case_type = "SIMPLE_INFO"
+        procedure = re.sub(r"[¿?¡!.]", "", query).strip()[:80] or "Información general"
+        return json.dumps({"case_type": case_type, "procedure_name": procedure}, ensure_ascii=False)
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency_ms / 1000)
+        delay = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        for i, token in enumerate(self._tokens(messages)):
+            if i and delay:
+                time.sleep(delay)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        text = "".join(chunk.message.content for chunk in self._stream(messages, stop, run_manager))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+
+# ==============================================================================
+# Providers
+# ==============================================================================
+@register_provider("gemini")
+def gemini():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
+
+    return ChatGoogleGenerativeAI(
+        model=os.getenv("MIA_LLM_MODEL", "gemini-2.5-flash"),
+        api_key=os.getenv("GOOGLE_API_KEY"),
+        temperature=0,
+        streaming=True,
+        callbacks=[StreamingStdOutCallbackHandler()],
+        # Retries, timeouts and rate limits are handled by the governor
+        max_retries=1,
+        timeout=LLM_TIMEOUT,
+    )
+
+
+@register_provider("fake")
+def fake():
+    return FakeChatModel(
+        latency_ms=float(os.getenv("MIA_FAKE_LATENCY_MS", "200")),
+        tokens_per_second=float(os.getenv("MIA_FAKE_TOKENS_PER_SECOND", "50")),
+        answer_tokens=int(os.getenv("MIA_FAKE_ANSWER_TOKENS", "60")),
+    )
+
+
+@register_provider("openai")
+def openai_compatible():
+    try:
+        from langchain_openai import ChatOpenAI
+    except ImportError as e:
+        raise ImportError("MIA_LLM_PROVIDER=openai needs the langchain-openai package") from e
+
+    return ChatOpenAI(
+        base_url=os.getenv("MIA_LLM_BASE_URL", "http://127.0.0.1:8000/v1"),
+        api_key=os.getenv("MIA_LLM_API_KEY", "not-needed"),
+        model=os.getenv("MIA_LLM_MODEL", "local-model"),
+        temperature=0,
+        streaming=True,
+        max_retries=1,
+        timeout=LLM_TIMEOUT,
+    )
@@ -1,4 +1,6 @@
 #!/usr/bin/env python3
+import threading
+
 from langchain.memory import ConversationBufferMemory
 from langchain_core.messages import SystemMessage
 from langchain_core.prompts import (
@@ -8,25 +10,51 @@ from langchain_core.prompts import (
 )
 
 from prompt_template import Prompt_template
+from tenants import DEFAULT_TENANT
 
 
-prompt = ChatPromptTemplate.from_messages(
-    [
-        SystemMessage(
-            content=Prompt_template
-        ),  # The persistent system prompt
-        MessagesPlaceholder(
-            variable_name="chat_history"
-        ),  # Where the memory will be stored.
-        HumanMessagePromptTemplate.from_template(
-            "{human_input}"
-        ),  # Where the human input will be injected
-    ]
-)
+def build_prompt(persona=""):
+    """Chat prompt; a tenant's persona is appended to the system prompt."""
+    system_prompt = f"{Prompt_template}\n\n{persona}" if persona else Prompt_template
+    return ChatPromptTemplate.from_messages(
+        [
+            SystemMessage(
+                content=system_prompt
+            ),  # The persistent system prompt
+            MessagesPlaceholder(
+                variable_name="chat_history"
+            ),  # Where the memory will be stored.
+            HumanMessagePromptTemplate.from_template(
+                "{human_input}"
+            ),  # Where the human input will be injected
+        ]
+    )
+
+
+prompt = build_prompt()
 
 
 # Memory for conversation history
 memory = ConversationBufferMemory(
     memory_key="chat_history",
     return_messages=True
-    )
\ No newline at end of file
+    )
+
+
+# Conversation history of every other tenant, never mixed with the default one
+_tenant_memories = {}
+_tenant_memories_lock = threading.Lock()
+
+
+def memory_for(tenant_id=DEFAULT_TENANT):
+    """Conversation memory of the tenant (the shared `memory` for the default one)."""
+    if not tenant_id or tenant_id == DEFAULT_TENANT:
+        return memory
+    with _tenant_memories_lock:
+        tenant_memory = _tenant_memories.get(tenant_id)
+        if tenant_memory is None:
+            tenant_memory = _tenant_memories[tenant_id] = ConversationBufferMemory(
+                memory_key="chat_history",
+                return_messages=True
+            )
+        return tenant_memory
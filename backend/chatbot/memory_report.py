@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Where the memory of an app process goes.
+
+rss_breakdown() splits the resident set (Linux /proc/self/smaps) into:
+- model:          parameters of an embedding model loaded in this process
+                  (0 when the shared embedding server holds it)
+- index:          resident pages of the memory-mapped index.faiss, or the
+                  vectors in the heap if the index was fully loaded
+- docstore:       resident pages of docstore.sqlite plus the decoded-chunk LRU
+- session_state:  Streamlit session states (or any mapping passed in)
+- python_heap:    traced allocations, when tracemalloc is running
+- other:          the rest (interpreter, libraries, torch/BLAS arenas...)
+
+The CLI imports chain.py under tracemalloc and prints the breakdown and
+the top allocations grouped by package:
+    python backend/chatbot/memory_report.py --top 15
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+from collections import defaultdict
+
+from index_rss_report import memory_kib
+from shared_index import DOCSTORE_FILE, INDEX_FILE
+
+MIB = 1024 * 1024
+
+
+def mapped_kib():
+    """Resident KiB per mapped file path (anonymous mappings under "")."""
+    resident = defaultdict(int)
+    path = ""
+    try:
+        with open("/proc/self/smaps") as f:
+            for line in f:
+                parts = line.split()
+                if not parts:
+                    continue
+                if "-" in parts[0] and not parts[0].endswith(":"):
+                    path = " ".join(parts[5:])
+                elif parts[0] == "Rss:":
+                    resident[path] += int(parts[1])
+    except OSError:
+        pass
+    return resident
+
+
+def model_bytes(embeddings):
+    """Size of the parameters of an in-process sentence-transformers model."""
+    embeddings = getattr(embeddings, "inner", embeddings)  # CachedEmbeddings
+    for holder in (embeddings, getattr(embeddings, "_fallback", None)):
+        client = getattr(holder, "client", None)
+        if client is not None and hasattr(client, "parameters"):
+            return sum(p.numel() * p.element_size() for p in client.parameters())
+    return 0
+
+
+def deep_sizeof(obj, _seen=None):
+    """Approximate size of an object graph (containers and their contents)."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj, 0)
+    if callable(getattr(obj, "items", None)):
+        try:
+            items = list(obj.items())
+        except Exception:
+            items = []
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in items)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    return size
+
+
+def rss_breakdown(docsearch=None, embeddings=None, session_states=()):
+    """Memory of this process in MiB by component (see module docstring)."""
+    rss_kib, pss_kib = memory_kib()
+    mapped = mapped_kib()
+
+    def resident_mib(name):
+        return sum(kib for path, kib in mapped.items() if os.path.basename(path) == name) / 1024
+
+    index_mib = resident_mib(INDEX_FILE)
+    index = getattr(docsearch, "index", None)
+    if not index_mib and index is not None:
+        # Not memory-mapped: the vectors live in the heap
+        index_mib = index.ntotal * index.d * 4 / MIB
+    docstore_mib = resident_mib(DOCSTORE_FILE)
+    cache_stats = getattr(getattr(docsearch, "docstore", None), "cache_stats", None)
+    if cache_stats is not None:
+        docstore_mib += cache_stats()["docstore_cache_bytes"] / MIB
+
+    report = {
+        "rss_mb": rss_kib / 1024,
+        "pss_mb": pss_kib / 1024,
+        "model_mb": model_bytes(embeddings) / MIB,
+        "index_mb": index_mib,
+        "docstore_mb": docstore_mib,
+        "session_state_mb": sum(deep_sizeof(dict(state)) for state in session_states) / MIB,
+        "sessions": len(session_states),
+    }
+    if tracemalloc.is_tracing():
+        report["python_heap_mb"] = tracemalloc.get_traced_memory()[0] / MIB
+    known = sum(report[key] for key in ("model_mb", "index_mb", "docstore_mb", "session_state_mb"))
+    report["other_mb"] = max(report["rss_mb"] - known, 0.0)
+    return report
+
+
+def top_packages(snapshot, limit=10):
+    """(package, MiB) of the traced allocations, largest first."""
+    sizes = defaultdict(int)
+    for stat in snapshot.statistics("filename"):
+        path = stat.traceback[0].filename
+        marker = "site-packages" + os.sep
+        if marker in path:
+            package = path.split(marker, 1)[1].split(os.sep, 1)[0]
+        else:
+            package = os.path.basename(path)
+        sizes[package] += stat.size
+    return [(name, size / MIB) for name, size in sorted(sizes.items(), key=lambda item: -item[1])[:limit]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory breakdown of an app process")
+    parser.add_argument("--top", type=int, default=10, help="packages to list by traced allocations")
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    from chain import docsearch
+    from vector_db import embeddings
+
+    for key, value in rss_breakdown(docsearch, embeddings).items():
+        print(f"{key:<18} {value:10.1f}" if isinstance(value, float) else f"{key:<18} {value:>10}")
+    print()
+    for package, mib in top_packages(tracemalloc.take_snapshot(), args.top):
+        print(f"{package:<40} {mib:8.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Persisted FAISS index shared by every app process on a host.
+
+The index is written once to disk and opened with FAISS memory-mapping
+(read-only mmap IO flags), and chunk texts live in a SQLite docstore read
+through mmap instead of a pickled in-memory dict. N workers then share one
+physical copy of those pages through the OS page cache.
+
+Chunk texts are stored once, zlib-compressed, in the docstore; readers
+keep only a small LRU of decoded chunks (MIA_DOCSTORE_CACHE_CHUNKS), so
+after startup the corpus is not held in the Python heap at all.
+
+Layout of the index directory:
+- versions/<id>/index.faiss      FAISS index (vector i <-> chunk id i)
+- versions/<id>/docstore.sqlite  chunk texts, metadata and the corpus fingerprint
+- current                        symlink to the version in use
+
+A rebuild writes a new version and then repoints `current` with one
+rename, so the index and the docstore are always swapped together. A
+process keeps reading the version it opened (its mmap and docstore
+connections never see the new files) until it loads the index again.
+Readers hold a shared lock on the version's .readers file, and a rebuild
+only removes old versions nobody holds (keeping the newest KEEP_VERSIONS).
+"""
+import fcntl
+import gc
+import hashlib
+import json
+import os
+import sqlite3
+import shutil
+import sys
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from collections.abc import Mapping
+from datetime import datetime
+
+import faiss
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+INDEX_DIR = os.getenv(
+    "MIA_INDEX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "doc", "index"),
+)
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+CURRENT_LINK = "current"
+VERSIONS_DIR = "versions"
+READERS_FILE = ".readers"
+# Versions always left on disk after a rebuild (the new one included)
+KEEP_VERSIONS = 2
+
+# Bytes of the docstore SQLite reads through mmap (shared page cache)
+DOCSTORE_MMAP_SIZE = 256 * 1024 * 1024
+# Decoded chunks kept per process (retrieval reads the same few chunks often)
+DOCSTORE_CACHE_CHUNKS = int(os.getenv("MIA_DOCSTORE_CACHE_CHUNKS", "256"))
+
+# Read-only mmap. IO_FLAG_MMAP_IFC (FAISS >= 1.11) also maps the codes of
+# flat indexes such as IndexFlatL2; without it every worker copies them.
+MMAP_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | faiss.IO_FLAG_MMAP_IFC
+
+
+def corpus_fingerprint(documents):
+    """Hash of the corpus contents; a new value means the index is stale."""
+    digest = hashlib.sha256()
+    for doc in documents:
+        digest.update(doc.page_content.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class PositionalIds(Mapping):
+    """index_to_docstore_id without a dict: FAISS position i -> chunk id "i"."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def __getitem__(self, position):
+        if not 0 <= position < self.size:
+            raise KeyError(position)
+        return str(position)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(range(self.size))
+
+
+class SQLiteDocstore(Docstore):
+    """
+    Read-only docstore backed by SQLite (one connection per thread), with
+    an LRU of decoded chunks. Texts written by older builds (not
+    compressed) are read as they are.
+    """
+
+    def __init__(self, path, cache_size=DOCSTORE_CACHE_CHUNKS):
+        self.path = path
+        self.cache_size = cache_size
+        self._local = threading.local()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.hits = self.misses = 0
+        # Lock file of the index version being read (see load_shared_faiss)
+        self.pin = None
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                f"file:{self.path}?mode=ro&immutable=1", uri=True, check_same_thread=False
+            )
+            conn.execute(f"PRAGMA mmap_size={DOCSTORE_MMAP_SIZE}")
+            self._local.conn = conn
+        return conn
+
+    def search(self, search):
+        key = int(search)
+        with self._cache_lock:
+            chunk = self._cache.get(key)
+            if chunk is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+        if chunk is None:
+            row = self._conn().execute(
+                "SELECT text, metadata FROM chunks WHERE id = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return f"ID {search} not found."
+            text = zlib.decompress(row[0]).decode("utf-8") if isinstance(row[0], bytes) else row[0]
+            chunk = (text, row[1])
+            with self._cache_lock:
+                self.misses += 1
+                self._cache[key] = chunk
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        # A new Document each time: callers may modify it
+        return Document(page_content=chunk[0], metadata=json.loads(chunk[1] or "{}"))
+
+    def cache_stats(self):
+        """Decoded-chunk LRU: entries, approximate bytes and hit rate."""
+        with self._cache_lock:
+            size = sum(sys.getsizeof(text) + sys.getsizeof(meta or "") for text, meta in self._cache.values())
+            lookups = self.hits + self.misses
+            return {
+                "docstore_cache_chunks": len(self._cache),
+                "docstore_cache_bytes": size,
+                "docstore_cache_hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def get_meta(self, key):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+
+def write_docstore(path, documents, fingerprint):
+    """Write compressed chunk texts (id = FAISS position) and the corpus fingerprint."""
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE chunks (id INTEGER PRIMARY KEY, text BLOB NOT NULL, metadata TEXT)")
+    conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.executemany(
+        "INSERT INTO chunks (id, text, metadata) VALUES (?, ?, ?)",
+        (
+            (i, zlib.compress(doc.page_content.encode("utf-8")), json.dumps(doc.metadata, ensure_ascii=False))
+            for i, doc in enumerate(documents)
+        ),
+    )
+    conn.execute("INSERT INTO meta (key, value) VALUES ('fingerprint', ?)", (fingerprint,))
+    conn.commit()
+    conn.close()
+
+
+def version_dir(index_dir=INDEX_DIR):
+    """Directory holding the index files in use: the target of `current`,
+    or index_dir itself for a directory written before versioning."""
+    current = os.path.join(index_dir, CURRENT_LINK)
+    return os.path.realpath(current) if os.path.islink(current) else index_dir
+
+
+def _publish(index_dir, new_version):
+    """Point `current` at a fully written version (atomic rename of a symlink)."""
+    link_tmp = os.path.join(index_dir, CURRENT_LINK + ".tmp")
+    if os.path.lexists(link_tmp):
+        os.remove(link_tmp)
+    os.symlink(os.path.relpath(new_version, index_dir), link_tmp)
+    os.replace(link_tmp, os.path.join(index_dir, CURRENT_LINK))
+
+
+def _pin_version(directory):
+    """Shared lock that keeps a version on disk while this process reads it."""
+    path = os.path.join(directory, READERS_FILE)
+    if not os.path.exists(path):
+        return None
+    pin = open(path)
+    fcntl.flock(pin, fcntl.LOCK_SH)
+    return pin
+
+
+def _prune_versions(index_dir, keep=KEEP_VERSIONS):
+    """Remove the versions older than the newest `keep` that no process reads."""
+    versions = os.path.join(index_dir, VERSIONS_DIR)
+    current = version_dir(index_dir)
+    # Version names start with their build time, so they sort chronologically
+    for name in sorted(os.listdir(versions))[:-keep]:
+        path = os.path.join(versions, name)
+        if os.path.realpath(path) == current:
+            continue
+        try:
+            with open(os.path.join(path, READERS_FILE)) as pin:
+                fcntl.flock(pin, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                shutil.rmtree(path, ignore_errors=True)
+        except BlockingIOError:
+            continue  # Still open in some process
+        except FileNotFoundError:
+            shutil.rmtree(path, ignore_errors=True)  # Left half-written by a failed build
+
+
+def build_persistent_index(documents, embeddings, index_dir=INDEX_DIR, fingerprint=None):
+    """
+    Embed the documents and publish index + docstore as a new version.
+
+    Both files are written to a fresh version directory and `current` is
+    switched to it afterwards, so readers never pair an index with the
+    docstore of another build.
+    """
+    fingerprint = fingerprint or corpus_fingerprint(documents)
+    store = FAISS.from_documents(documents, embeddings)
+
+    versions = os.path.join(index_dir, VERSIONS_DIR)
+    os.makedirs(versions, exist_ok=True)
+    new_version = tempfile.mkdtemp(prefix=datetime.now().strftime("%Y%m%d-%H%M%S-%f-"), dir=versions)
+    os.chmod(new_version, 0o755)
+    faiss.write_index(store.index, os.path.join(new_version, INDEX_FILE))
+    write_docstore(os.path.join(new_version, DOCSTORE_FILE), documents, fingerprint)
+    open(os.path.join(new_version, READERS_FILE), "w").close()
+    # The in-memory store (vectors + InMemoryDocstore) is only needed to write the files
+    del store
+    _publish(index_dir, new_version)
+    _prune_versions(index_dir)
+    return fingerprint
+
+
+def load_shared_faiss(embeddings, index_dir=INDEX_DIR, mmap=True):
+    """Open the persisted index (memory-mapped by default) as a FAISS vector store."""
+    flags = MMAP_FLAGS if mmap else 0
+    # Resolved once: index and docstore come from the same version
+    directory = version_dir(index_dir)
+    index = faiss.read_index(os.path.join(directory, INDEX_FILE), flags)
+    docstore = SQLiteDocstore(os.path.join(directory, DOCSTORE_FILE))
+    docstore.pin = _pin_version(directory)
+    return FAISS(
+        embedding_function=embeddings,
+        index=index,
+        docstore=docstore,
+        index_to_docstore_id=PositionalIds(index.ntotal),
+    )
+
+
+def index_fingerprint(index_dir=INDEX_DIR):
+    """Fingerprint of the persisted index, or None if there is none."""
+    directory = version_dir(index_dir)
+    path = os.path.join(directory, DOCSTORE_FILE)
+    if not os.path.exists(path) or not os.path.exists(os.path.join(directory, INDEX_FILE)):
+        return None
+    try:
+        return SQLiteDocstore(path).get_meta("fingerprint")
+    except sqlite3.Error:
+        return None
+
+
+def load_or_build_index(documents, embeddings, index_dir=INDEX_DIR, fingerprint=None):
+    """
+    Load the shared index, rebuilding it first if it is missing or was
+    built from a different corpus. A file lock makes sure only one of the
+    processes starting at the same time does the embedding work.
+
+    With a `fingerprint` (e.g. of the source files, see ingestion.py)
+    `documents` may be a callable: the corpus is then only loaded when the
+    index has to be rebuilt, and dropped right after.
+    """
+    if fingerprint is None:
+        fingerprint = corpus_fingerprint(documents)
+    if index_fingerprint(index_dir) != fingerprint:
+        os.makedirs(index_dir, exist_ok=True)
+        with open(os.path.join(index_dir, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            # Another process may have rebuilt it while we waited
+            if index_fingerprint(index_dir) != fingerprint:
+                corpus = documents() if callable(documents) else documents
+                build_persistent_index(corpus, embeddings, index_dir, fingerprint)
+                del corpus
+                # PDF parsing leaves reference cycles behind; free them now
+                gc.collect()
+    return load_shared_faiss(embeddings, index_dir)
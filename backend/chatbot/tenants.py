@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Per-municipality backends: document index, prompt persona and calendar.
+
+Tenants are listed in doc/tenants.json (MIA_TENANTS_FILE):
+
+    {"tenants": [
+        {"id": "villa-norte", "name": "Municipalidad de Villa Norte",
+         "documents": ["doc/raw_data/villa_norte.pdf"],
+         "persona": "Respondé con el tono cercano del municipio de Villa Norte.",
+         "office": "Mesa de entradas Villa Norte"}
+    ]}
+
+The "default" tenant always exists: the corpus, index and prompt chain.py
+loads at import. It stays resident and is not part of the cache below.
+Document paths are relative to this directory. Every other tenant's index
+lives in INDEX_DIR/tenants/<id> and is built the first time it is needed
+(or when its files change), or ahead of time with:
+    python backend/chatbot/tenants.py --build villa-norte
+
+Those indexes are opened on the first request for the tenant and kept in
+an LRU cache bounded by MIA_TENANT_MEMORY_MB (index + docstore size on
+disk, which is what a warm tenant keeps in the page cache). Loading a
+tenant evicts the least recently used ones until the budget fits again;
+the tenant being loaded is never evicted, even if it alone exceeds the
+budget. stats() reports cold-load and warm-hit latency per tenant.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from ingestion import CORPUS_FILES, DEDUP_REPORT, load_documents, load_or_build_corpus_index, source_fingerprint
+from shared_index import INDEX_DIR, INDEX_FILE, DOCSTORE_FILE, build_persistent_index, version_dir
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TENANTS_FILE = os.getenv("MIA_TENANTS_FILE", os.path.join(BASE_DIR, "doc", "tenants.json"))
+DEFAULT_TENANT = "default"
+MEMORY_BUDGET_BYTES = int(float(os.getenv("MIA_TENANT_MEMORY_MB", "1024")) * 1024 * 1024)
+
+
+@dataclass
+class Tenant:
+    id: str
+    name: str = ""
+    documents: List[str] = field(default_factory=list)
+    persona: str = ""
+    office: Optional[str] = None
+
+    @property
+    def index_dir(self):
+        if self.id == DEFAULT_TENANT:
+            return INDEX_DIR
+        return os.path.join(INDEX_DIR, "tenants", self.id)
+
+
+def load_tenants(path=TENANTS_FILE):
+    """Configured tenants by id; the default tenant is always present."""
+    tenants = {DEFAULT_TENANT: Tenant(DEFAULT_TENANT)}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for entry in json.load(f).get("tenants", []):
+                tenants[entry["id"]] = Tenant(**entry)
+    return tenants
+
+
+def tenant_files(tenant):
+    """Source files of the tenant's corpus (the default corpus for the default tenant)."""
+    return tenant.documents if tenant.id != DEFAULT_TENANT else CORPUS_FILES
+
+
+def index_bytes(index_dir):
+    """Size of a persisted index (FAISS file + docstore), 0 if missing."""
+    total = 0
+    for name in (INDEX_FILE, DOCSTORE_FILE):
+        path = os.path.join(version_dir(index_dir), name)
+        if os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+
+class TenantBackend:
+    """What a loaded tenant holds: its config and its memory-mapped vector store."""
+
+    def __init__(self, tenant, docsearch, memory_bytes):
+        self.tenant = tenant
+        self.docsearch = docsearch
+        self.memory_bytes = memory_bytes
+
+
+def load_tenant_backend(tenant, embeddings):
+    """Open the tenant's index (memory-mapped), building it first if it is missing or stale."""
+    docsearch = load_or_build_corpus_index(embeddings, tenant_files(tenant), tenant.index_dir)
+    return TenantBackend(tenant, docsearch, index_bytes(tenant.index_dir))
+
+
+class _TenantStats:
+    __slots__ = ("loads", "load_ms", "hits", "hit_ms", "evictions")
+
+    def __init__(self):
+        self.loads = self.hits = self.evictions = 0
+        self.load_ms = self.hit_ms = 0.0
+
+
+class TenantCache:
+    """LRU of loaded tenant backends bounded by a memory budget."""
+
+    def __init__(self, loader, budget_bytes=MEMORY_BUDGET_BYTES):
+        self.loader = loader
+        self.budget_bytes = budget_bytes
+        self._backends = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._stats = {}
+
+    def _stat(self, tenant_id):
+        stat = self._stats.get(tenant_id)
+        if stat is None:
+            stat = self._stats[tenant_id] = _TenantStats()
+        return stat
+
+    def get(self, tenant_id):
+        """Backend of the tenant, loading it (and evicting cold tenants) on a miss."""
+        started = time.perf_counter()
+        with self._lock:
+            backend = self._backends.get(tenant_id)
+            if backend is not None:
+                self._backends.move_to_end(tenant_id)
+                stat = self._stat(tenant_id)
+                stat.hits += 1
+                stat.hit_ms += (time.perf_counter() - started) * 1000
+                return backend
+            load_lock = self._load_locks.setdefault(tenant_id, threading.Lock())
+
+        # One load per tenant at a time; other tenants keep being served
+        with load_lock:
+            with self._lock:
+                backend = self._backends.get(tenant_id)
+            if backend is None:
+                backend = self.loader(tenant_id)
+                with self._lock:
+                    self._backends[tenant_id] = backend
+                    stat = self._stat(tenant_id)
+                    stat.loads += 1
+                    stat.load_ms += (time.perf_counter() - started) * 1000
+                    self._evict(keep=tenant_id)
+        return backend
+
+    def _evict(self, keep):
+        used = sum(backend.memory_bytes for backend in self._backends.values())
+        for tenant_id in list(self._backends):
+            if used <= self.budget_bytes:
+                break
+            if tenant_id == keep:
+                continue
+            used -= self._backends.pop(tenant_id).memory_bytes
+            self._stat(tenant_id).evictions += 1
+
+    def evict(self, tenant_id):
+        with self._lock:
+            if self._backends.pop(tenant_id, None) is not None:
+                self._stat(tenant_id).evictions += 1
+
+    def resident(self):
+        with self._lock:
+            return list(self._backends)
+
+    def stats(self):
+        """Per tenant: loads, cold-load and warm-hit latency, evictions and resident size."""
+        with self._lock:
+            rows = []
+            for tenant_id, stat in sorted(self._stats.items()):
+                backend = self._backends.get(tenant_id)
+                rows.append({
+                    "tenant": tenant_id,
+                    "resident": backend is not None,
+                    "memory_mb": backend.memory_bytes / 2**20 if backend else 0.0,
+                    "cold_loads": stat.loads,
+                    "cold_load_avg_ms": stat.load_ms / stat.loads if stat.loads else 0.0,
+                    "warm_hits": stat.hits,
+                    "warm_hit_avg_ms": stat.hit_ms / stat.hits if stat.hits else 0.0,
+                    "evictions": stat.evictions,
+                })
+            return rows
+
+
+class TenantDocsearch:
+    """
+    Stand-in for a tenant's FAISS store that resolves it through the cache
+    on every use, so callers can hold it while the index is evicted and
+    reloaded underneath.
+    """
+
+    def __init__(self, cache, tenant_id):
+        self._cache = cache
+        self._tenant_id = tenant_id
+
+    def __getattr__(self, name):
+        return getattr(self._cache.get(self._tenant_id).docsearch, name)
+
+
+# ==============================================================================
+# Process-wide registry
+# ==============================================================================
+tenants = load_tenants()
+
+
+def _load(tenant_id):
+    from vector_db import embeddings
+
+    if tenant_id not in tenants:
+        raise KeyError(f"Unknown tenant '{tenant_id}'")
+    return load_tenant_backend(tenants[tenant_id], embeddings)
+
+
+tenant_cache = TenantCache(_load)
+
+
+def get_tenant(tenant_id):
+    if tenant_id not in tenants:
+        raise KeyError(f"Unknown tenant '{tenant_id}'")
+    return tenants[tenant_id]
+
+
+def tenant_docsearch(tenant_id):
+    get_tenant(tenant_id)
+    return TenantDocsearch(tenant_cache, tenant_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-municipality indexes")
+    parser.add_argument("--build", nargs="*", metavar="TENANT", help="(re)build these tenants' indexes (all if empty)")
+    parser.add_argument("--list", action="store_true", help="show tenants and index sizes")
+    args = parser.parse_args()
+
+    if args.build is not None:
+        from vector_db import embeddings
+
+        for tenant_id in args.build or list(tenants):
+            tenant = get_tenant(tenant_id)
+            started = time.perf_counter()
+            files = tenant_files(tenant)
+            documents = load_documents(files, report_path=os.path.join(tenant.index_dir, DEDUP_REPORT))
+            build_persistent_index(documents, embeddings, tenant.index_dir, source_fingerprint(files))
+            print(f"{tenant_id}: {len(documents)} chunks in {time.perf_counter() - started:.1f}s")
+    if args.list or args.build is None:
+        for tenant in tenants.values():
+            print(f"{tenant.id:<20} {index_bytes(tenant.index_dir) / 2**20:8.1f} MiB  {tenant.name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 from langchain.text_splitter import CharacterTextSplitter
+from langchain_core.documents import Document
 
 
 def text_splitter(
@@ -46,3 +47,30 @@ def text_splitter(
 
     return texts
 
+
+def split_documents(
+        documents,
+        separator=" ",
+        chunk_size=1000,
+        chunk_overlap=200,
+        is_separator_regex=False):
+    """
+        Splits each document on its own, so every chunk keeps the
+        metadata of its page (plus its position in the page).
+
+        Parameters: as in `text_splitter`; `documents` may be a
+        generator, chunks are yielded as the pages arrive.
+
+        Yields:
+        - Document: one per chunk, with metadata["chunk"] set.
+    """
+    splitter = CharacterTextSplitter(
+        separator=separator,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+        is_separator_regex=is_separator_regex,
+    )
+    for doc in documents:
+        for i, text in enumerate(splitter.split_text(doc.page_content)):
+            yield Document(page_content=text, metadata={**doc.metadata, "chunk": i})
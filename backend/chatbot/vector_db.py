@@ -1,22 +1,156 @@
 #!/usr/bin/env python3
-from langchain_community.document_loaders import TextLoader, PyPDFLoader
+import os
+import socket
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+import faiss
+import numpy as np
 from langchain_community.vectorstores import FAISS
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from text_splitter import text_splitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.embeddings import Embeddings
+from embedding_service import MODEL_NAME, SOCKET_PATH, read_response, send_request
 
 
-# Configure Hugging Face Embeddings
-embeddings = HuggingFaceEmbeddings(
-    model_name="sentence-transformers/all-mpnet-base-v2"
-    )
+class SocketEmbeddings(Embeddings):
+    """
+    Client of the shared embedding server (embedding_service.py).
+
+    Each thread keeps one connection to the Unix socket. If the server is
+    not running or the connection fails, encoding falls back to a model
+    loaded in this process (only loaded the first time it is needed).
+    """
+
+    def __init__(self, socket_path=SOCKET_PATH, model_name=MODEL_NAME, timeout=30.0):
+        self.socket_path = socket_path
+        self.model_name = model_name
+        self.timeout = timeout
+        self._local = threading.local()
+        self._fallback = None
+        self._fallback_lock = threading.Lock()
+
+    def _connection(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def _remote(self, texts):
+        sock = self._connection()
+        try:
+            send_request(sock, texts)
+            return read_response(sock).tolist()
+        except (OSError, ConnectionError):
+            sock.close()
+            self._local.sock = None
+            raise
+
+    def _local_model(self):
+        with self._fallback_lock:
+            if self._fallback is None:
+                self._fallback = HuggingFaceEmbeddings(model_name=self.model_name)
+            return self._fallback
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        try:
+            return self._remote(texts)
+        except (OSError, ConnectionError):
+            return self._local_model().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LRU cache of query embeddings in front of another Embeddings.
+
+    Repeated or retried questions skip the model: the key is the query with
+    case and whitespace normalized, vectors are kept as float32 arrays (what
+    FAISS searches with anyway) and at most `max_entries` are held
+    (MIA_QUERY_CACHE_SIZE). Safe to share between threads; two threads
+    missing on the same query may both encode it. embed_documents is not
+    cached (indexing sees each chunk once).
+    """
 
-# Load the texts
-loader = PyPDFLoader('backend/chatbot/doc/raw_data/documento.pdf')
-documents = loader.load()
+    def __init__(self, inner, max_entries=int(os.getenv("MIA_QUERY_CACHE_SIZE", "4096"))):
+        self.inner = inner
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        self.miss_seconds = 0.0
 
-# Call the function and get the texts
-texts = text_splitter(documents)
+    @staticmethod
+    def _key(text):
+        return " ".join(text.casefold().split())
+
+    def embed_documents(self, texts):
+        return self.inner.embed_documents(texts)
+
+    def embed_query(self, text):
+        key = self._key(text)
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return vector.tolist()
+        started = time.perf_counter()
+        embedded = self.inner.embed_query(text)
+        elapsed = time.perf_counter() - started
+        # Same float32 values on a miss and on later hits
+        vector = array("f", embedded)
+        with self._lock:
+            self.misses += 1
+            self.miss_seconds += elapsed
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return vector.tolist()
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        """Hit rate, size and the encoding time the hits saved."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            miss_ms = self.miss_seconds * 1000 / self.misses if self.misses else 0.0
+            return {
+                "query_cache_entries": len(self._cache),
+                "query_cache_bytes": sum(
+                    len(key) + vector.itemsize * len(vector) for key, vector in self._cache.items()
+                ),
+                "query_cache_hits": self.hits,
+                "query_cache_hit_rate": self.hits / lookups if lookups else 0.0,
+                "query_embed_avg_ms": miss_ms,
+                "query_cache_saved_ms": miss_ms * self.hits,
+            }
+
+
+def load_embeddings():
+    """Shared embedding server if its socket exists, otherwise an in-process model."""
+    if os.path.exists(SOCKET_PATH):
+        return SocketEmbeddings(SOCKET_PATH)
+    return HuggingFaceEmbeddings(model_name=MODEL_NAME)
+
+
+# Configure Hugging Face Embeddings, with repeated queries served from memory
+# (the corpus itself is loaded by ingestion.py only when the index is rebuilt)
+embeddings = CachedEmbeddings(load_embeddings())
 
 
 def initialize_faiss(texts, embeddings):
@@ -25,3 +159,29 @@ def initialize_faiss(texts, embeddings):
     text_contents = [doc.page_content for doc in texts]
     # Create FAISS vector store from texts and embeddings
     return FAISS.from_texts(text_contents, embeddings)
+
+
+def similarity_search_many(docsearch, queries, k=4):
+    """
+    Embed all queries in one batched call and run a single
+    multi-query FAISS search.
+
+    Returns:
+    - results (list): One list of retrieved Documents per query, in input order.
+    """
+    vectors = np.asarray(
+        docsearch.embeddings.embed_documents(list(queries)), dtype=np.float32
+    )
+    if getattr(docsearch, "_normalize_L2", False):
+        faiss.normalize_L2(vectors)
+    _, indices = docsearch.index.search(vectors, k)
+
+    results = []
+    for row in indices:
+        docs = []
+        for i in row:
+            if i == -1:  # Fewer than k vectors in the index
+                continue
+            docs.append(docsearch.docstore.search(docsearch.index_to_docstore_id[i]))
+        results.append(docs)
+    return results
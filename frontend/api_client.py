@@ -0,0 +1,195 @@
+# api_client.py
+"""
+Cliente HTTP del servidor de MIA (api_server.py).
+
+Ofrece los mismos métodos que service.MiaService, así la app de Streamlit
+puede funcionar como cliente liviano cuando MIA_API_URL está definida.
+Cada hilo reutiliza su conexión (keep-alive).
+"""
+
+import http.client
+import json
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote, urlencode, urlparse
+
+
+class MiaApiError(Exception):
+    """Error devuelto por el servidor de MIA"""
+
+
+class MiaApiClient:
+    """Cliente keep-alive con la misma interfaz que MiaService"""
+
+    def __init__(self, base_url: str, timeout: float = 120.0, tenant: Optional[str] = None,
+                 token: Optional[str] = None):
+        url = urlparse(base_url)
+        # Municipio (encabezado X-MIA-Tenant); sin él, el servidor usa el por defecto
+        self.tenant = tenant
+        # Token de las rutas de administración (/cases/...)
+        self.token = token if token is not None else os.getenv("MIA_API_TOKEN")
+        self.host = url.hostname or "127.0.0.1"
+        self.port = url.port or (443 if url.scheme == "https" else 80)
+        self.https = url.scheme == "https"
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = cls(self.host, self.port, timeout=self.timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method: str, path: str, payload: Optional[Dict] = None) -> http.client.HTTPResponse:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body else {}
+        if self.tenant:
+            headers["X-MIA-Tenant"] = self.tenant
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        for attempt in range(2):
+            conn = self._connection()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                return conn.getresponse()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # El servidor cerró la conexión keep-alive: reintentar con una nueva
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def _json(self, method: str, path: str, payload: Optional[Dict] = None, allowed=(200, 201)) -> Dict:
+        response = self._request(method, path, payload)
+        data = json.loads(response.read().decode("utf-8") or "{}")
+        if response.status not in allowed:
+            raise MiaApiError(data.get("error", f"HTTP {response.status}"))
+        return data
+
+    # ------------------------------------------------------------------
+    # Chat
+    # ------------------------------------------------------------------
+    def chat(
+        self,
+        query: str,
+        citizen_id: str,
+        citizen_name: str,
+        citizen_email: str,
+        stream: bool = False,
+        deadline=None,
+        session_id: str = "",
+    ) -> Dict:
+        payload = {
+            "query": query,
+            "citizen_id": citizen_id,
+            "citizen_name": citizen_name,
+            "citizen_email": citizen_email,
+            "stream": stream,
+            "session_id": session_id,
+        }
+        if deadline is not None:
+            # El servidor arma su propio deadline con el tiempo que queda
+            payload["budget_s"] = deadline.remaining()
+        if not stream:
+            return self._json("POST", "/chat", payload)
+
+        response = self._request("POST", "/chat", payload)
+        if response.status != 200:
+            data = json.loads(response.read().decode("utf-8") or "{}")
+            raise MiaApiError(data.get("error", f"HTTP {response.status}"))
+        meta = json.loads(response.readline())
+        meta.pop("type", None)
+        meta["primary_response"] = self._deltas(response)
+        return meta
+
+    @staticmethod
+    def _deltas(response: http.client.HTTPResponse) -> Iterator[str]:
+        for line in response:
+            event = json.loads(line)
+            if event["type"] == "delta":
+                yield event["text"]
+            elif event["type"] == "error":
+                raise MiaApiError(event["error"])
+            elif event["type"] == "end":
+                break
+        response.read()  # Vaciar el cuerpo para reutilizar la conexión
+
+    # ------------------------------------------------------------------
+    # Turnos
+    # ------------------------------------------------------------------
+    def available_dates(self, procedure: str = "", limit: Optional[int] = None) -> List[str]:
+        query = urlencode({"procedure": procedure, "limit": limit or 200})
+        return self._json("GET", f"/appointments/slots?{query}")["dates"]
+
+    def start_times(self, date: str, procedure: str = "") -> List[str]:
+        query = urlencode({"procedure": procedure, "date": date})
+        return self._json("GET", f"/appointments/slots?{query}")["times"]
+
+    def next_free_slots(self, procedure: str = "", from_date: Optional[str] = None, n: int = 5) -> List[Tuple[str, str]]:
+        params = {"procedure": procedure, "n": n, "limit": 1}
+        if from_date:
+            params["from"] = from_date
+        return [tuple(slot) for slot in self._json("GET", f"/appointments/slots?{urlencode(params)}")["next"]]
+
+    def book(
+        self,
+        citizen_id: str,
+        citizen_name: str,
+        citizen_email: str,
+        procedure: str,
+        date: str,
+        time: str,
+        notes: str = "",
+    ) -> Tuple[bool, str, Optional[Dict]]:
+        data = self._json("POST", "/appointments", {
+            "citizen_id": citizen_id,
+            "citizen_name": citizen_name,
+            "citizen_email": citizen_email,
+            "procedure": procedure,
+            "date": date,
+            "time": time,
+            "notes": notes,
+        }, allowed=(201, 409))
+        return data["success"], data["message"], data.get("appointment")
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+    def llm_metrics(self) -> Dict:
+        return self._json("GET", "/metrics/llm")
+
+    def memory_report(self, session_states=()) -> Dict:
+        # Memoria del proceso del servidor; el estado de sesión vive en la app
+        return self._json("GET", "/metrics/memory")
+
+    def tenant_metrics(self) -> List[Dict]:
+        return self._json("GET", "/metrics/tenants")
+
+    # ------------------------------------------------------------------
+    # Casos
+    # ------------------------------------------------------------------
+    def case_status(self, case_id: str) -> Optional[Dict]:
+        response = self._request("GET", f"/cases/{quote(case_id)}")
+        data = json.loads(response.read().decode("utf-8") or "{}")
+        if response.status == 404:
+            return None
+        if response.status != 200:
+            raise MiaApiError(data.get("error", f"HTTP {response.status}"))
+        return data
+
+    def dispatch_overview(self) -> List[Dict]:
+        return self._json("GET", "/cases/queues")
+
+    def assign_next_case(self, department: str, officer: str) -> Optional[Dict]:
+        return self._json("POST", "/cases/assign", {"department": department, "officer": officer})["case"]
+
+    def assign_case(self, case_id: str, officer: str) -> Tuple[bool, str]:
+        data = self._json("POST", "/cases/assign", {"case_id": case_id, "officer": officer}, allowed=(200, 409))
+        return data["success"], data["message"]
+
+    def release_case(self, case_id: str) -> Tuple[bool, str]:
+        data = self._json("POST", "/cases/release", {"case_id": case_id}, allowed=(200, 409))
+        return data["success"], data["message"]
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# api_loadtest.py
+"""
+Prueba de carga local del servidor HTTP de MIA.
+
+Abre `--concurrency` conexiones keep-alive y repite la misma petición
+durante `--duration` segundos. Reporta peticiones/segundo y percentiles.
+
+Ejemplos:
+    python frontend/api_loadtest.py --path /appointments/slots
+    python frontend/api_loadtest.py --path /chat --body '{"query": "¿Qué necesito para el DNI?"}'
+"""
+
+import argparse
+import http.client
+import json
+import threading
+import time
+from typing import List, Optional
+from urllib.parse import urlparse
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_load_test(
+    base_url: str,
+    path: str,
+    body: Optional[dict] = None,
+    concurrency: int = 16,
+    duration: float = 10.0,
+) -> dict:
+    """Ejecuta la prueba y devuelve un resumen con req/s y latencias (ms)"""
+    url = urlparse(base_url)
+    method = "POST" if body is not None else "GET"
+    payload = json.dumps(body).encode("utf-8") if body is not None else None
+    headers = {"Content-Type": "application/json"} if payload else {}
+    latencies: List[float] = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+        local_latencies, local_errors = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 400:
+                    local_errors += 1
+                else:
+                    local_latencies.append((time.perf_counter() - start) * 1000)
+            except (http.client.HTTPException, OSError):
+                local_errors += 1
+                conn.close()
+                conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+        conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors[0] += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests": len(latencies),
+        "errors": errors[0],
+        "requests_per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(latencies, 50),
+        "p90_ms": _percentile(latencies, 90),
+        "p99_ms": _percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga del servidor de MIA")
+    parser.add_argument("--url", default="http://127.0.0.1:8080")
+    parser.add_argument("--path", default="/appointments/slots")
+    parser.add_argument("--body", default=None, help="JSON para enviar por POST")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    summary = run_load_test(
+        args.url,
+        args.path,
+        json.loads(args.body) if args.body else None,
+        args.concurrency,
+        args.duration,
+    )
+    print(
+        f"{summary['requests']} peticiones, {summary['errors']} errores | "
+        f"{summary['requests_per_second']:.1f} req/s | "
+        f"p50 {summary['p50_ms']:.1f} ms  p90 {summary['p90_ms']:.1f} ms  p99 {summary['p99_ms']:.1f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
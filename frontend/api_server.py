@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# api_server.py
+"""
+Servidor HTTP de MIA, independiente de Streamlit.
+
+Expone el mismo servicio que usa la app (service.MiaService) para que MIA
+pueda integrarse con WhatsApp, widgets web u otros canales:
+
+    GET  /health
+    POST /chat                    {"query", "citizen_id", "citizen_name", "citizen_email", "stream", "budget_s", "session_id"}
+    GET  /appointments/slots      ?procedure=&date=&n=
+    POST /appointments            {"citizen_id", ..., "procedure", "date", "time", "notes"}
+    GET  /cases/queues            casos pendientes y espera por departamento (*)
+    GET  /cases/<case_id>         (*)
+    POST /cases/assign            {"officer", "department"} (siguiente caso) o {"officer", "case_id"} (*)
+    POST /cases/release           {"case_id"} (*)
+    GET  /metrics/llm
+    GET  /metrics/memory          memoria del worker: modelo, índice, docstore (MiB)
+    GET  /metrics/tenants         índices de municipios en memoria (cargas en frío, aciertos, desalojos)
+
+(*) Rutas de administración: exigen el encabezado
+"Authorization: Bearer <MIA_API_TOKEN>". Sin MIA_API_TOKEN quedan deshabilitadas.
+
+Varios municipios (ver backend/chatbot/tenants.py): el encabezado
+X-MIA-Tenant, el parámetro ?tenant= o el campo "tenant" del cuerpo eligen
+el municipio; sin ellos se usa el municipio por defecto.
+
+Modelo de procesos: el proceso padre carga una sola vez el backend (modelo de
+embeddings, índice FAISS, cadenas) y luego crea N workers con fork() que
+comparten el socket de escucha y, por copy-on-write, esas páginas en memoria.
+Cada worker atiende conexiones keep-alive (HTTP/1.1) en hilos.
+
+Uso (desde la raíz del repositorio):
+    python frontend/api_server.py --port 8080 --workers 4
+"""
+
+import argparse
+import hmac
+import json
+import logging
+import math
+import os
+import signal
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, unquote, urlparse
+
+FRONTEND_PATH = os.path.dirname(os.path.abspath(__file__))
+BACKEND_CHATBOT_PATH = os.path.abspath(
+    os.path.join(FRONTEND_PATH, "..", "backend", "chatbot")
+)
+for path in (FRONTEND_PATH, BACKEND_CHATBOT_PATH):
+    if path not in sys.path:
+        sys.path.append(path)
+
+from request_profiler import profiler
+from deadline import Deadline
+
+logger = logging.getLogger("mia.api")
+
+DEFAULT_PORT = int(os.getenv("MIA_API_PORT", "8080"))
+DEFAULT_WORKERS = int(os.getenv("MIA_API_WORKERS", str(os.cpu_count() or 1)))
+# Token de las rutas de administración (/cases/...)
+API_TOKEN = os.getenv("MIA_API_TOKEN", "")
+
+
+def load_service():
+    """Inicializa la base y el backend una sola vez (antes del fork)"""
+    try:
+        from dotenv import load_dotenv
+        load_dotenv(os.path.join(FRONTEND_PATH, "..", ".env"))
+    except ImportError:
+        pass
+
+    from database import init_user_db, init_data_tables, init_metrics_table
+    init_user_db()
+    init_data_tables()
+    init_metrics_table()
+
+    from chain import docsearch
+    from appointment_manager import QueryProcessor
+    from service import MiaService
+    from tenancy import TenantServices
+    # Los demás municipios se cargan en cada worker en su primera consulta
+    return TenantServices(MiaService(QueryProcessor(), docsearch))
+
+
+class MiaHTTPServer(ThreadingHTTPServer):
+    """Servidor con hilos por conexión y los servicios ya cargados"""
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, handler_class, services):
+        self.services = services
+        super().__init__(address, handler_class)
+
+
+class MiaRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 mantiene la conexión abierta entre peticiones (keep-alive)
+    protocol_version = "HTTP/1.1"
+    server_version = "MIA-API/0.1"
+    # Encabezados y cuerpo salen en escrituras separadas: sin TCP_NODELAY,
+    # Nagle + ACK retardado agregan ~40 ms a cada respuesta keep-alive
+    disable_nagle_algorithm = True
+
+    # ------------------------------------------------------------------
+    # Utilidades
+    # ------------------------------------------------------------------
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        body = json.loads(self.rfile.read(length).decode("utf-8"))
+        if not isinstance(body, dict):
+            raise ValueError("el cuerpo debe ser un objeto JSON")
+        return body
+
+    def _admin_denied(self) -> bool:
+        """Responde 403/401 y devuelve True si la petición no trae el token de administración"""
+        if not API_TOKEN:
+            self._send_json(403, {"error": "Rutas de administración deshabilitadas (falta MIA_API_TOKEN)"})
+            return True
+        scheme, _, token = self.headers.get("Authorization", "").partition(" ")
+        if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), API_TOKEN.encode()):
+            self._send_json(401, {"error": "Token de administración inválido"})
+            return True
+        return False
+
+    def _service(self, params: dict, body: Optional[dict] = None):
+        """Servicio del municipio pedido (encabezado, ?tenant= o campo "tenant")"""
+        tenant = self.headers.get("X-MIA-Tenant") or params.get("tenant") or (body or {}).get("tenant")
+        return self.server.services.get(tenant)
+
+    def _send_json(self, status: int, payload) -> None:
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _write_chunk(self, event: dict) -> None:
+        data = (json.dumps(event, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_stream(self, response_data: dict) -> None:
+        """
+        Respuesta NDJSON con Transfer-Encoding: chunked:
+        {"type": "meta", ...}, luego {"type": "delta", "text": ...} y {"type": "end"}
+        """
+        answer = response_data.pop("primary_response", "")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._write_chunk({"type": "meta", **response_data})
+        try:
+            for text in ([answer] if isinstance(answer, str) else answer):
+                if text:
+                    self._write_chunk({"type": "delta", "text": text})
+        except Exception as e:
+            # Los encabezados ya se enviaron: el error viaja como evento
+            logger.exception("Error durante el streaming")
+            self._write_chunk({"type": "error", "error": str(e)})
+        self._write_chunk({"type": "end"})
+        self.wfile.write(b"0\r\n\r\n")
+
+    # ------------------------------------------------------------------
+    # Rutas
+    # ------------------------------------------------------------------
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            if url.path.startswith("/cases/") and self._admin_denied():
+                return
+            service = self._service(params)
+            if url.path == "/health":
+                self._send_json(200, {"status": "ok", "pid": os.getpid()})
+            elif url.path == "/appointments/slots":
+                procedure = params.get("procedure", "")
+                if params.get("date"):
+                    payload = {"date": params["date"], "times": service.start_times(params["date"], procedure)}
+                else:
+                    payload = {
+                        "dates": service.available_dates(procedure, limit=int(params.get("limit", 30))),
+                        "next": service.next_free_slots(procedure, params.get("from"), int(params.get("n", 5))),
+                    }
+                self._send_json(200, payload)
+            elif url.path == "/metrics/llm":
+                self._send_json(200, service.llm_metrics())
+            elif url.path == "/metrics/memory":
+                self._send_json(200, service.memory_report())
+            elif url.path == "/metrics/tenants":
+                self._send_json(200, service.tenant_metrics())
+            elif url.path == "/cases/queues":
+                self._send_json(200, service.dispatch_overview())
+            elif url.path.startswith("/cases/"):
+                case = service.case_status(unquote(url.path[len("/cases/"):]))
+                if case is None:
+                    self._send_json(404, {"error": "Caso no encontrado"})
+                else:
+                    self._send_json(200, case)
+            else:
+                self._send_json(404, {"error": "Ruta no encontrada"})
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            logger.exception("Error en GET %s", self.path)
+            self._send_json(500, {"error": str(e)})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            body = self._read_json()
+            if url.path.startswith("/cases/") and self._admin_denied():
+                return
+            service = self._service(params, body)
+            if url.path == "/chat":
+                if not body.get("query"):
+                    self._send_json(400, {"error": "Falta 'query'"})
+                    return
+                stream = bool(body.get("stream"))
+                # Presupuesto de tiempo de la consulta (por defecto MIA_REQUEST_BUDGET_S)
+                deadline = _deadline(body.get("budget_s"))
+                # El perfil cubre también el envío del stream (ahí corre el LLM)
+                with profiler.profile("api_chat"):
+                    response_data = service.chat(
+                        query=body["query"],
+                        citizen_id=body.get("citizen_id", ""),
+                        citizen_name=body.get("citizen_name", ""),
+                        citizen_email=body.get("citizen_email", ""),
+                        stream=stream,
+                        deadline=deadline,
+                        # Conversación del canal (repreguntas); sin ella no se siguen
+                        session_id=str(body.get("session_id") or ""),
+                    )
+                    if stream:
+                        self._send_stream(response_data)
+                    else:
+                        self._send_json(200, response_data)
+            elif url.path == "/cases/assign":
+                if body.get("case_id"):
+                    success, message = service.assign_case(body["case_id"], body["officer"])
+                    self._send_json(200 if success else 409, {"success": success, "message": message})
+                else:
+                    case = service.assign_next_case(body["department"], body["officer"])
+                    self._send_json(200, {"case": case})
+            elif url.path == "/cases/release":
+                success, message = service.release_case(body["case_id"])
+                self._send_json(200 if success else 409, {"success": success, "message": message})
+            elif url.path == "/appointments":
+                success, message, appointment = service.book(
+                    citizen_id=body.get("citizen_id", ""),
+                    citizen_name=body.get("citizen_name", ""),
+                    citizen_email=body.get("citizen_email", ""),
+                    procedure=body.get("procedure", ""),
+                    date=body["date"],
+                    time=body["time"],
+                    notes=body.get("notes", ""),
+                )
+                self._send_json(201 if success else 409, {
+                    "success": success, "message": message, "appointment": appointment
+                })
+            else:
+                self._send_json(404, {"error": "Ruta no encontrada"})
+        except (KeyError, ValueError) as e:
+            self._send_json(400, {"error": f"Petición inválida: {e}"})
+        except Exception as e:
+            logger.exception("Error en POST %s", self.path)
+            self._send_json(500, {"error": str(e)})
+
+
+def _deadline(budget_s) -> Deadline:
+    """
+    Deadline de un "budget_s" del cuerpo. ValueError (400) si no es un
+    número de segundos finito y no negativo (0: el cliente ya no tiene
+    tiempo, api_client envía lo que le queda, y la respuesta se degrada)
+    """
+    if budget_s is None:
+        return Deadline()
+    if isinstance(budget_s, bool) or not isinstance(budget_s, (int, float)):
+        raise ValueError("'budget_s' debe ser un número de segundos")
+    if not math.isfinite(budget_s) or budget_s < 0:
+        raise ValueError("'budget_s' debe ser un número de segundos no negativo")
+    return Deadline(float(budget_s))
+
+
+def serve(host: str, port: int, workers: int) -> None:
+    """Carga el backend, abre el socket y reparte las conexiones entre workers"""
+    services = load_service()
+    server = MiaHTTPServer((host, port), MiaRequestHandler, services)
+    logger.info("MIA API escuchando en http://%s:%s con %s worker(s)", host, port, workers)
+
+    if workers <= 1 or not hasattr(os, "fork"):
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+        return
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            # Worker: hereda el socket y el backend ya cargado
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                server.serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for child in children:
+            try:
+                os.kill(child, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for child in children:
+        try:
+            os.waitpid(child, 0)
+        except ChildProcessError:
+            pass
+    server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor HTTP de MIA")
+    parser.add_argument("--host", default=os.getenv("MIA_API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(args.host, args.port, args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,7 @@ from typing import Optional, Dict
 import sqlite3
 import pandas as pd
 import base64
+import uuid
 
 if "current_section" not in st.session_state:
     st.session_state.current_section = "inicio"
@@ -59,89 +60,72 @@ st.set_page_config(
     layout="wide",
 )
 
+# ------------------------------
+# RECURSOS COMPARTIDOS (una vez por proceso)
+# ------------------------------
+# Streamlit vuelve a ejecutar todo el script en cada interacción: lo que no
+# depende de la sesión se crea una sola vez con st.cache_resource.
+# MIA_RERUN_CACHE=0 lo desactiva para comparar tiempos de rerun.
+RERUN_CACHE = os.getenv("MIA_RERUN_CACHE", "1") != "0"
+
+
+def cache_resource(func):
+    return st.cache_resource(func) if RERUN_CACHE else func
+
+
+@st.cache_resource
+def get_rerun_profiler():
+    from rerun_profiler import RerunProfiler
+    return RerunProfiler()
+
+
+timer = get_rerun_profiler().start()
+
+
+@st.cache_resource
+def load_styles() -> str:
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "styles.css"), encoding="utf-8") as f:
+        return f"<style>\n{f.read()}</style>"
+
 # ------------------------------
 # 2. AUTENTICACIÓN BÁSICA (SQLite)
 # ------------------------------
 
-DB_PATH = os.path.join(os.path.dirname(__file__), "mia_users.db")
+from request_profiler import profiler
+from deadline import Deadline
+from job_queue import dead_letters, queue_stats, requeue_dead
+from latency_metrics import BUCKET_LABELS, STAGES, distribution, load_histograms, percentile_trends
+from database import (
+    DB_PATH,
+    append_chat_message,
+    has_older_chat_messages,
+    init_data_tables,
+    init_metrics_table,
+    init_user_db,
+    load_chat_messages,
+)
 
-conn = sqlite3.connect(DB_PATH)
-c = conn.cursor()
 
+@cache_resource
+def init_databases() -> bool:
+    """Crea las tablas una sola vez por proceso"""
+    init_user_db()
+    init_data_tables()
+    init_metrics_table()
+    return True
 
-def init_user_db():
-    """Crea la tabla de usuarios si no existe."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS citizens (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            dni TEXT NOT NULL,
-            password TEXT NOT NULL,
-            is_admin INTEGER DEFAULT 0
-        )
-    """)
-    conn.commit()
-    conn.close()
 
-def init_data_tables():
-    """Crea tablas de citas y casos complejos si no existen."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # Tabla de citas
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS appointments (
-            id TEXT PRIMARY KEY,
-            citizen_email TEXT,
-            procedure TEXT,
-            date TEXT,
-            time TEXT,
-            status TEXT,
-            notes TEXT,
-            created_at TEXT
-        )
-    """)
-    # Tabla de casos complejos
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS complex_cases (
-            id TEXT PRIMARY KEY,
-            citizen_email TEXT,
-            description TEXT,
-            department TEXT,
-            priority TEXT,
-            status TEXT,
-            created_at TEXT
-        )
-    """)
-    conn.commit()
-    conn.close()
-    
-def init_metrics_table():
-    """Crea tabla para métricas de uso si no existe."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        CREATE TABLE IF NOT EXISTS metrics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            date TEXT,
-            total_queries INTEGER DEFAULT 0,
-            appointments INTEGER DEFAULT 0,
-            complex_cases INTEGER DEFAULT 0,
-            tokens_used INTEGER DEFAULT 0
-        )
-    """)
-    conn.commit()
-    conn.close()
-    
 def ensure_admin_exists():
     """Verifica si existe al menos un administrador. Si no, permite crearlo desde Streamlit."""
+    # Una vez que existe un administrador no hace falta volver a consultarlo en la sesión
+    if st.session_state.get("admin_exists"):
+        return
     conn = sqlite3.connect(DB_PATH)
     c = conn.cursor()
     c.execute("SELECT COUNT(*) FROM citizens WHERE is_admin = 1")
     has_admin = c.fetchone()[0] > 0
     conn.close()
+    st.session_state.admin_exists = has_admin
 
     if not has_admin:
         st.title("🧑‍💼 Configuración inicial del administrador")
@@ -177,83 +161,43 @@ def ensure_admin_exists():
 
 
 # Llama las inicializaciones al inicio de la app
-init_user_db()
-init_data_tables()
-init_metrics_table()
+init_databases()
 ensure_admin_exists()
 
 # ------------------------------
 # 3. IMPORTACIÓN DE MÓDULOS DE BACKEND Y NUEVA LÓGICA
 # ------------------------------
-try:
-    from memory import memory
+# Con MIA_API_URL la app es un cliente liviano del servidor HTTP (api_server.py);
+# si no, carga el backend en este mismo proceso.
+MIA_API_URL = os.getenv("MIA_API_URL")
+# Municipio que atiende esta app (ver backend/chatbot/tenants.py)
+MIA_TENANT = os.getenv("MIA_TENANT", "default")
+
+
+@cache_resource
+def load_mia_service():
+    """Servicio compartido por todas las sesiones del proceso"""
+    if MIA_API_URL:
+        from api_client import MiaApiClient
+        return MiaApiClient(MIA_API_URL, tenant=MIA_TENANT)
     from chain import docsearch 
     # Importar la nueva lógica de gestión
     from appointment_manager import QueryProcessor
-    # Inicialización de QueryProcessor (asumiendo que tiene la lógica de citas)
-    query_processor = QueryProcessor() 
-    
+    from service import MiaService
+    from tenancy import TenantServices
+    # QueryProcessor carga citas y casos desde SQLite: una sola vez por proceso
+    return TenantServices(MiaService(QueryProcessor(), docsearch, DB_PATH)).get(MIA_TENANT)
+
+
+try:
+    mia_service = load_mia_service()
+    timer.mark("arranque")
 except Exception as e:
     # Capturar errores durante la inicialización, como el de la ruta de FAISS.
     st.error(f"Error al inicializar módulos del backend. Revisa logs de terminal: {e}")
     st.stop() # Detener para que el usuario solucione el error
 
 
-def save_appointment_to_db(appointment):
-    """Guarda una cita confirmada en la base SQLite."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    c.execute("""
-        INSERT OR REPLACE INTO appointments 
-        (id, citizen_email, procedure, date, time, status, notes, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
-        appointment.id,
-        appointment.citizen_email,
-        appointment.procedure,
-        appointment.date,
-        appointment.time,
-        appointment.status,
-        appointment.notes,
-        appointment.created_at
-    ))
-    conn.commit()
-    conn.close()
-    update_metrics("appointments")
-
-
-def save_case_to_db(case):
-    """Guarda un caso complejo derivado en la base SQLite."""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # Convertir enums y otros tipos no serializables
-    department = case.get("department")
-    if not isinstance(department, str):
-        department = str(department.name) if hasattr(department, "name") else str(department)
-
-    priority = case.get("priority")
-    if not isinstance(priority, str):
-        priority = str(priority.name) if hasattr(priority, "name") else str(priority)
-
-    c.execute("""
-        INSERT OR REPLACE INTO complex_cases
-        (id, citizen_email, description, department, priority, status, created_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    """, (
-        case.get("id"),
-        case.get("citizen_email"),
-        case.get("description"),
-        department,
-        priority,
-        case.get("status"),
-        case.get("created_at"),
-    ))
-    conn.commit()
-    conn.close()
-    update_metrics("complex_cases")
-
-
 def register_user(name, email, dni, password):
     """Registra un nuevo usuario."""
     conn = sqlite3.connect(DB_PATH)
@@ -279,32 +223,19 @@ def authenticate_user(email, password):
         return {"id": user[0], "name": user[1], "email": user[2], "dni": user[3]}
     return None
 
-def update_metrics(field, increment=1):
-    """Actualiza las métricas diarias en la base."""
-    today = date.today().isoformat()
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    # Crear registro del día si no existe
-    c.execute("SELECT * FROM metrics WHERE date = ?", (today,))
-    row = c.fetchone()
-    if not row:
-        c.execute("INSERT INTO metrics (date) VALUES (?)", (today,))
-    # Actualizar campo correspondiente
-    c.execute(f"UPDATE metrics SET {field} = {field} + ? WHERE date = ?", (increment, today))
-    conn.commit()
-    conn.close()
-
-
-
-
 # ------------------------------
 # 4. STREAMLIT STATE INICIALIZACIÓN
 # ------------------------------
 # Inicialización de Sesión (Manejo de estado)
+# El historial de chat vive en SQLite; la sesión guarda solo la ventana visible
+CHAT_WINDOW = 30  # Mensajes que se muestran (y se guardan en la sesión)
+CHAT_PAGE = 30    # Mensajes que agrega "Ver mensajes anteriores"
+GREETING = {"role": "assistant", "text": "¡Hola! Soy MIA, la asistente virtual de tu municipio. ¿En qué trámite o consulta te puedo ayudar hoy?"}
+
+if 'chat_session_id' not in st.session_state:
+    st.session_state.chat_session_id = uuid.uuid4().hex
 if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = [
-        {"role": "assistant", "text": "¡Hola! Soy MIA, la asistente virtual de tu municipio. ¿En qué trámite o consulta te puedo ayudar hoy?"}
-    ]
+    st.session_state.chat_history = [dict(GREETING)]
 if 'metrics' not in st.session_state:
     st.session_state.metrics = {'llm_calls': 0, 'derivations': 0, 'appointments': 0}   
 if 'current_section' not in st.session_state:
@@ -325,82 +256,33 @@ if 'pending_appointment' not in st.session_state:
 # 5. ESTILOS (Combinando el estilo original con accesibilidad)
 # ------------------------------
 
-st.markdown(
-    """
-    <style>
-        /* Estilos del Sidebar: Oscuro (#262730) y texto blanco */
-        [data-testid="stSidebar"] {
-            background-color: #262730;
-            /* ACCESIBILIDAD: Añade un rol ARIA para la navegación principal */
-            role: "navigation"; 
-        }
-        [data-testid="stSidebar"] * {
-            color: white !important;
-        }
-
-        /* Estilos de botones dentro del Sidebar: Transparentes y texto blanco */
-        [data-testid="stSidebar"] .stButton button,
-        [data-testid="stSidebar"] .stDownloadButton button {
-            background-color: transparent !important;
-            border: none !important;
-            box-shadow: none !important;
-            color: white !important;
-            text-align: left !important;
-            padding-left: 0.25rem !important;
-        }
-        [data-testid="stSidebar"] .stButton button:hover,
-        [data-testid="stSidebar"] .stDownloadButton button:hover {
-            color: #cccccc !important;
-            background-color: transparent !important;
-        }
-
-        /* Estilos de campos de entrada en el Sidebar (si aplican) */
-        [data-testid="stSidebar"] input[type="text"],
-        [data-testid="stSidebar"] input[type="password"],
-        [data-testid="stSidebar"] textarea {
-            background-color: white !important;
-            color: black !important;
-            border-radius: 6px !important;
-        }
-        
-        /* Estilos de botones PRIMARIOS (fuera del sidebar) para ALTO CONTRASTE */
-        .stButton>button { 
-            background-color: #007bff; /* Azul primario con buen contraste */
-            color: white; 
-            border-radius: 8px;
-            font-weight: bold;
-        }
-        
-        /* Estilos de las burbujas de chat */
-        .st-chat-message {
-            border-radius: 8px;
-            padding: 8px;
-            margin: 6px 0;
-        }
-        
-    </style>
-    """, 
-    unsafe_allow_html=True
-)
+# El CSS se lee una sola vez por proceso; Streamlit exige volver a emitirlo en
+# cada rerun (los elementos que no se emiten desaparecen de la página)
+st.markdown(load_styles(), unsafe_allow_html=True)
+timer.mark("estilos")
     
 # ------------------------------
 # 6. FUNCIÓN CENTRAL DE RESPUESTA (Modificación)
 # ------------------------------
 def ask_question(prompt: str) -> str:
     """Procesa la pregunta, maneja acciones (citas/casos) y devuelve la respuesta final."""
-    if not query_processor:
+    if not mia_service:
         return "El sistema no está inicializado. Contacte a soporte."
     
-    update_metrics("total_queries")
     st.session_state.metrics['llm_calls'] += 1 # Métricas
+    # Presupuesto de tiempo: si no alcanza, la respuesta se degrada (ver deadline.py)
+    deadline = Deadline()
     
-    response_data = query_processor.process_query(
+    # El servicio registra la consulta y guarda el caso derivado en SQLite
+    response_data = mia_service.chat(
         query=prompt,
-        docsearch=docsearch, # Se pasa la base de datos vectorial para contexto
-        #chat_chain=generate_response_from_llm # Se pasa la función de la cadena
         citizen_id=st.session_state.citizen_id, 
         citizen_name=st.session_state.citizen_name, 
         citizen_email=st.session_state.citizen_email,
+        stream=True, # Las respuestas informativas llegan por fragmentos
+        deadline=deadline,
+        # Repreguntas por conversación: los invitados comparten citizen_id
+        session_id=st.session_state.chat_session_id,
     )
     
     
@@ -420,9 +302,6 @@ def ask_question(prompt: str) -> str:
                 st.warning("No se pudo generar el caso correctamente.")
                 return "Lo siento, hubo un error al registrar tu caso. Intenta nuevamente."
 
-            # Guardar el caso en la base de datos SQLite
-            save_case_to_db(case_data)
-
             # Mensaje de confirmación visual y textual
             st.success(f"🚨 ¡Caso Complejo Derivado! 🚨\n\nID: {case_data['id']}")
             st.toast(f"Caso {case_data['id']} derivado al {case_data['department']}.", icon="⚖️")
@@ -451,31 +330,34 @@ def render_appointment_form(pending_appointment: Dict):
     st.subheader("🗓️ Formulario de Cita para Trámite")
     st.info(f"Trámite: {pending_appointment.get('procedure', 'No especificado')}")
     
-    # ... (Aquí va la lógica completa del formulario de citas de new_app.py) ...
-    # Nota: Simplificaremos el renderizado por concisión, pero aquí iría la implementación
-    # de las fechas disponibles de tu 'appointment_manager.py'.
-    
     col1, col2 = st.columns(2)
-    today = datetime.now().date()
+    procedure_hint = pending_appointment.get('procedure', '')
     
-    # Obtener fechas disponibles (simulación, ya que no puedo acceder al módulo completo)
-    available_dates_str = list(query_processor.appointment_manager.availability.keys())
+    # Solo se ofrecen fechas que realmente tienen turnos libres para el trámite
+    available_dates = [date.fromisoformat(d) for d in mia_service.available_dates(procedure_hint)]
     
     with col1:
-        # Usar la primera fecha disponible como valor inicial, o hoy + 1 día
-        default_date = today + timedelta(days=1)
-        selected_date = st.date_input(
-            "Selecciona una fecha",
-            default_date,
-            min_value=today + timedelta(days=1)
-        )
+        if available_dates:
+            suggested = pending_appointment.get('suggested_date')
+            default_index = next(
+                (i for i, d in enumerate(available_dates) if str(d) == suggested), 0
+            )
+            selected_date = st.selectbox(
+                "Selecciona una fecha",
+                available_dates,
+                index=default_index,
+                format_func=lambda d: d.strftime("%d/%m/%Y")
+            )
+        else:
+            selected_date = None
+            st.warning("No hay fechas disponibles en los próximos meses.")
     
     with col2:
         # Obtener horas disponibles para la fecha seleccionada
-        try:
-            available_times = list(query_processor.appointment_manager.get_available_slots(str(selected_date)).keys())
-        except KeyError:
-            available_times = ["No hay horas"]
+        available_times = []
+        if selected_date:
+            available_times = mia_service.start_times(str(selected_date), procedure_hint)
+        available_times = available_times or ["No hay horas"]
             
         selected_time = st.selectbox(
             "Selecciona una hora",
@@ -486,11 +368,12 @@ def render_appointment_form(pending_appointment: Dict):
     notes = st.text_area("Notas adicionales (opcional)")
     
     if st.button("✅ Confirmar Cita", type="primary"):
-        if selected_time == "No hay horas":
+        if not selected_date or selected_time == "No hay horas":
             st.error("Por favor, selecciona una fecha y hora válidas.")
             return
 
-        success, message, appointment = query_processor.appointment_manager.schedule_appointment(
+        # El servicio reserva el turno y guarda la cita en SQLite
+        success, message, appointment = mia_service.book(
             citizen_id=st.session_state.citizen_id,
             citizen_name=st.session_state.citizen_name,
             citizen_email=st.session_state.citizen_email,
@@ -501,9 +384,6 @@ def render_appointment_form(pending_appointment: Dict):
         )
         
         if success:
-            # Guardar la cita en la base de datos SQLite
-            save_appointment_to_db(appointment)
-
             # Mensaje de confirmación al usuario
             st.session_state.last_confirmation = f"✅ ¡Cita confirmada!\n\n{message}"
             st.session_state.show_confirmation = True
@@ -518,6 +398,46 @@ def render_appointment_form(pending_appointment: Dict):
             st.error(f"Error al confirmar cita: {message}")
 
 
+# ------------------------------
+# 7. HISTORIAL DE CHAT (SQLite + ventana visible)
+# ------------------------------
+def load_chat_history():
+    """Carga los últimos mensajes del ciudadano (también de sesiones anteriores)"""
+    citizen_id = str(st.session_state.citizen_id)
+    if st.session_state.get("chat_owner") == citizen_id:
+        return
+    messages = load_chat_messages(citizen_id, limit=CHAT_WINDOW)
+    st.session_state.chat_history = messages or [dict(GREETING)]
+    st.session_state.chat_has_older = bool(messages) and has_older_chat_messages(citizen_id, messages[0]["id"])
+    st.session_state.chat_owner = citizen_id
+
+
+def load_older_messages():
+    """Agrega al principio la página anterior de mensajes"""
+    history = st.session_state.chat_history
+    oldest_id = next((msg["id"] for msg in history if msg.get("id")), None)
+    if oldest_id is None:
+        st.session_state.chat_has_older = False
+        return
+    citizen_id = str(st.session_state.citizen_id)
+    older = load_chat_messages(citizen_id, limit=CHAT_PAGE, before_id=oldest_id)
+    st.session_state.chat_history = older + history
+    st.session_state.chat_has_older = bool(older) and has_older_chat_messages(citizen_id, older[0]["id"])
+
+
+def append_chat(role: str, text: str):
+    """Guarda el mensaje en SQLite y lo agrega a la ventana de la sesión"""
+    message = append_chat_message(
+        st.session_state.citizen_id, st.session_state.chat_session_id, role, text
+    )
+    history = st.session_state.chat_history
+    history.append(message)
+    # La sesión conserva solo la ventana visible: memoria y rerun constantes
+    if len(history) > CHAT_WINDOW:
+        del history[:-CHAT_WINDOW]
+        st.session_state.chat_has_older = True
+
+
 # ------------------------------
 # 7. RENDERIZADO DEL CHAT (Modificación)
 # ------------------------------
@@ -531,7 +451,10 @@ def render_mia_agent():
         st.balloons()
         st.session_state.show_confirmation = False  # Evita que se repita
 
-    # Renderiza todo el historial de chat
+    # Renderiza solo la ventana reciente del historial
+    load_chat_history()
+    if st.session_state.get("chat_has_older") and st.button("⬆️ Ver mensajes anteriores"):
+        load_older_messages()
     for msg in st.session_state.chat_history:
         with st.chat_message(msg["role"]):
             st.markdown(msg["text"])
@@ -541,21 +464,25 @@ def render_mia_agent():
         return
 
     # Mantiene el historial de chat (user)
-    user_msg = {"role": "user", "text": prompt}
-    st.session_state.chat_history.append(user_msg)
+    append_chat("user", prompt)
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Llama a la función central (ask_question) que maneja el flujo de trabajo
-    with st.spinner("MIA está pensando y analizando la intención..."):
-        response = ask_question(prompt)
-        
-    # Mantiene el historial de chat (assistant) si no ha redirigido a un formulario
-    if st.session_state.current_section == "mia_agent":
-        assistant_msg = {"role": "assistant", "text": response}
-        st.session_state.chat_history.append(assistant_msg)
-        with st.chat_message("assistant"):
-            st.markdown(response)
+    # El perfil (si está activo) cubre clasificación, RAG, LLM y el render del stream
+    with profiler.profile("chat"):
+        # Llama a la función central (ask_question) que maneja el flujo de trabajo
+        with st.spinner("MIA está pensando y analizando la intención..."):
+            response = ask_question(prompt)
+            
+        # Mantiene el historial de chat (assistant) si no ha redirigido a un formulario
+        if st.session_state.current_section == "mia_agent":
+            with st.chat_message("assistant"):
+                if isinstance(response, str):
+                    st.markdown(response)
+                else:
+                    # Respuesta en streaming: se muestra a medida que llega
+                    response = st.write_stream(response)
+            append_chat("assistant", response if isinstance(response, str) else str(response))
 
 # ------------------------------
 # Sidebar
@@ -805,6 +732,23 @@ def render_login():
             else:
                 st.error(msg)
                 
+@st.cache_data(ttl=10, show_spinner=False)
+def load_admin_tables():
+    """Tablas del panel; se releen como máximo cada 10 s y no en cada rerun"""
+    conn = sqlite3.connect(DB_PATH)
+    df_metrics = pd.read_sql_query("SELECT * FROM metrics ORDER BY date DESC", conn)
+    df_appointments = pd.read_sql_query("SELECT * FROM appointments ORDER BY created_at DESC", conn)
+    df_cases = pd.read_sql_query("SELECT * FROM complex_cases ORDER BY created_at DESC", conn)
+    conn.close()
+    return df_metrics, df_appointments, df_cases
+
+
+@st.cache_data(ttl=10, show_spinner=False)
+def load_latency_histograms(hours: int):
+    since = (datetime.now() - timedelta(hours=hours)).strftime("%Y-%m-%d %H:00")
+    return load_histograms(since, DB_PATH)
+
+
 def render_admin_panel():
     """Panel administrativo para visualizar métricas y datos del sistema."""
     st.title("🧑‍💼 Panel Administrativo - MIA")
@@ -817,11 +761,7 @@ def render_admin_panel():
     # ------------------------------
     st.subheader("📈 Actividad diaria")
 
-    conn = sqlite3.connect(DB_PATH)
-    df_metrics = pd.read_sql_query("SELECT * FROM metrics ORDER BY date DESC", conn)
-    df_appointments = pd.read_sql_query("SELECT * FROM appointments ORDER BY created_at DESC", conn)
-    df_cases = pd.read_sql_query("SELECT * FROM complex_cases ORDER BY created_at DESC", conn)
-    conn.close()
+    df_metrics, df_appointments, df_cases = load_admin_tables()
 
     if not df_metrics.empty:
         col1, col2, col3 = st.columns(3)
@@ -834,6 +774,184 @@ def render_admin_panel():
 
     st.markdown("---")
 
+    # ------------------------------
+    # LATENCIA (histogramas por hora)
+    # ------------------------------
+    st.subheader("⏱️ Latencia de respuesta")
+    col1, col2 = st.columns(2)
+    stage_names = {
+        "total": "Total", "classification": "Clasificación", "retrieval": "Recuperación",
+        "generation": "Generación", "db_write": "Escritura en BD", "ttft": "Primer fragmento",
+    }
+    stage = col1.selectbox("Etapa", STAGES, format_func=stage_names.get)
+    hours = col2.selectbox("Período", [24, 72, 168], format_func=lambda h: f"Últimas {h} h")
+    histograms = load_latency_histograms(hours)
+    trends = percentile_trends(histograms, stage)
+    if trends:
+        df_trends = pd.DataFrame(trends).set_index("hora")
+        st.line_chart(df_trends[["p50", "p90", "p99"]])
+        st.caption("Percentiles en ms estimados a partir de histogramas de buckets fijos.")
+    else:
+        st.info("Aún no hay latencias registradas para esta etapa.")
+    ttft = distribution(histograms, "ttft")
+    if sum(ttft):
+        st.markdown("**Distribución del tiempo hasta el primer fragmento**")
+        st.bar_chart(pd.DataFrame({"peticiones": ttft}, index=BUCKET_LABELS))
+
+    st.markdown("---")
+
+    # ------------------------------
+    # ESTADO DEL LLM
+    # ------------------------------
+    st.subheader("🤖 Estado del LLM")
+    try:
+        llm_stats = mia_service.llm_metrics()
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("Llamadas", llm_stats["calls"])
+        col2.metric("Espera en cola (prom.)", f"{llm_stats['queue_wait_avg_ms']:.0f} ms")
+        col3.metric("Aperturas del circuito", llm_stats["breaker_opens"])
+        col4.metric("Respuestas degradadas", llm_stats["degraded"])
+        st.caption(
+            f"Circuito: {llm_stats['breaker_state']} · reintentos: {llm_stats['retries']} · "
+            f"timeouts: {llm_stats['timeouts']} · espera máx.: {llm_stats['queue_wait_max_ms']:.0f} ms · "
+            f"consultas coalescidas: {llm_stats.get('coalesced', 0)} · "
+            f"respuestas FAQ: {llm_stats.get('faq_hits', 0)} ({llm_stats.get('faq_hit_rate', 0):.0%})"
+        )
+        st.caption(
+            f"Plazo vencido → ruteo por palabras clave: {llm_stats.get('degraded_keyword_routing', 0)} · "
+            f"respuesta en caché: {llm_stats.get('degraded_cached_answer', 0)} · "
+            f"pasajes textuales: {llm_stats.get('degraded_passages', 0)}"
+        )
+        st.caption(
+            f"Repreguntas: {llm_stats.get('follow_up_turns', 0)} "
+            f"({llm_stats.get('follow_up_hit_rate', 0):.0%} de los turnos informativos) · "
+            f"ruteo + recuperación: {llm_stats.get('follow_up_routing_avg_ms', 0):.0f} ms vs. "
+            f"{llm_stats.get('full_routing_avg_ms', 0):.0f} ms en turnos completos · "
+            f"ahorro acumulado: {llm_stats.get('follow_up_saved_ms', 0) / 1000:.1f} s"
+        )
+        st.caption(
+            f"Caché de embeddings de consultas: {llm_stats.get('query_cache_hit_rate', 0):.0%} de aciertos · "
+            f"{llm_stats.get('query_cache_entries', 0)} consultas "
+            f"({llm_stats.get('query_cache_bytes', 0) / 2**20:.1f} MiB) · "
+            f"codificación: {llm_stats.get('query_embed_avg_ms', 0):.0f} ms · "
+            f"ahorro acumulado: {llm_stats.get('query_cache_saved_ms', 0) / 1000:.1f} s"
+        )
+    except Exception as e:
+        st.info(f"Métricas del LLM no disponibles: {e}")
+
+    try:
+        tenant_stats = mia_service.tenant_metrics()
+    except Exception as e:
+        tenant_stats = []
+        st.info(f"Métricas de municipios no disponibles: {e}")
+    if tenant_stats:
+        st.markdown("**Índices de municipios en memoria**")
+        st.dataframe(pd.DataFrame(tenant_stats).set_index("tenant"), use_container_width=True)
+
+    try:
+        memory = mia_service.memory_report(session_states=[st.session_state])
+        st.markdown("**Memoria del proceso (MiB)**")
+        col1, col2, col3, col4, col5 = st.columns(5)
+        col1.metric("RSS", f"{memory['rss_mb']:.0f}")
+        col2.metric("Modelo", f"{memory['model_mb']:.0f}")
+        col3.metric("Índice", f"{memory['index_mb']:.0f}")
+        col4.metric("Docstore", f"{memory['docstore_mb']:.1f}")
+        col5.metric("Sesión actual", f"{memory['session_state_mb']:.2f}")
+    except Exception as e:
+        st.info(f"Reporte de memoria no disponible: {e}")
+
+    st.markdown("---")
+
+    # ------------------------------
+    # COLAS DE CASOS POR DEPARTAMENTO
+    # ------------------------------
+    st.subheader("🗂️ Colas de casos por departamento")
+    try:
+        overview = mia_service.dispatch_overview()
+    except Exception as e:
+        overview = []
+        st.info(f"Colas no disponibles: {e}")
+    if overview:
+        df_queues = pd.DataFrame(overview).set_index("departamento")
+        st.dataframe(df_queues, use_container_width=True)
+        st.bar_chart(df_queues[["pendientes"]])
+        col1, col2 = st.columns(2)
+        department = col1.selectbox("Departamento", list(df_queues.index))
+        officer = col2.text_input("Funcionario", value=st.session_state.get("citizen_name", ""))
+        if st.button("📥 Asignar siguiente caso") and officer:
+            case = mia_service.assign_next_case(department, officer)
+            if case:
+                st.success(f"Caso {case['id']} ({case['priority']}) asignado a {officer}")
+            else:
+                st.info("No hay casos pendientes en ese departamento.")
+    else:
+        st.info("No hay casos pendientes.")
+
+    st.markdown("---")
+
+    # ------------------------------
+    # COLA DE TRABAJOS (correos, webhooks, métricas)
+    # ------------------------------
+    st.subheader("📬 Cola de trabajos")
+    job_stats = queue_stats(DB_PATH)
+    if job_stats:
+        col1, col2, col3, col4 = st.columns(4)
+        col1.metric("En cola", job_stats.get("queued", 0))
+        col2.metric("Ejecutando", job_stats.get("running", 0))
+        col3.metric("Terminados", job_stats.get("done", 0))
+        col4.metric("Fallidos (dead letter)", job_stats.get("dead", 0))
+        failed = dead_letters(DB_PATH)
+        if failed:
+            st.dataframe(
+                pd.DataFrame(failed)[["id", "kind", "attempts", "last_error", "failed_at"]],
+                use_container_width=True,
+            )
+            retry_id = st.selectbox("Reencolar trabajo", [job["id"] for job in failed])
+            if st.button("🔁 Reintentar"):
+                requeue_dead(retry_id, DB_PATH)
+                st.rerun()
+    else:
+        st.info("La cola de trabajos aún no tiene datos.")
+
+    st.markdown("---")
+
+    # ------------------------------
+    # TIEMPO DE SERVIDOR POR RERUN
+    # ------------------------------
+    st.subheader("⏱️ Tiempo de servidor por interacción")
+    rerun_summary = get_rerun_profiler().summary()
+    if rerun_summary:
+        st.caption(
+            "Milisegundos del lado del servidor por ejecución del script "
+            f"(cacheo de recursos {'activado' if RERUN_CACHE else 'desactivado: MIA_RERUN_CACHE=0'})."
+        )
+        st.dataframe(pd.DataFrame(rerun_summary).round(1), use_container_width=True)
+    else:
+        st.info("Aún no hay reruns medidos en este proceso.")
+
+    st.markdown("---")
+
+    # ------------------------------
+    # PERFILADO DE PETICIONES
+    # ------------------------------
+    st.subheader("🔥 Perfilado de peticiones")
+    col1, col2 = st.columns(2)
+    profiler.enabled = col1.toggle("Perfilar peticiones de este proceso", value=profiler.enabled)
+    profiler.sample_rate = col2.slider(
+        "Fracción de peticiones perfiladas", 0.0, 1.0, float(profiler.sample_rate), 0.05
+    )
+    slowest = profiler.slowest(20)
+    if slowest:
+        st.caption(
+            f"Perfiles en {profiler.directory}: abrir los .speedscope.json en speedscope.app "
+            "o los .collapsed con flamegraph.pl."
+        )
+        st.dataframe(pd.DataFrame(slowest), use_container_width=True)
+    else:
+        st.info("No hay peticiones perfiladas todavía.")
+
+    st.markdown("---")
+
     # ------------------------------
     # TABLA DE CITAS
     # ------------------------------
@@ -892,26 +1010,35 @@ def render_admin_panel():
 
 
 # Mostrar login primero si no está autenticado
-if not st.session_state.get("logged_in", False):
-    render_login()
-else:
-    section = st.session_state.current_section
-    
-    if st.session_state.get("is_admin"):
-        render_admin_panel()
-        
+interaction = "login"
+try:
+    if not st.session_state.get("logged_in", False):
+        render_login()
     else:
-        if section == "mia_agent":
-            render_mia_agent()
-        elif section == "appointment_form":
-            render_appointment_form(st.session_state.pending_appointment)
-        elif section == "inicio":
-            st.header("🏛️ Bienvenido a MIA")
-            st.markdown("Selecciona una opción en el menú lateral para comenzar.")
-        
+        section = st.session_state.current_section
         
+        if st.session_state.get("is_admin"):
+            interaction = "admin"
+            render_admin_panel()
+            
         else:
-            st.warning("Sección no reconocida. Volviendo al chat principal.")
-            st.session_state.current_section = "mia_agent"
-            st.rerun()
+            interaction = section
+            if section == "mia_agent":
+                render_mia_agent()
+            elif section == "appointment_form":
+                render_appointment_form(st.session_state.pending_appointment)
+            elif section == "inicio":
+                st.header("🏛️ Bienvenido a MIA")
+                st.markdown("Selecciona una opción en el menú lateral para comenzar.")
+            
+            
+            else:
+                st.warning("Sección no reconocida. Volviendo al chat principal.")
+                st.session_state.current_section = "mia_agent"
+                st.rerun()
+finally:
+    # También se mide cuando st.rerun()/st.stop() cortan la ejecución
+    run = timer.finish(interaction)
+    if run and os.getenv("MIA_PROFILE_RERUNS") == "1":
+        st.caption(f"⏱️ {run['total_ms']:.0f} ms de servidor en este rerun")
 
@@ -3,15 +3,52 @@
 Sistema de gestión de citas y derivación de casos complejos
 """
 
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+import asyncio
+from datetime import date as Date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 from enum import Enum
+from functools import lru_cache
 import json
+import sqlite3
+import time
+import uuid
 from dataclasses import dataclass, asdict
-from chain import classify_intent, generate_response_from_llm
-from memory import memory # Necesario para cargar el historial de chat
+from chain import (
+    CANNED_ANSWER,
+    answer_from_faq,
+    cached_answer,
+    classify_intent,
+    classify_intents,
+    generate_response_from_llm,
+    generate_responses_batch,
+    stream_response_from_llm,
+)
+from vector_db import similarity_search_many
+from memory import memory_for # Necesario para cargar el historial de chat
+from tenants import DEFAULT_TENANT
+from database import DB_PATH, get_connection, insert_cases, transaction
+from registries import AppointmentRegistry, CaseRegistry
+from keyword_matcher import KeywordMatcher
+from slot_store import SlotStore, DEFAULT_OFFICE
+from slot_calendar import SlotCalendar, slots_for_procedure
+from case_queues import DispatchQueues
+from single_flight import SingleFlight, query_key
+from request_profiler import profiler
+from latency_metrics import latency
+from deadline import Deadline
+from follow_up import FollowUpTracker, Turn, new_terms
 from typing import Dict, List, Optional, Tuple # Ya deberías tener este
 
+def _read_rows(db_path: str, query: str, params: tuple = ()) -> List[tuple]:
+    """Lee filas de SQLite; lista vacía si las tablas aún no existen"""
+    conn = get_connection(db_path)
+    try:
+        return conn.execute(query, params).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
 class CaseType(Enum):
     """Tipos de casos que el sistema puede manejar"""
     SIMPLE_INFO = "simple_info"  # Solo información (no requiere cita)
@@ -28,7 +65,7 @@ class DepartmentType(Enum):
     COMPLAINTS = "Departamento de Quejas"
     SPECIAL_CASES = "Casos Especiales"
 
-@dataclass
+@dataclass(slots=True)
 class Appointment:
     """Modelo para citas"""
     id: str
@@ -42,7 +79,7 @@ class Appointment:
     created_at: str
     notes: str = ""
 
-@dataclass
+@dataclass(slots=True)
 class ComplexCase:
     """Modelo para casos complejos"""
     id: str
@@ -56,35 +93,44 @@ class ComplexCase:
     created_at: str
     assigned_to: Optional[str] = None
     notes: str = ""
+    assigned_at: Optional[str] = None
+
+def _parse_date(date: str) -> Optional[Date]:
+    """Fecha ISO (AAAA-MM-DD) o None si está mal formada"""
+    try:
+        return Date.fromisoformat(date)
+    except (TypeError, ValueError):
+        return None
+
 
 class AppointmentManager:
     """Gestiona citas y disponibilidad"""
     
-    def __init__(self):
-        self.appointments: List[Appointment] = []
-        self.availability = self._init_availability()
-    
-    def _init_availability(self) -> Dict:
-        """Inicializa disponibilidad de citas (próximas 30 días)"""
-        availability = {}
-        today = datetime.now()
-        
-        for i in range(1, 31):
-            date = today + timedelta(days=i)
-            # Saltar fines de semana
-            if date.weekday() < 5:  # 0-4 son lunes a viernes
-                date_str = date.strftime("%Y-%m-%d")
-                availability[date_str] = {
-                    "09:00": True, "09:30": True, "10:00": True, "10:30": True,
-                    "11:00": True, "11:30": True, "14:00": True, "14:30": True,
-                    "15:00": True, "15:30": True, "16:00": True, "16:30": True
-                }
-        
-        return availability
+    def __init__(self, db_path: str = DB_PATH, office: str = DEFAULT_OFFICE, **calendar_options):
+        self.db_path = db_path
+        self.appointments = AppointmentRegistry()
+        self.slot_store = SlotStore(db_path=db_path, office=office)
+        # Disponibilidad como bitset por día (ventana móvil de seis meses)
+        self.calendar = SlotCalendar(self.slot_store, **calendar_options)
     
     def get_available_slots(self, date: str) -> Dict[str, bool]:
         """Obtiene slots disponibles para una fecha"""
-        return self.availability.get(date, {})
+        day = _parse_date(date)
+        return self.calendar.day_slots(day) if day else {}
+    
+    def get_available_dates(self, procedure: str = "", limit: Optional[int] = None) -> List[Date]:
+        """Fechas con al menos un turno libre para el trámite"""
+        return self.calendar.available_dates(slots_for_procedure(procedure), limit=limit)
+    
+    def get_start_times(self, date: str, procedure: str = "") -> List[str]:
+        """Horarios en los que puede empezar el trámite en esa fecha"""
+        day = _parse_date(date)
+        return self.calendar.start_times(day, slots_for_procedure(procedure)) if day else []
+    
+    def next_free_slots(self, procedure: str = "", from_date: Optional[str] = None, n: int = 5) -> List[Tuple[str, str]]:
+        """Próximos n turnos (fecha, hora) disponibles para el trámite"""
+        start = _parse_date(from_date) if from_date else None
+        return self.calendar.next_free_slots(slots_for_procedure(procedure), start, n)
     
     def schedule_appointment(
         self, 
@@ -101,14 +147,22 @@ class AppointmentManager:
         Returns: (success, message, appointment_object)
         """
         # Validar disponibilidad
-        if date not in self.availability:
+        day = _parse_date(date)
+        if day is None or not self.calendar.day_slots(day):
             return False, f"La fecha {date} no está disponible", None
         
-        if not self.availability[date].get(time, False):
+        times = self.calendar.slot_times_from(time, slots_for_procedure(procedure))
+        if not times or time not in self.calendar.start_times(day, len(times)):
             return False, f"El horario {time} no está disponible para {date}", None
         
-        # Crear cita
+        # Reservar los turnos de forma atómica (otra sesión pudo tomarlos antes)
         appointment_id = f"APT_{citizen_id}_{datetime.now().timestamp()}"
+        if not self.slot_store.book_many(date, times, appointment_id):
+            self.calendar.refresh()
+            return False, f"El horario {time} no está disponible para {date}", None
+        self.calendar.mark_booked(day, times)
+        
+        # Crear cita
         appointment = Appointment(
             id=appointment_id,
             citizen_id=citizen_id,
@@ -122,74 +176,117 @@ class AppointmentManager:
             notes=notes
         )
         
-        # Marcar como no disponible
-        self.availability[date][time] = False
-        self.appointments.append(appointment)
+        self.appointments.add(appointment)
         
         message = f"✓ Cita programada para {date} a las {time}. ID: {appointment_id}"
         return True, message, appointment
     
     def cancel_appointment(self, appointment_id: str) -> Tuple[bool, str]:
         """Cancela una cita"""
-        for apt in self.appointments:
-            if apt.id == appointment_id:
-                # Liberar slot
-                self.availability[apt.date][apt.time] = True
-                apt.status = "cancelled"
-                return True, f"Cita {appointment_id} cancelada exitosamente"
-        
+        # Liberar slot (funciona aunque la cita se haya creado en otro proceso)
+        released = self.slot_store.release(appointment_id)
+        for date, time in released:
+            self.calendar.mark_booked(Date.fromisoformat(date), [time], booked=False)
+        if self.appointments.update(appointment_id, status="cancelled") or released:
+            return True, f"Cita {appointment_id} cancelada exitosamente"
         return False, f"No se encontró la cita {appointment_id}"
 
+    def load_from_db(self) -> int:
+        """Recarga las citas guardadas en SQLite. Returns: cantidad cargada"""
+        rows = _read_rows(self.db_path, """
+            SELECT a.id, COALESCE(c.id, ''), COALESCE(c.name, ''), a.citizen_email,
+                   a.procedure, a.date, a.time, a.status, a.created_at, COALESCE(a.notes, '')
+            FROM appointments a LEFT JOIN citizens c ON c.email = a.citizen_email
+        """)
+        for row in rows:
+            self.appointments.add(Appointment(
+                id=row[0], citizen_id=str(row[1]), citizen_name=row[2], citizen_email=row[3],
+                procedure=row[4], date=row[5], time=row[6], status=row[7],
+                created_at=row[8], notes=row[9]
+            ))
+        return len(rows)
+
+# Palabras clave para clasificar casos
+CASE_KEYWORDS = {
+    "appointment": [
+        "cita", "agendar", "horario", "disponibilidad", 
+        "cuando", "reservar", "programar"
+    ],
+    "documentation": [
+        "certificado", "documento", "DNI", "pasaporte", 
+        "cédula", "expediente", "registro"
+    ],
+    "vital_records": [
+        "nacimiento", "matrimonio", "defunción", "divorcio",
+        "registro civil", "partida", "acta"
+    ],
+    "permits": [
+        "licencia", "permiso", "autorización", "trámite especial",
+        "comercial", "construcción"
+    ],
+    "legal": [
+        "demanda", "ley", "derecho", "conflicto", "recurso",
+        "apelación", "procedimiento legal"
+    ],
+    "complaints": [
+        "queja", "reclamo", "problema", "mal servicio",
+        "denuncia", "irregularidad"
+    ]
+}
+
+PRIORITY_KEYWORDS = {
+    # Palabras clave para CASOS ALTAMENTE CRÍTICOS (Riesgo, Emergencia)
+    "priority_high": [
+        "urgente", "emergencia", "grave", "crítico", "inmediato", 
+        "violación", "peligro", "inaceptable"
+    ],
+    # Palabras clave para DEMORAS SIGNIFICATIVAS O TEMAS IMPORTANTES
+    "priority_medium": [
+        "demora", "retraso", "seis meses", "tres meses", "meses", 
+        "mucho tiempo", "importante", "pronto", "necesito respuesta"
+    ]
+}
+
+# Categoría de palabras clave -> departamento (en orden de precedencia)
+DEPARTMENT_CATEGORIES = {
+    "documentation": DepartmentType.DOCUMENTATION,
+    "vital_records": DepartmentType.VITAL_RECORDS,
+    "permits": DepartmentType.PERMITS,
+    "legal": DepartmentType.LEGAL,
+    "complaints": DepartmentType.COMPLAINTS,
+}
+
+@lru_cache(maxsize=1)
+def get_keyword_matcher() -> KeywordMatcher:
+    """Matcher compilado una sola vez por proceso con todas las tablas"""
+    return KeywordMatcher({**CASE_KEYWORDS, **PRIORITY_KEYWORDS})
+
 class CaseRouter:
     """Clasifica casos y los deriva al departamento correspondiente"""
     
-    def __init__(self):
-        self.complex_cases: List[ComplexCase] = []
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+        self.complex_cases = CaseRegistry()
+        # Casos pendientes por departamento en SQLite, por prioridad con envejecimiento
+        self.dispatch = DispatchQueues(db_path)
         self.case_keywords = self._init_keywords()
+        self.matcher = get_keyword_matcher()
     
     def _init_keywords(self) -> Dict[str, List[str]]:
         """Palabras clave para clasificar casos"""
-        return {
-            "appointment": [
-                "cita", "agendar", "horario", "disponibilidad", 
-                "cuando", "reservar", "programar"
-            ],
-            "documentation": [
-                "certificado", "documento", "DNI", "pasaporte", 
-                "cédula", "expediente", "registro"
-            ],
-            "vital_records": [
-                "nacimiento", "matrimonio", "defunción", "divorcio",
-                "registro civil", "partida", "acta"
-            ],
-            "permits": [
-                "licencia", "permiso", "autorización", "trámite especial",
-                "comercial", "construcción"
-            ],
-            "legal": [
-                "demanda", "ley", "derecho", "conflicto", "recurso",
-                "apelación", "procedimiento legal"
-            ],
-            "complaints": [
-                "queja", "reclamo", "problema", "mal servicio",
-                "denuncia", "irregularidad"
-            ]
-        }
+        return CASE_KEYWORDS
     
     def classify_case(self, query: str, conversation_context: List[Dict]) -> CaseType:
         """
         Clasifica el tipo de caso basado en la consulta y contexto
         """
-        query_lower = query.lower()
+        categories = self.matcher.categories(query)
         
         # Lógica de clasificación
-        if any(keyword in query_lower for keyword in self.case_keywords["appointment"]):
+        if "appointment" in categories:
             return CaseType.APPOINTMENT
         
-        elif any(keyword in query_lower for keyword in self.case_keywords["legal"]):
-            return CaseType.COMPLEX_CASE
-        
-        elif any(keyword in query_lower for keyword in self.case_keywords["complaints"]):
+        elif "legal" in categories or "complaints" in categories:
             return CaseType.COMPLEX_CASE
         
         elif len(conversation_context) > 10:  # Conversación larga = caso complejo
@@ -202,20 +299,18 @@ class CaseRouter:
         """
         Determina a qué departamento derivar basado en la consulta
         """
-        query_lower = query.lower()
-        
-        dept_mapping = {
-            DepartmentType.DOCUMENTATION: self.case_keywords["documentation"],
-            DepartmentType.VITAL_RECORDS: self.case_keywords["vital_records"],
-            DepartmentType.PERMITS: self.case_keywords["permits"],
-            DepartmentType.LEGAL: self.case_keywords["legal"],
-            DepartmentType.COMPLAINTS: self.case_keywords["complaints"],
-        }
-        
-        for department, keywords in dept_mapping.items():
-            if any(keyword in query_lower for keyword in keywords):
+        return self._department_for(self.matcher.categories(query))
+    
+    def route_many(self, descriptions: Iterable[str]) -> List[DepartmentType]:
+        """Deriva en lote (ej. un backlog de miles de descripciones)"""
+        return [self._department_for(categories) for categories in self.matcher.find_many(descriptions)]
+    
+    @staticmethod
+    def _department_for(categories: Set[str]) -> DepartmentType:
+        # El orden de DEPARTMENT_CATEGORIES define la precedencia
+        for category, department in DEPARTMENT_CATEGORIES.items():
+            if category in categories:
                 return department
-        
         return DepartmentType.SPECIAL_CASES
     
     def create_complex_case(
@@ -227,11 +322,13 @@ class CaseRouter:
         priority: str = "medium"
     ) -> Tuple[bool, str, Optional[ComplexCase]]:
         """
-        Crea un caso complejo y lo deriva al departamento apropiado
+        Crea un caso complejo y lo deriva al departamento apropiado. Entra
+        en la cola de despacho cuando el llamador lo guarda (insert_cases).
         """
         department = self.route_to_department(description)
         
-        case_id = f"CASE_{citizen_id}_{datetime.now().timestamp()}"
+        # Sufijo aleatorio: en lotes se crean varios casos en el mismo microsegundo
+        case_id = f"CASE_{citizen_id}_{datetime.now().timestamp()}_{uuid.uuid4().hex[:6]}"
         complex_case = ComplexCase(
             id=case_id,
             citizen_id=citizen_id,
@@ -244,7 +341,7 @@ class CaseRouter:
             created_at=datetime.now().isoformat()
         )
         
-        self.complex_cases.append(complex_case)
+        self.complex_cases.add(complex_case)
         
         message = (
             f"✓ Caso derivado al {department.value}\n"
@@ -255,28 +352,123 @@ class CaseRouter:
         
         return True, message, complex_case
     
+    def discard_cases(self, case_ids: Iterable[str]) -> None:
+        """Olvida casos creados en memoria cuya escritura en SQLite falló"""
+        for case_id in case_ids:
+            self.complex_cases.remove(case_id)
+    
     def get_case_status(self, case_id: str) -> Optional[ComplexCase]:
         """Obtiene el estado de un caso complejo"""
-        for case in self.complex_cases:
-            if case.id == case_id:
-                return case
-        return None
+        return self.complex_cases.get(case_id)
     
     def update_case_status(self, case_id: str, new_status: str) -> Tuple[bool, str]:
-        """Actualiza el estado de un caso"""
-        for case in self.complex_cases:
-            if case.id == case_id:
-                case.status = new_status
-                return True, f"Caso {case_id} actualizado a {new_status}"
+        """Actualiza el estado de un caso (también en SQLite: la cola de despacho sale de ahí)"""
+        case = self.complex_cases.update(case_id, status=new_status)
+        with transaction(self.db_path) as conn:
+            updated = conn.execute(
+                "UPDATE complex_cases SET status = ? WHERE id = ?", (new_status, case_id)
+            ).rowcount
+        if case or updated:
+            return True, f"Caso {case_id} actualizado a {new_status}"
         return False, f"Caso {case_id} no encontrado"
+    
+    # ------------------------------------------------------------------
+    # Asignación a funcionarios (ver case_queues.py)
+    # ------------------------------------------------------------------
+    def assign_next_case(self, department: DepartmentType, officer: str) -> Optional[ComplexCase]:
+        """Asigna al funcionario el siguiente caso de la cola de su departamento"""
+        case_id = self.dispatch.assign_next(department, officer)
+        return self._mark_assigned(case_id, officer) if case_id else None
+    
+    def assign_case(self, case_id: str, officer: str) -> Tuple[bool, str]:
+        """Asigna un caso concreto a un funcionario"""
+        if not self.dispatch.assign(case_id, officer):
+            return False, f"El caso {case_id} no está pendiente"
+        self._mark_assigned(case_id, officer)
+        return True, f"Caso {case_id} asignado a {officer}"
+    
+    def release_case(self, case_id: str) -> Tuple[bool, str]:
+        """Devuelve un caso asignado (por cualquier proceso) a la cola de su departamento"""
+        if not self.dispatch.release(case_id):
+            return False, f"El caso {case_id} no está asignado"
+        self.complex_cases.update(case_id, status="pending", assigned_to=None, assigned_at=None)
+        return True, f"Caso {case_id} devuelto a la cola"
+    
+    def _mark_assigned(self, case_id: str, officer: str) -> Optional[ComplexCase]:
+        case = self.complex_cases.update(
+            case_id, status="assigned", assigned_to=officer, assigned_at=datetime.now().isoformat()
+        )
+        if case is None:
+            # Lo creó otro proceso: se lee de SQLite (ya con la asignación)
+            case = self._load_cases("WHERE k.id = ?", (case_id,))
+            case = case[0] if case else None
+        return case
+    
+    def _load_cases(self, where: str = "", params: tuple = ()) -> List[ComplexCase]:
+        """Lee casos de SQLite y los agrega al registro"""
+        rows = _read_rows(self.db_path, f"""
+            SELECT k.id, COALESCE(c.id, ''), COALESCE(c.name, ''), k.citizen_email,
+                   k.description, k.department, k.priority, k.status, k.created_at,
+                   k.assigned_to, k.assigned_at
+            FROM complex_cases k LEFT JOIN citizens c ON c.email = k.citizen_email
+            {where}
+        """, params)
+        cases = []
+        for row in rows:
+            # La base guarda el nombre del Enum (ej. "LEGAL")
+            department = DepartmentType.__members__.get(row[5], DepartmentType.SPECIAL_CASES)
+            case = ComplexCase(
+                id=row[0], citizen_id=str(row[1]), citizen_name=row[2], citizen_email=row[3],
+                description=row[4], department=department, priority=row[6],
+                status=row[7], created_at=row[8], assigned_to=row[9], assigned_at=row[10]
+            )
+            self.complex_cases.add(case)
+            cases.append(case)
+        return cases
+    
+    def load_from_db(self) -> int:
+        """Recarga los casos complejos guardados en SQLite. Returns: cantidad cargada"""
+        return len(self._load_cases())
+
+# Respuesta degradada: cuántos pasajes recuperados se muestran y su largo máximo
+DEGRADED_PASSAGES = 2
+DEGRADED_PASSAGE_CHARS = 600
+# Repreguntas: documentos nuevos por búsqueda incremental y tope acumulado
+FOLLOW_UP_EXTRA_DOCUMENTS = 2
+FOLLOW_UP_MAX_DOCUMENTS = 8
+
 
 class QueryProcessor:
     """Procesa consultas y determina la acción correspondiente"""
     
-    def __init__(self):
-        self.appointment_manager = AppointmentManager()
-        self.case_router = CaseRouter()
+    def __init__(
+        self,
+        db_path: str = DB_PATH,
+        persona: str = "",
+        office: str = DEFAULT_OFFICE,
+        use_faq: bool = True,
+        tenant_id: str = DEFAULT_TENANT,
+    ):
+        """
+        tenant_id / persona / office / use_faq: los de un municipio (ver
+        tenants.py). El historial de chat y la caché de respuestas se separan
+        por tenant_id. Las FAQ precalculadas son del corpus por defecto, así
+        que los demás municipios no las usan.
+        """
+        self.tenant_id = tenant_id
+        self.persona = persona
+        self.use_faq = use_faq
+        self.appointment_manager = AppointmentManager(db_path=db_path, office=office)
+        self.case_router = CaseRouter(db_path=db_path)
+        # Consultas idénticas simultáneas comparten una sola llamada al LLM
+        self.single_flight = SingleFlight()
+        # Último turno informativo de cada ciudadano, para las repreguntas
+        self.follow_ups = FollowUpTracker()
+        # Recuperar citas y casos de ejecuciones anteriores
+        self.appointment_manager.load_from_db()
+        self.case_router.load_from_db()
     
+    @profiler.wrap("process_query")
     def process_query(
         self,
         query: str,
@@ -284,17 +476,381 @@ class QueryProcessor:
         citizen_id: str,
         citizen_name: str,
         citizen_email: str,
+        stream: bool = False,
+        deadline: Optional[Deadline] = None,
+        session_id: str = "",
     ) -> Dict:
         """
         Procesa la consulta del usuario y determina si necesita:
         1. Solo información (RAG response)
         2. Cita (appointment)
         3. Derivación (complex case)
+        4. Repregunta sobre el turno informativo anterior (follow-up): hereda
+           trámite y documentos, sin clasificar de nuevo
+        Con stream=True, la respuesta informativa es un iterador de fragmentos.
+        Con un deadline, las etapas que no entran en el tiempo restante se
+        degradan (ver deadline.py) y response["degraded"] lo indica.
+        Las repreguntas se siguen por session_id (conversación); sin él no
+        se detectan.
         """
-        
+        deadline = deadline or Deadline.unbounded()
+        
+        # Preguntas frecuentes: respuesta precalculada, sin clasificar ni llamar al LLM
+        faq = self._faq_answer(query)
+        if faq is not None:
+            return self._faq_response(faq)
+        
+        routing_started = time.perf_counter()
+        turn = self._follow_up_turn(session_id, query)
+        if turn is not None:
+            response_data = self._follow_up_response(turn, deadline)
+            with latency.timed("retrieval"):
+                documents_retrieved = self._follow_up_documents(turn, query, docsearch)
+            self._remember_follow_up(session_id, turn, query, documents_retrieved, routing_started)
+            return self._answer_information(
+                response_data, f"{turn.procedure_name}: {query}", documents_retrieved, deadline, stream
+            )
         
         #case_type = self.case_router.classify_case(query, conversation_context)
-        intent_result = classify_intent(query)
+        with latency.timed("classification"):
+            if deadline.allows("classification", "retrieval", "generation"):
+                intent_result = self.single_flight.do(
+                    "intent:" + query_key(query),
+                    lambda: classify_intent(
+                        query,
+                        # Sin tocar el presupuesto de las etapas siguientes
+                        deadline=deadline.monotonic_deadline("retrieval", "generation"),
+                        fallback=lambda: self._keyword_intent(query, deadline),
+                    ),
+                    degraded=deadline.degraded_from_now(),
+                )
+            else:
+                intent_result = self._keyword_intent(query, deadline)
+        case_type, procedure_name = self._parse_intent(intent_result)
+        response_data = self._new_response(case_type, procedure_name, deadline)
+        
+        # Si es solo información, devolver respuesta RAG
+        if case_type == CaseType.SIMPLE_INFO:
+            response_data["actions"].append("provide_information")
+            if self._answer_from_cache(response_data, query, deadline):
+                return response_data
+            # --- NUEVA LÓGICA DE EJECUCIÓN RAG ---
+            # 1. Recuperar documentos
+            with latency.timed("retrieval"):
+                documents_retrieved = docsearch.as_retriever().get_relevant_documents(query)
+            self._remember_turn(session_id, query, case_type, procedure_name, documents_retrieved, routing_started)
+            # 2. y 3. Generar la respuesta (o degradarla si no hay tiempo)
+            return self._answer_information(response_data, query, documents_retrieved, deadline, stream)
+            # ------------------------------------
+        elif case_type == CaseType.APPOINTMENT:
+            # Retornamos inmediatamente para que new_app.py redirija al formulario
+            return self._offer_appointment(response_data, procedure_name)
+    
+        elif case_type == CaseType.COMPLEX_CASE:
+            return self._derive_complex_case(
+                response_data, query, citizen_id, citizen_name, citizen_email
+            )
+            
+        return response_data
+    
+    def _answer_information(
+        self,
+        response_data: Dict,
+        question: str,
+        documents_retrieved: List,
+        deadline: Deadline,
+        stream: bool,
+    ) -> Dict:
+        """Genera la respuesta RAG (o los pasajes textuales si no alcanza el tiempo)"""
+        if not deadline.allows("generation"):
+            deadline.degrade("passages")
+            response_data['primary_response'] = self._passages_answer(documents_retrieved)
+            return response_data
+        
+        # Cargar contexto (memoria del municipio)
+        context = memory_for(self.tenant_id).load_memory_variables({})['chat_history']
+        
+        # Ejecutar la función RAG (compartida con consultas idénticas en curso)
+        key = "answer:" + query_key(question, documents_retrieved)
+        generation = dict(
+            deadline=deadline.monotonic_deadline(),
+            fallback=lambda: self._generation_fallback(question, documents_retrieved, deadline),
+            tenant=self.tenant_id,
+            persona=self.persona,
+        )
+        if stream:
+            response_data['primary_response'] = latency.timed_stream(
+                "generation",
+                self.single_flight.do_stream(
+                    key,
+                    lambda: stream_response_from_llm(question, context, documents_retrieved, **generation),
+                    degraded=deadline.degraded_from_now(),
+                ),
+            )
+        else:
+            with latency.timed("generation"):
+                response_data['primary_response'] = self.single_flight.do(
+                    key,
+                    lambda: generate_response_from_llm(question, context, documents_retrieved, **generation),
+                    degraded=deadline.degraded_from_now(),
+                )
+        return response_data
+    
+    async def aprocess_query(
+        self,
+        query: str,
+        docsearch,
+        citizen_id: str,
+        citizen_name: str,
+        citizen_email: str,
+        deadline: Optional[Deadline] = None,
+        session_id: str = "",
+    ) -> Dict:
+        """
+        Versión asíncrona de process_query (sin streaming). Las llamadas
+        bloqueantes corren en hilos y las consultas idénticas en curso se
+        coalescen igual que en la versión síncrona; el deadline y las
+        repreguntas se tratan igual.
+        """
+        deadline = deadline or Deadline.unbounded()
+        faq = await asyncio.to_thread(self._faq_answer, query)
+        if faq is not None:
+            return self._faq_response(faq)
+        
+        routing_started = time.perf_counter()
+        turn = self._follow_up_turn(session_id, query)
+        if turn is not None:
+            response_data = self._follow_up_response(turn, deadline)
+            with latency.timed("retrieval"):
+                documents_retrieved = await asyncio.to_thread(
+                    self._follow_up_documents, turn, query, docsearch
+                )
+            self._remember_follow_up(session_id, turn, query, documents_retrieved, routing_started)
+            return await self._aanswer_information(
+                response_data, f"{turn.procedure_name}: {query}", documents_retrieved, deadline
+            )
+        
+        with latency.timed("classification"):
+            if deadline.allows("classification", "retrieval", "generation"):
+                intent_result = await self.single_flight.do_async(
+                    "intent:" + query_key(query),
+                    lambda: asyncio.to_thread(
+                        classify_intent,
+                        query,
+                        deadline=deadline.monotonic_deadline("retrieval", "generation"),
+                        fallback=lambda: self._keyword_intent(query, deadline),
+                    ),
+                    degraded=deadline.degraded_from_now(),
+                )
+            else:
+                intent_result = self._keyword_intent(query, deadline)
+        case_type, procedure_name = self._parse_intent(intent_result)
+        response_data = self._new_response(case_type, procedure_name, deadline)
+        
+        if case_type == CaseType.SIMPLE_INFO:
+            response_data["actions"].append("provide_information")
+            if self._answer_from_cache(response_data, query, deadline):
+                return response_data
+            with latency.timed("retrieval"):
+                documents_retrieved = await asyncio.to_thread(
+                    docsearch.as_retriever().get_relevant_documents, query
+                )
+            self._remember_turn(session_id, query, case_type, procedure_name, documents_retrieved, routing_started)
+            return await self._aanswer_information(response_data, query, documents_retrieved, deadline)
+        elif case_type == CaseType.APPOINTMENT:
+            return self._offer_appointment(response_data, procedure_name)
+        elif case_type == CaseType.COMPLEX_CASE:
+            return self._derive_complex_case(
+                response_data, query, citizen_id, citizen_name, citizen_email
+            )
+        return response_data
+    
+    async def _aanswer_information(
+        self,
+        response_data: Dict,
+        question: str,
+        documents_retrieved: List,
+        deadline: Deadline,
+    ) -> Dict:
+        """Versión asíncrona de _answer_information (sin streaming)"""
+        if not deadline.allows("generation"):
+            deadline.degrade("passages")
+            response_data['primary_response'] = self._passages_answer(documents_retrieved)
+            return response_data
+        context = memory_for(self.tenant_id).load_memory_variables({})['chat_history']
+        with latency.timed("generation"):
+            response_data['primary_response'] = await self.single_flight.do_async(
+                "answer:" + query_key(question, documents_retrieved),
+                lambda: asyncio.to_thread(
+                    generate_response_from_llm, question, context, documents_retrieved,
+                    deadline=deadline.monotonic_deadline(),
+                    fallback=lambda: self._generation_fallback(question, documents_retrieved, deadline),
+                    tenant=self.tenant_id,
+                    persona=self.persona,
+                ),
+                degraded=deadline.degraded_from_now(),
+            )
+        return response_data
+    
+    # ------------------------------------------------------------------
+    # Repreguntas (ver follow_up.py)
+    # ------------------------------------------------------------------
+    def _follow_up_turn(self, session_id: str, query: str) -> Optional[Turn]:
+        """Turno anterior a continuar, salvo que la consulta pida un turno o un reclamo"""
+        turn = self.follow_ups.match(session_id, query)
+        if turn is None or self.case_router.classify_case(query, []) != CaseType.SIMPLE_INFO:
+            return None
+        return turn
+    
+    def _follow_up_response(self, turn: Turn, deadline: Deadline) -> Dict:
+        response_data = self._new_response(CaseType.FOLLOW_UP, turn.procedure_name, deadline)
+        response_data["actions"].append("provide_information")
+        response_data["follow_up_of"] = turn.case_type
+        return response_data
+    
+    def _follow_up_documents(self, turn: Turn, query: str, docsearch) -> List:
+        """Documentos del turno anterior más una búsqueda solo con los términos nuevos"""
+        terms = new_terms(query, turn.query)
+        if not terms:
+            return list(turn.documents)
+        retriever = docsearch.as_retriever(search_kwargs={"k": FOLLOW_UP_EXTRA_DOCUMENTS})
+        extra = retriever.get_relevant_documents(f"{turn.procedure_name} {' '.join(terms)}")
+        seen = {doc.page_content for doc in turn.documents}
+        return list(turn.documents) + [doc for doc in extra if doc.page_content not in seen]
+    
+    def _remember_turn(
+        self,
+        session_id: str,
+        query: str,
+        case_type: CaseType,
+        procedure_name: str,
+        documents: List,
+        routing_started: float,
+    ) -> None:
+        self.follow_ups.record("full", (time.perf_counter() - routing_started) * 1000)
+        self.follow_ups.remember(session_id, Turn(query, case_type.value, procedure_name, documents))
+    
+    def _remember_follow_up(
+        self, session_id: str, turn: Turn, query: str, documents: List, routing_started: float
+    ) -> None:
+        self.follow_ups.record("follow_up", (time.perf_counter() - routing_started) * 1000)
+        # La conversación sigue: los términos de esta repregunta ya no son nuevos
+        self.follow_ups.remember(session_id, Turn(
+            f"{turn.query} {query}", turn.case_type, turn.procedure_name,
+            documents[:FOLLOW_UP_MAX_DOCUMENTS],
+        ))
+    
+    def process_batch(
+        self,
+        queries: List,
+        docsearch,
+        max_concurrency: int = 8,
+        chunk_size: int = 256,
+    ) -> List[Dict]:
+        """
+        Procesa un lote de consultas (bandeja de correos / formularios web).
+        Cada elemento es un texto o un dict con "query" y los datos del
+        ciudadano ("citizen_id", "citizen_name", "citizen_email").
+        
+        - La clasificación y la generación usan Runnable.batch con
+          concurrencia acotada.
+        - Las consultas informativas se embeben en una sola llamada y se
+          buscan en FAISS con una única búsqueda multi-consulta.
+        - Los casos complejos se guardan en SQLite en una sola transacción.
+        
+        Returns: un resultado por consulta, en el mismo orden. Si un elemento
+        falla, su resultado lleva "error" y el resto del lote continúa.
+        """
+        results: List[Dict] = []
+        # Procesar por bloques para acotar la memoria en lotes de decenas de miles
+        for start in range(0, len(queries), chunk_size):
+            results.extend(self._process_chunk(
+                queries[start:start + chunk_size], docsearch, max_concurrency
+            ))
+        return results
+    
+    def _process_chunk(self, items: List, docsearch, max_concurrency: int) -> List[Dict]:
+        items = [{"query": item} if isinstance(item, str) else item for item in items]
+        results: List[Dict] = [None] * len(items)
+        texts: Dict[int, str] = {}
+        
+        # 0. Preguntas frecuentes: respuesta precalculada
+        pending = []
+        for i, item in enumerate(items):
+            text = item.get("query") if isinstance(item, dict) else None
+            if not isinstance(text, str):
+                # Un elemento mal formado no tumba el lote
+                results[i] = {"error": "El elemento no tiene una consulta de texto"}
+                continue
+            texts[i] = text
+            faq = self._faq_answer(text)
+            if faq is not None:
+                results[i] = self._faq_response(faq)
+            else:
+                pending.append(i)
+        
+        # 1. Clasificación en lote
+        intents = classify_intents([texts[i] for i in pending], max_concurrency=max_concurrency)
+        
+        info_positions = []
+        new_cases = []
+        for i, intent_result in zip(pending, intents):
+            item = items[i]
+            try:
+                case_type, procedure_name = self._parse_intent(intent_result)
+                response_data = self._new_response(case_type, procedure_name)
+                if case_type == CaseType.APPOINTMENT:
+                    self._offer_appointment(response_data, procedure_name)
+                elif case_type == CaseType.COMPLEX_CASE:
+                    self._derive_complex_case(
+                        response_data,
+                        texts[i],
+                        item.get("citizen_id", ""),
+                        item.get("citizen_name", ""),
+                        item.get("citizen_email", ""),
+                    )
+                    new_cases.append(response_data["case"])
+                else:
+                    response_data["actions"].append("provide_information")
+                    info_positions.append(i)
+                results[i] = response_data
+            except Exception as e:
+                results[i] = {"error": str(e)}
+        
+        # 2. Consultas informativas: un embedding en lote, una búsqueda FAISS y generación en lote
+        if info_positions:
+            info_queries = [texts[i] for i in info_positions]
+            try:
+                documents_list = similarity_search_many(docsearch, info_queries)
+                answers = generate_responses_batch(
+                    info_queries, documents_list, max_concurrency=max_concurrency,
+                    tenant=self.tenant_id, persona=self.persona,
+                )
+            except Exception as e:
+                answers = [e] * len(info_positions)
+            for i, answer in zip(info_positions, answers):
+                if isinstance(answer, Exception):
+                    results[i]["error"] = str(answer)
+                else:
+                    results[i]["primary_response"] = answer
+        
+        # 3. Casos complejos: una sola transacción
+        if new_cases:
+            try:
+                insert_cases(new_cases, self.case_router.db_path)
+            except Exception as e:
+                # Sin fila en SQLite el caso no existe: se saca del registro y de las colas
+                self.case_router.discard_cases(case["id"] for case in new_cases)
+                for result in results:
+                    if result.get("case") in new_cases:
+                        result["error"] = f"No se pudo guardar el caso: {e}"
+        
+        for i, result in enumerate(results):
+            result["query"] = texts.get(i)
+        return results
+    
+    def _parse_intent(self, intent_result: Dict) -> Tuple[CaseType, str]:
+        """Convierte la salida del clasificador en (CaseType, nombre del trámite)"""
         case_type_str = intent_result.get("case_type", "SIMPLE_INFO").upper()
         
         # Mapea el string a tu Enum
@@ -305,6 +861,27 @@ class QueryProcessor:
 
         # Obtener el nombre del procedimiento sugerido por el LLM
         procedure_name = intent_result.get("procedure_name", "Trámite no especificado")
+        return case_type, procedure_name
+    
+    def _faq_answer(self, query: str) -> Optional[Dict]:
+        """
+        Respuesta precalculada, solo para consultas informativas: un reclamo
+        o un pedido de turno (según las palabras clave) pasa por el
+        clasificador aunque se parezca a una pregunta frecuente.
+        """
+        if not self.use_faq or self.case_router.classify_case(query, []) != CaseType.SIMPLE_INFO:
+            return None
+        return answer_from_faq(query)
+    
+    def _faq_response(self, faq: Dict) -> Dict:
+        """Respuesta informativa servida desde el almacén de FAQ"""
+        response_data = self._new_response(CaseType.SIMPLE_INFO, faq["question"])
+        response_data["actions"].append("provide_information")
+        response_data["primary_response"] = faq["answer"]
+        response_data["source"] = "faq"
+        return response_data
+    
+    def _new_response(self, case_type: CaseType, procedure_name: str, deadline: Optional[Deadline] = None) -> Dict:
         response_data = {
             "case_type": case_type.value,
             "primary_response": "",
@@ -313,90 +890,108 @@ class QueryProcessor:
             "case": None,
             "procedure": procedure_name
         }
-        
-        # Si es solo información, devolver respuesta RAG
-        if case_type == CaseType.SIMPLE_INFO:
-            response_data["actions"].append("provide_information")
-            # --- NUEVA LÓGICA DE EJECUCIÓN RAG ---
-            # 1. Recuperar documentos
-            documents_retrieved = docsearch.as_retriever().get_relevant_documents(query)
-        
-            # 2. Cargar contexto (memoria global)
-            context = memory.load_memory_variables({})['chat_history']
-        
-            # 3. Ejecutar la función RAG
-            response_data['primary_response'] = generate_response_from_llm(
-                query, 
-                context, 
-                documents_retrieved
-            )
-            return response_data    
-            # ------------------------------------
-        elif case_type == CaseType.APPOINTMENT:
-            response_data["actions"].append("offer_appointment")
-        
-            # Generamos la estructura de datos para el formulario de Streamlit
-            response_data["appointment_data"] = {
-                "procedure": procedure_name,
-                "suggested_date": str(datetime.now().date() + timedelta(days=1)) 
-            }
-        
-            # Retornamos inmediatamente para que new_app.py redirija al formulario
-            return response_data
-        # ... (Tu lógica para ofrecer cita) ...
+        if deadline is not None:
+            # Misma lista: las degradaciones posteriores también quedan registradas
+            response_data["degraded"] = deadline.degraded
+        return response_data
+    
+    # ------------------------------------------------------------------
+    # Degradación por falta de tiempo (ver deadline.py)
+    # ------------------------------------------------------------------
+    def _keyword_intent(self, query: str, deadline: Deadline) -> Dict:
+        """Intención según las palabras clave, sin llamar al LLM"""
+        deadline.degrade("keyword_routing")
+        case_type = self.case_router.classify_case(query, [])
+        return {"case_type": case_type.name, "procedure_name": "Trámite no especificado"}
+    
+    def _answer_from_cache(self, response_data: Dict, query: str, deadline: Deadline) -> bool:
+        """Si no alcanza el tiempo para recuperar y generar, usa la última respuesta buena"""
+        if deadline.allows("retrieval", "generation"):
+            return False
+        answer = cached_answer(query, self.tenant_id)
+        if answer is None:
+            return False
+        deadline.degrade("cached_answer")
+        response_data["primary_response"] = answer
+        response_data["source"] = "cache"
+        return True
+    
+    def _passages_answer(self, documents: List) -> str:
+        """Los pasajes más relevantes, tal cual, en lugar de una respuesta generada"""
+        passages = [doc.page_content.strip() for doc in documents[:DEGRADED_PASSAGES]]
+        passages = [p[:DEGRADED_PASSAGE_CHARS] for p in passages if p]
+        if not passages:
+            return CANNED_ANSWER
+        quoted = "\n\n".join("> " + p.replace("\n", "\n> ") for p in passages)
+        return (
+            "No llegué a redactar una respuesta a tiempo. Esto es lo más relevante "
+            f"que encontré en la documentación municipal:\n\n{quoted}"
+        )
+    
+    def _generation_fallback(self, query: str, documents: List, deadline: Deadline) -> str:
+        """Respuesta cuando el LLM no contesta a tiempo (o falla): caché y si no, pasajes"""
+        answer = cached_answer(query, self.tenant_id)
+        if answer is not None:
+            deadline.degrade("cached_answer")
+            return answer
+        deadline.degrade("passages")
+        return self._passages_answer(documents)
+    
+    def _offer_appointment(self, response_data: Dict, procedure_name: str) -> Dict:
+        response_data["actions"].append("offer_appointment")
+        
+        # Generamos la estructura de datos para el formulario de Streamlit
+        next_slots = self.appointment_manager.next_free_slots(procedure_name, n=1)
+        response_data["appointment_data"] = {
+            "procedure": procedure_name,
+            "suggested_date": next_slots[0][0] if next_slots else str(datetime.now().date() + timedelta(days=1))
+        }
+        return response_data
+    
+    def _derive_complex_case(
+        self,
+        response_data: Dict,
+        query: str,
+        citizen_id: str,
+        citizen_name: str,
+        citizen_email: str,
+    ) -> Dict:
+        response_data["actions"].append("create_complex_case")
+        priority = self._determine_priority(query)
+    
+        # Creamos el caso usando tu CaseRouter existente
+        success, message, case = self.case_router.create_complex_case(
+            citizen_id=citizen_id,
+            citizen_name=citizen_name,
+            citizen_email=citizen_email,
+            description=query,
+            priority=priority
+        )
+    
+        response_data["case"] = asdict(case) if case else None
+        response_data["case_message"] = message
+    
+        # Generamos una respuesta para notificar al usuario
+        response_data['primary_response'] = (
+            f"🚨 **¡Caso Complejo Derivado!** 🚨\n\n"
+            f"He identificado que tu consulta requiere la intervención de un funcionario. "
+            f"Hemos creado el **Caso N° {case.id}** y ha sido asignado al **{case.department.value}**."
+        )
     
-        elif case_type == CaseType.COMPLEX_CASE:
-            response_data["actions"].append("create_complex_case")
-            priority = self._determine_priority(query)
-        
-            # Creamos el caso usando tu CaseRouter existente
-            success, message, case = self.case_router.create_complex_case(
-                citizen_id=citizen_id,
-                citizen_name=citizen_name,
-                citizen_email=citizen_email,
-                description=query,
-                priority=priority
-            )
-        
-            response_data["case"] = asdict(case) if case else None
-            response_data["case_message"] = message
-        
-            # Generamos una respuesta para notificar al usuario
-            response_data['primary_response'] = (
-                f"🚨 **¡Caso Complejo Derivado!** 🚨\n\n"
-                f"He identificado que tu consulta requiere la intervención de un funcionario. "
-                f"Hemos creado el **Caso N° {case.id}** y ha sido asignado al **{case.department.value}**."
-            )
-        
-            return response_data
-            
         return response_data
-        
         
     def _determine_priority(self, query: str) -> str:
         """Determina la prioridad basada en palabras clave"""
-        query_lower = query.lower()
-        
-        # Palabras clave para CASOS ALTAMENTE CRÍTICOS (Riesgo, Emergencia)
-        high_priority_keywords = [
-            "urgente", "emergencia", "grave", "crítico", "inmediato", 
-            "violación", "peligro", "inaceptable"
-        ]
-        
-        # Palabras clave para DEMORAS SIGNIFICATIVAS O TEMAS IMPORTANTES
-        medium_priority_keywords = [
-            "demora", "retraso", "seis meses", "tres meses", "meses", 
-            "mucho tiempo", "importante", "pronto", "necesito respuesta"
-        ]
+        categories = self.case_router.matcher.categories(query)
         
         # 1. Prioridad Alta (Si encuentra cualquier palabra de la lista High)
-        if any(keyword in query_lower for keyword in high_priority_keywords):
+        if "priority_high" in categories:
             return "HIGH"
         
         # 2. Prioridad Media (Si encuentra palabras de Demora/Importancia)
-        elif any(keyword in query_lower for keyword in medium_priority_keywords):
+        elif "priority_medium" in categories:
             return "MEDIUM"
         
         # 3. Prioridad Baja (Por defecto, o consultas menos críticas)
         else:
-            return "LOW"
\ No newline at end of file
+            return "LOW"
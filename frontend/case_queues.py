@@ -0,0 +1,115 @@
+# case_queues.py
+"""
+Colas de despacho de casos complejos por departamento.
+
+El orden es la "llegada virtual": la hora de creación del caso menos una
+ventaja según su prioridad (MIA_CASE_HEADSTART_HIGH/MEDIUM/LOW, en horas).
+Un caso HIGH se atiende como si hubiera llegado 8 h antes, uno MEDIUM 2 h
+antes; así un caso LOW que espera lo suficiente termina por delante de los
+urgentes nuevos (envejecimiento) sin recalcular nada: la clave de cada caso
+no cambia.
+
+La clave se guarda al insertar el caso (complex_cases.queue_key, ver
+database.insert_cases) y la cola de cada departamento es el índice
+(status, department, queue_key): assign_next toma el primer caso pendiente
+del índice, sin ordenar, en O(log n), y lo asigna con un UPDATE
+condicionado a status = 'pending' en la misma transacción. Como la cola
+es SQLite, ve los casos creados o devueltos por cualquier proceso y dos
+procesos no pueden tomar el mismo caso. La profundidad y la espera por
+departamento del panel de administración también salen de SQLite
+(queue_overview). Cambiar las ventajas no recalcula las claves guardadas.
+"""
+
+import sqlite3
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from database import DB_PATH, get_connection, transaction
+
+OPEN_STATUS = "pending"
+ASSIGNED_STATUS = "assigned"
+
+
+class DispatchQueues:
+    """Asignación de los casos pendientes de cada departamento a funcionarios"""
+
+    def __init__(self, db_path: str = DB_PATH):
+        self.db_path = db_path
+
+    @staticmethod
+    def _department_key(department) -> str:
+        return getattr(department, "name", str(department))
+
+    def assign_next(self, department, officer: str) -> Optional[str]:
+        """
+        Asigna al funcionario el caso pendiente de mayor prioridad efectiva
+        del departamento (incluye los creados por otros procesos).
+        Returns: id del caso asignado, o None si no hay pendientes
+        """
+        with transaction(self.db_path) as conn:
+            # BEGIN IMMEDIATE: nadie más escribe entre la elección y el UPDATE
+            row = conn.execute("""
+                SELECT id FROM complex_cases
+                WHERE status = ? AND department = ? AND assigned_to IS NULL
+                ORDER BY queue_key, id
+                LIMIT 1
+            """, (OPEN_STATUS, self._department_key(department))).fetchone()
+            if row is None or not self._persist_assignment(row[0], officer, conn):
+                return None
+        return row[0]
+
+    def assign(self, case_id: str, officer: str) -> bool:
+        """Asigna un caso concreto"""
+        return self._persist_assignment(case_id, officer)
+
+    def release(self, case_id: str) -> bool:
+        """Devuelve un caso asignado (por cualquier proceso) a la cola, conservando su antigüedad"""
+        with transaction(self.db_path) as conn:
+            return conn.execute("""
+                UPDATE complex_cases SET status = ?, assigned_to = NULL, assigned_at = NULL
+                WHERE id = ? AND status = ?
+            """, (OPEN_STATUS, case_id, ASSIGNED_STATUS)).rowcount == 1
+
+    def _persist_assignment(self, case_id: str, officer: str, conn: Optional[sqlite3.Connection] = None) -> bool:
+        with transaction(self.db_path, conn) as conn:
+            return conn.execute("""
+                UPDATE complex_cases SET status = ?, assigned_to = ?, assigned_at = ?
+                WHERE id = ? AND status = ?
+            """, (ASSIGNED_STATUS, officer, datetime.now().isoformat(), case_id, OPEN_STATUS)).rowcount == 1
+
+
+def queue_overview(db_path: str = DB_PATH) -> List[Dict]:
+    """Casos pendientes, espera promedio y máxima (horas) y tiempo hasta asignación por departamento"""
+    conn = get_connection(db_path)
+    try:
+        pending = conn.execute("""
+            SELECT department,
+                   COUNT(*),
+                   SUM(UPPER(priority) = 'HIGH'),
+                   AVG(julianday('now', 'localtime') - julianday(created_at)) * 24,
+                   MAX(julianday('now', 'localtime') - julianday(created_at)) * 24
+            FROM complex_cases
+            WHERE status = ?
+            GROUP BY department
+        """, (OPEN_STATUS,)).fetchall()
+        assigned = dict(conn.execute("""
+            SELECT department, AVG(julianday(assigned_at) - julianday(created_at)) * 24
+            FROM complex_cases
+            WHERE assigned_at IS NOT NULL
+            GROUP BY department
+        """).fetchall())
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+    return [
+        {
+            "departamento": department,
+            "pendientes": count,
+            "urgentes": high or 0,
+            "espera_prom_h": round(avg_wait or 0.0, 1),
+            "espera_max_h": round(max_wait or 0.0, 1),
+            "hasta_asignación_h": round(assigned.get(department) or 0.0, 1),
+        }
+        for department, count, high, avg_wait, max_wait in pending
+    ]
@@ -0,0 +1,362 @@
+# database.py
+"""
+Acceso compartido a la base SQLite de MIA (usuarios, citas, casos, chat,
+cola de trabajos y métricas)
+"""
+
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import date
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mia_users.db")
+
+# Tiempo máximo (segundos) que una conexión espera a que otro proceso libere el lock
+BUSY_TIMEOUT = 30
+
+# Ventaja de cada prioridad en las colas de despacho (ver case_queues.py)
+HOUR = 3600.0
+PRIORITY_HEADSTART_S = {
+    "HIGH": float(os.getenv("MIA_CASE_HEADSTART_HIGH", "8")) * HOUR,
+    "MEDIUM": float(os.getenv("MIA_CASE_HEADSTART_MEDIUM", "2")) * HOUR,
+    "LOW": float(os.getenv("MIA_CASE_HEADSTART_LOW", "0")) * HOUR,
+}
+
+
+def get_connection(db_path: str = DB_PATH) -> sqlite3.Connection:
+    """
+    Abre una conexión apta para varios procesos de la app.
+    WAL permite lecturas concurrentes mientras otro proceso escribe, y las
+    transacciones se controlan explícitamente (BEGIN IMMEDIATE / COMMIT).
+    """
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+@contextmanager
+def transaction(db_path: str = DB_PATH, conn: Optional[sqlite3.Connection] = None):
+    """
+    BEGIN IMMEDIATE ... COMMIT en una conexión nueva (ROLLBACK si falla).
+    Con `conn`, el bloque se suma a la transacción ya abierta por el llamador.
+    """
+    if conn is not None:
+        yield conn
+        return
+    conn = get_connection(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        yield conn
+        conn.execute("COMMIT")
+    except Exception:
+        # Si BEGIN IMMEDIATE no tomó el lock no hay nada que deshacer (y se ve el error original)
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def init_user_db(db_path: str = DB_PATH):
+    """Crea la tabla de usuarios si no existe."""
+    conn = get_connection(db_path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS citizens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            dni TEXT NOT NULL,
+            password TEXT NOT NULL,
+            is_admin INTEGER DEFAULT 0
+        )
+    """)
+    conn.close()
+
+
+def init_data_tables(db_path: str = DB_PATH):
+    """Crea tablas de citas y casos complejos si no existen."""
+    conn = get_connection(db_path)
+    # Tabla de citas
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS appointments (
+            id TEXT PRIMARY KEY,
+            citizen_email TEXT,
+            procedure TEXT,
+            date TEXT,
+            time TEXT,
+            status TEXT,
+            notes TEXT,
+            created_at TEXT
+        )
+    """)
+    # Tabla de casos complejos
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS complex_cases (
+            id TEXT PRIMARY KEY,
+            citizen_email TEXT,
+            description TEXT,
+            department TEXT,
+            priority TEXT,
+            status TEXT,
+            created_at TEXT,
+            assigned_to TEXT,
+            assigned_at TEXT,
+            queue_key REAL
+        )
+    """)
+    # Bases creadas antes de la asignación a funcionarios y de las colas
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(complex_cases)")}
+    for column, column_type in (("assigned_to", "TEXT"), ("assigned_at", "TEXT"), ("queue_key", "REAL")):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE complex_cases ADD COLUMN {column} {column_type}")
+    rows = conn.execute("SELECT id, created_at, priority FROM complex_cases WHERE queue_key IS NULL").fetchall()
+    if rows:
+        conn.executemany(
+            "UPDATE complex_cases SET queue_key = ? WHERE id = ?",
+            [(virtual_arrival(created_at, priority), case_id) for case_id, created_at, priority in rows],
+        )
+    # Colas de despacho: el siguiente caso de un departamento es el primero del índice
+    conn.execute("DROP INDEX IF EXISTS idx_complex_cases_queue")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_complex_cases_dispatch
+        ON complex_cases (status, department, queue_key, id)
+    """)
+    # Historial de chat por ciudadano y sesión
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            citizen_id TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            text TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_messages_citizen
+        ON chat_messages (citizen_id, id)
+    """)
+    # Cola de trabajos en segundo plano (notificaciones, webhooks, métricas)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            idempotency_key TEXT UNIQUE,
+            status TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            run_after REAL NOT NULL,
+            locked_at REAL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_jobs_ready
+        ON jobs (status, run_after)
+    """)
+    # Trabajos que agotaron sus intentos (se pueden reencolar desde el panel)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS dead_jobs (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            idempotency_key TEXT,
+            attempts INTEGER NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            failed_at TEXT NOT NULL
+        )
+    """)
+    conn.close()
+
+
+def _timestamp(created_at: str) -> float:
+    try:
+        return datetime.fromisoformat(created_at).timestamp()
+    except (TypeError, ValueError):
+        return datetime.now().timestamp()
+
+
+def virtual_arrival(created_at: str, priority: str) -> float:
+    """Clave de la cola de despacho: llegada real menos la ventaja de la prioridad"""
+    return _timestamp(created_at) - PRIORITY_HEADSTART_S.get(str(priority).upper(), 0.0)
+
+
+def _enum_name(value) -> str:
+    """Convierte enums y otros tipos no serializables a texto"""
+    if isinstance(value, str):
+        return value
+    return str(value.name) if hasattr(value, "name") else str(value)
+
+
+def insert_cases(
+    cases: Iterable[Dict], db_path: str = DB_PATH, conn: Optional[sqlite3.Connection] = None
+) -> int:
+    """
+    Guarda casos complejos (dicts de asdict) en una sola transacción
+    (o en la del llamador, si se pasa `conn`).
+    Returns: cantidad de casos guardados
+    """
+    rows = [
+        (
+            case.get("id"),
+            case.get("citizen_email"),
+            case.get("description"),
+            _enum_name(case.get("department")),
+            _enum_name(case.get("priority")),
+            case.get("status"),
+            case.get("created_at"),
+            case.get("assigned_to"),
+            case.get("assigned_at"),
+            virtual_arrival(case.get("created_at"), _enum_name(case.get("priority"))),
+        )
+        for case in cases
+    ]
+    if not rows:
+        return 0
+    with transaction(db_path, conn) as conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO complex_cases
+            (id, citizen_email, description, department, priority, status, created_at,
+             assigned_to, assigned_at, queue_key)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+    return len(rows)
+
+
+def init_metrics_table(db_path: str = DB_PATH):
+    """Crea tabla para métricas de uso si no existe."""
+    conn = get_connection(db_path)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            total_queries INTEGER DEFAULT 0,
+            appointments INTEGER DEFAULT 0,
+            complex_cases INTEGER DEFAULT 0,
+            tokens_used INTEGER DEFAULT 0
+        )
+    """)
+    # Histogramas de latencia por hora y etapa (ver latency_metrics.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS latency_histograms (
+            hour TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (hour, stage, bucket)
+        ) WITHOUT ROWID
+    """)
+    conn.close()
+
+
+def update_metrics(field: str, increment: int = 1, db_path: str = DB_PATH):
+    """Actualiza las métricas diarias en la base."""
+    today = date.today().isoformat()
+    conn = get_connection(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        # Crear registro del día si no existe
+        row = conn.execute("SELECT 1 FROM metrics WHERE date = ?", (today,)).fetchone()
+        if not row:
+            conn.execute("INSERT INTO metrics (date) VALUES (?)", (today,))
+        # Actualizar campo correspondiente
+        conn.execute(f"UPDATE metrics SET {field} = {field} + ? WHERE date = ?", (increment, today))
+        conn.execute("COMMIT")
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def insert_appointment(appointment, db_path: str = DB_PATH, conn: Optional[sqlite3.Connection] = None):
+    """Guarda una cita confirmada en la base SQLite (en la transacción de `conn`, si se pasa)."""
+    own_conn = conn is None
+    conn = conn or get_connection(db_path)
+    conn.execute("""
+        INSERT OR REPLACE INTO appointments 
+        (id, citizen_email, procedure, date, time, status, notes, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        appointment.id,
+        appointment.citizen_email,
+        appointment.procedure,
+        appointment.date,
+        appointment.time,
+        appointment.status,
+        appointment.notes,
+        appointment.created_at
+    ))
+    if own_conn:
+        conn.close()
+
+
+def get_case(case_id: str, db_path: str = DB_PATH) -> Optional[Dict]:
+    """Lee un caso complejo guardado (incluye los creados por otros procesos)"""
+    conn = get_connection(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        row = conn.execute("SELECT * FROM complex_cases WHERE id = ?", (case_id,)).fetchone()
+    finally:
+        conn.close()
+    return dict(row) if row else None
+
+
+def append_chat_message(
+    citizen_id: str, session_id: str, role: str, text: str, db_path: str = DB_PATH
+) -> Dict:
+    """Guarda un mensaje del chat. Returns: el mensaje con su id"""
+    created_at = datetime.now().isoformat(timespec="seconds")
+    conn = get_connection(db_path)
+    try:
+        cursor = conn.execute(
+            "INSERT INTO chat_messages (citizen_id, session_id, role, text, created_at) VALUES (?, ?, ?, ?, ?)",
+            (str(citizen_id), session_id, role, text, created_at),
+        )
+        message_id = cursor.lastrowid
+    finally:
+        conn.close()
+    return {"id": message_id, "role": role, "text": text, "created_at": created_at}
+
+
+def load_chat_messages(
+    citizen_id: str, limit: int = 30, before_id: Optional[int] = None, db_path: str = DB_PATH
+) -> List[Dict]:
+    """
+    Últimos `limit` mensajes del ciudadano (de todas sus sesiones), o los
+    anteriores a `before_id`. Returns: mensajes en orden cronológico
+    """
+    query = "SELECT id, role, text, created_at FROM chat_messages WHERE citizen_id = ?"
+    params = [str(citizen_id)]
+    if before_id is not None:
+        query += " AND id < ?"
+        params.append(before_id)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit)
+    conn = get_connection(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(query, params).fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in reversed(rows)]
+
+
+def has_older_chat_messages(citizen_id: str, before_id: int, db_path: str = DB_PATH) -> bool:
+    conn = get_connection(db_path)
+    try:
+        row = conn.execute(
+            "SELECT 1 FROM chat_messages WHERE citizen_id = ? AND id < ? LIMIT 1",
+            (str(citizen_id), before_id),
+        ).fetchone()
+    finally:
+        conn.close()
+    return row is not None
@@ -0,0 +1,98 @@
+# deadline.py
+"""
+Presupuesto de tiempo de una consulta del chat.
+
+ask_question (y el servidor HTTP) crean un Deadline con el presupuesto total
+(MIA_REQUEST_BUDGET_S, por defecto 8 s) y QueryProcessor.process_query lo
+consulta antes de cada etapa. Cada etapa tiene un presupuesto mínimo
+(MIA_BUDGET_CLASSIFICATION_S, MIA_BUDGET_RETRIEVAL_S, MIA_BUDGET_GENERATION_S):
+cuando el tiempo restante no alcanza, la consulta se degrada en este orden:
+
+1. "keyword_routing": clasificación por palabras clave en lugar del LLM
+2. "cached_answer": última respuesta buena a la misma pregunta (las FAQ se
+   consultan siempre antes de clasificar)
+3. "passages": los pasajes recuperados, textuales, en lugar de una
+   respuesta generada
+
+Las llamadas al LLM reciben el vencimiento (time.monotonic()) y el governor
+corta ahí la espera, los reintentos y la cola; el clasificador recibe el
+vencimiento menos el presupuesto de recuperación y generación, para que no
+consuma el tiempo de las etapas siguientes. Una respuesta degradada no se
+comparte con las consultas idénticas en curso (single_flight.py): cada una
+lo intenta con su propio presupuesto. Las degradaciones aplicadas
+quedan en response["degraded"] y se cuentan por proceso (degradation_stats,
+visible en el estado del LLM del panel de administración).
+"""
+
+import math
+import os
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+REQUEST_BUDGET_S = float(os.getenv("MIA_REQUEST_BUDGET_S", "8"))
+STAGE_BUDGETS = {
+    "classification": float(os.getenv("MIA_BUDGET_CLASSIFICATION_S", "1.5")),
+    "retrieval": float(os.getenv("MIA_BUDGET_RETRIEVAL_S", "0.5")),
+    "generation": float(os.getenv("MIA_BUDGET_GENERATION_S", "4")),
+}
+
+DEGRADATION_STEPS = ("keyword_routing", "cached_answer", "passages")
+
+# Degradaciones aplicadas en el proceso
+_degradations: Counter = Counter()
+_degradations_lock = threading.Lock()
+
+
+def degradation_stats() -> Dict[str, int]:
+    with _degradations_lock:
+        return {f"degraded_{step}": _degradations[step] for step in DEGRADATION_STEPS}
+
+
+class Deadline:
+    """Vencimiento de una petición y presupuesto mínimo de cada etapa"""
+
+    def __init__(self, budget_s: float = REQUEST_BUDGET_S, stage_budgets: Optional[Dict[str, float]] = None):
+        self.budget_s = budget_s
+        self.expires_at = time.monotonic() + budget_s
+        self.stage_budgets = {**STAGE_BUDGETS, **(stage_budgets or {})}
+        self.degraded: List[str] = []
+
+    @classmethod
+    def unbounded(cls) -> "Deadline":
+        """Sin límite: todas las etapas se ejecutan completas"""
+        return cls(math.inf)
+
+    def monotonic_deadline(self, *reserved_stages: str) -> Optional[float]:
+        """
+        Vencimiento para el governor del LLM (None si no hay límite). Con
+        etapas reservadas, se adelanta lo que necesitan las que vienen después.
+        """
+        if not math.isfinite(self.expires_at):
+            return None
+        return self.expires_at - sum(self.stage_budgets[stage] for stage in reserved_stages)
+
+    def remaining(self) -> float:
+        """Segundos que quedan (0 si ya venció)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, *stages: str) -> bool:
+        """¿Alcanza el tiempo restante para estas etapas?"""
+        return self.remaining() >= sum(self.stage_budgets[stage] for stage in stages)
+
+    def degraded_from_now(self) -> Callable[[], bool]:
+        """¿Hubo degradaciones desde este momento? (ver SingleFlight: no se comparten)"""
+        before = len(self.degraded)
+        return lambda: len(self.degraded) > before
+
+    def degrade(self, step: str) -> None:
+        """Anota una degradación aplicada a la respuesta"""
+        if step in self.degraded:
+            return
+        self.degraded.append(step)
+        with _degradations_lock:
+            _degradations[step] += 1
@@ -0,0 +1,157 @@
+# follow_up.py
+"""
+Detección de repreguntas ("¿y cuánto cuesta?", "¿y eso dónde se hace?").
+
+Una repregunta hereda la intención y el trámite del turno informativo
+anterior de la misma conversación (sesión de chat, no ciudadano: los
+invitados comparten citizen_id) y reutiliza sus fragmentos recuperados: no
+se clasifica con el LLM y solo se hace una búsqueda incremental con los
+términos nuevos. La detección es local (reglas sobre las palabras de la
+consulta), así que cuesta microsegundos.
+
+Es repregunta una consulta corta que empieza con un conector ("y", "pero"),
+que señala lo anterior ("eso", "ahí") o que pregunta por un aspecto
+(precio, lugar, plazo, requisitos, para quién) y que, en todos los casos,
+no nombra un tema que no estuviera en el turno anterior: "¿cuánto
+cuesta?" y "¿y para menores?" lo son; "¿cuánto cuesta el pasaporte?" o
+"¿y para el pasaporte qué piden?" después de hablar del DNI no.
+
+Cada turno informativo registra el tiempo de ruteo + recuperación; stats()
+compara el de las repreguntas con el de los turnos completos.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+FOLLOW_UP_TTL_S = float(os.getenv("MIA_FOLLOW_UP_TTL_S", "600"))
+MAX_FOLLOW_UP_WORDS = 10
+MAX_CONVERSATIONS = 10000
+
+# Comienzos típicos de una repregunta
+OPENERS = {"y", "e", "pero", "entonces", "también", "tambien", "además", "ademas", "aparte", "ok", "vale"}
+# Palabras que apuntan a lo dicho antes
+ANAPHORA = {"eso", "esto", "ese", "esa", "ello", "mismo", "misma", "ahí", "ahi", "allí", "alli"}
+QUESTION_WORDS = {
+    "cuánto", "cuanto", "cuánta", "cuanta", "cuándo", "cuando", "dónde", "donde", "cómo", "como",
+    "qué", "que", "quién", "quien", "cuál", "cual", "hasta", "desde",
+}
+STOPWORDS = OPENERS | ANAPHORA | QUESTION_WORDS | {
+    "el", "la", "los", "las", "lo", "un", "una", "unos", "unas", "de", "del", "al", "a", "en",
+    "por", "para", "con", "sin", "se", "me", "te", "le", "les", "mi", "tu", "su", "sus", "es",
+    "son", "hay", "si", "no", "o", "u", "puedo", "tengo", "hace", "hacer", "necesito",
+    "puede", "pueden", "tiene", "tienen", "debo", "necesita", "está", "están", "quiero",
+}
+
+# Aspectos de un trámite: preguntar por ellos no cambia de tema
+ASPECT_WORDS = {
+    "cuesta", "cuestan", "costo", "coste", "precio", "vale", "valen", "sale", "salen", "pago", "pagar", "paga",
+    "tarda", "tardan", "demora", "demoran", "plazo", "dura", "vence", "vencimiento", "tiempo",
+    "queda", "quedan", "lugar", "oficina", "abre", "abren", "cierra", "cierran", "atiende", "atienden", "horario", "horarios",
+    "requisitos", "requisito", "documentos", "documentación", "documentacion", "papeles", "piden", "pide",
+    "llevar", "traer", "presentar", "sacar", "saca", "tramitar", "gestionar", "renovar", "online", "internet",
+    # Para quién o en qué variante
+    "menor", "menores", "mayor", "mayores", "niño", "niños", "niña", "niñas", "hijo", "hijos", "bebé", "bebe",
+    "adulto", "adultos", "jubilado", "jubilados", "extranjero", "extranjeros", "primera", "vez",
+    "urgente", "duplicado", "copia", "copias",
+}
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def content_words(text: str) -> List[str]:
+    return [word for word in _words(text) if word not in STOPWORDS and not word.isdigit()]
+
+
+def topic_words(text: str) -> List[str]:
+    """Palabras de contenido que nombran un tema (no un aspecto del trámite)"""
+    return [word for word in content_words(text) if word not in ASPECT_WORDS]
+
+
+def is_follow_up(query: str, previous_query: str = "") -> bool:
+    """¿La consulta solo tiene sentido como continuación del turno anterior?"""
+    words = _words(query)
+    if not words or len(words) > MAX_FOLLOW_UP_WORDS:
+        return False
+    # Un tema nuevo es otra consulta, empiece como empiece ("¿y el pasaporte?")
+    seen = set(_words(previous_query))
+    if not all(word in seen for word in topic_words(query)):
+        return False
+    # "¿y para menores?", "¿eso dónde se hace?", "¿cuánto cuesta?"
+    return words[0] in OPENERS or words[0] in QUESTION_WORDS or any(word in ANAPHORA for word in words)
+
+
+def new_terms(query: str, previous_query: str) -> List[str]:
+    """Palabras de contenido de la repregunta que no estaban en el turno anterior"""
+    seen = set(_words(previous_query))
+    return [word for word in content_words(query) if word not in seen]
+
+
+@dataclass
+class Turn:
+    """Último turno informativo de una conversación"""
+    query: str
+    case_type: str
+    procedure_name: str
+    documents: List = field(default_factory=list)
+    at: float = field(default_factory=time.monotonic)
+
+
+class FollowUpTracker:
+    """Último turno por conversación (LRU con vencimiento) y métricas de ahorro"""
+
+    def __init__(self, ttl_s: float = FOLLOW_UP_TTL_S, max_conversations: int = MAX_CONVERSATIONS):
+        self.ttl_s = ttl_s
+        self.max_conversations = max_conversations
+        self._turns: "OrderedDict[str, Turn]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counts = {"follow_up": 0, "full": 0}
+        self._ms = {"follow_up": 0.0, "full": 0.0}
+
+    def remember(self, conversation_id: str, turn: Turn) -> None:
+        if not conversation_id:
+            return
+        with self._lock:
+            self._turns[conversation_id] = turn
+            self._turns.move_to_end(conversation_id)
+            while len(self._turns) > self.max_conversations:
+                self._turns.popitem(last=False)
+
+    def match(self, conversation_id: str, query: str) -> Optional[Turn]:
+        """Turno anterior vigente si la consulta es una repregunta, o None"""
+        if not conversation_id:
+            return None
+        with self._lock:
+            turn = self._turns.get(conversation_id)
+        if turn is None or time.monotonic() - turn.at > self.ttl_s:
+            return None
+        return turn if is_follow_up(query, turn.query) else None
+
+    def record(self, path: str, ms: float) -> None:
+        """Tiempo de ruteo + recuperación de un turno ("follow_up" o "full")"""
+        with self._lock:
+            self._counts[path] += 1
+            self._ms[path] += ms
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counts, ms = dict(self._counts), dict(self._ms)
+        turns = counts["follow_up"] + counts["full"]
+        follow_up_avg = ms["follow_up"] / counts["follow_up"] if counts["follow_up"] else 0.0
+        full_avg = ms["full"] / counts["full"] if counts["full"] else 0.0
+        return {
+            "follow_up_turns": counts["follow_up"],
+            "follow_up_hit_rate": counts["follow_up"] / turns if turns else 0.0,
+            "follow_up_routing_avg_ms": follow_up_avg,
+            "full_routing_avg_ms": full_avg,
+            # Ahorro estimado: lo que habría costado clasificar y recuperar de nuevo
+            "follow_up_saved_ms": max(0.0, full_avg - follow_up_avg) * counts["follow_up"],
+        }
@@ -0,0 +1,280 @@
+# job_queue.py
+"""
+Cola de trabajos persistente en SQLite para los efectos secundarios de
+casos y turnos (correos, webhooks de departamentos, métricas).
+
+- enqueue() guarda el trabajo, opcionalmente dentro de la transacción que
+  registra el caso o la cita: o se guardan ambos o ninguno.
+- Una clave de idempotencia (UNIQUE) evita encolar dos veces el mismo
+  efecto, por ejemplo si el ciudadano reenvía el formulario.
+- Hilos trabajadores toman los trabajos con BEGIN IMMEDIATE, así que varios
+  procesos pueden compartir la cola sin ejecutar un trabajo dos veces. Un
+  trabajo "running" cuyo proceso murió se retoma al vencer LEASE_SECONDS.
+- Los errores se reintentan con backoff exponencial; al agotar los intentos
+  (o ante PermanentJobError) el trabajo pasa a dead_jobs.
+
+Las tablas se crean en database.init_data_tables. Los manejadores se
+registran con @queue.handler("tipo") (ver notifications.py).
+"""
+
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from database import DB_PATH, get_connection, transaction
+
+logger = logging.getLogger("mia.jobs")
+
+WORKERS = int(os.getenv("MIA_JOB_WORKERS", "2"))
+MAX_ATTEMPTS = int(os.getenv("MIA_JOB_MAX_ATTEMPTS", "5"))
+POLL_SECONDS = 1.0
+LEASE_SECONDS = 300.0
+BASE_DELAY = 2.0
+MAX_DELAY = 600.0
+# Los trabajos terminados se borran pasado este tiempo
+KEEP_DONE_SECONDS = 7 * 24 * 3600
+
+
+class PermanentJobError(Exception):
+    """Error que no se arregla reintentando: el trabajo va directo a dead_jobs"""
+
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+
+class JobQueue:
+    """Cola SQLite con hilos trabajadores por proceso"""
+
+    def __init__(
+        self,
+        db_path: str = DB_PATH,
+        workers: int = WORKERS,
+        max_attempts: int = MAX_ATTEMPTS,
+        poll_seconds: float = POLL_SECONDS,
+        base_delay: float = BASE_DELAY,
+        max_delay: float = MAX_DELAY,
+    ):
+        self.db_path = db_path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.poll_seconds = poll_seconds
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.handlers: Dict[str, Callable[[Dict], None]] = {}
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def handler(self, kind: str):
+        """Decorador que registra la función que ejecuta los trabajos de `kind`"""
+        def decorator(func):
+            self.handlers[kind] = func
+            return func
+        return decorator
+
+    # ------------------------------------------------------------------
+    # Encolar
+    # ------------------------------------------------------------------
+    def enqueue(
+        self,
+        kind: str,
+        payload: Dict,
+        idempotency_key: Optional[str] = None,
+        delay: float = 0.0,
+        conn: Optional[sqlite3.Connection] = None,
+    ) -> Optional[int]:
+        """
+        Agrega un trabajo. Con `conn`, se guarda en la transacción abierta
+        del llamador y los trabajadores lo ven al hacer COMMIT.
+        Returns: id del trabajo, o None si la clave de idempotencia ya existía
+        """
+        with transaction(self.db_path, conn) as tx:
+            cursor = tx.execute("""
+                INSERT OR IGNORE INTO jobs
+                (kind, payload, idempotency_key, max_attempts, run_after, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (
+                kind, json.dumps(payload, ensure_ascii=False), idempotency_key,
+                self.max_attempts, time.time() + delay, _now(), _now(),
+            ))
+            job_id = cursor.lastrowid if cursor.rowcount else None
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    # ------------------------------------------------------------------
+    # Trabajadores
+    # ------------------------------------------------------------------
+    def start(self) -> None:
+        """Arranca los hilos del proceso actual (también tras un fork)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pid = None
+
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                ran = self.run_once()
+            except Exception:
+                logger.exception("Error en el trabajador de la cola")
+                ran = False
+            if not ran:
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+
+    def run_once(self) -> bool:
+        """Toma y ejecuta un trabajo listo. Returns: False si no había ninguno"""
+        job = self._claim()
+        if job is None:
+            return False
+        handler = self.handlers.get(job["kind"])
+        try:
+            if handler is None:
+                raise PermanentJobError(f"Sin manejador para '{job['kind']}'")
+            handler(json.loads(job["payload"]))
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            self._update(job["id"], "UPDATE jobs SET status = 'done', last_error = NULL, updated_at = ? WHERE id = ?",
+                         (_now(), job["id"]))
+        return True
+
+    def drain(self, timeout: float = 30.0) -> bool:
+        """Ejecuta en este hilo los trabajos listos hasta vaciar la cola (scripts y pruebas)"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not self.run_once():
+                return True
+        return False
+
+    def _claim(self) -> Optional[Dict]:
+        now = time.time()
+        with transaction(self.db_path) as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("""
+                SELECT * FROM jobs
+                WHERE (status = 'queued' AND run_after <= ?)
+                   OR (status = 'running' AND locked_at < ?)
+                ORDER BY run_after
+                LIMIT 1
+            """, (now, now - LEASE_SECONDS)).fetchone()
+            if row is None:
+                return None
+            conn.execute("""
+                UPDATE jobs SET status = 'running', attempts = attempts + 1, locked_at = ?, updated_at = ?
+                WHERE id = ?
+            """, (now, _now(), row["id"]))
+            job = dict(row)
+            job["attempts"] += 1
+            return job
+
+    def _fail(self, job: Dict, error: Exception) -> None:
+        message = f"{type(error).__name__}: {error}"
+        if isinstance(error, PermanentJobError) or job["attempts"] >= job["max_attempts"]:
+            logger.error("Trabajo %s (%s) a dead_jobs: %s", job["id"], job["kind"], message)
+            with transaction(self.db_path) as conn:
+                conn.execute("""
+                    INSERT OR REPLACE INTO dead_jobs
+                    (id, kind, payload, idempotency_key, attempts, last_error, created_at, failed_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, (
+                    job["id"], job["kind"], job["payload"], job["idempotency_key"],
+                    job["attempts"], message, job["created_at"], _now(),
+                ))
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job["id"],))
+            return
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** job["attempts"]))
+        logger.warning("Trabajo %s (%s) falló, reintento en %.0fs: %s", job["id"], job["kind"], delay, message)
+        self._update(job["id"], """
+            UPDATE jobs SET status = 'queued', run_after = ?, locked_at = NULL, last_error = ?, updated_at = ?
+            WHERE id = ?
+        """, (time.time() + delay, message, _now(), job["id"]))
+
+    def _update(self, job_id: int, sql: str, params: tuple) -> None:
+        with transaction(self.db_path) as conn:
+            conn.execute(sql, params)
+
+    # ------------------------------------------------------------------
+    # Administración
+    # ------------------------------------------------------------------
+    def stats(self) -> Dict[str, int]:
+        return queue_stats(self.db_path)
+
+    def prune(self, older_than_s: float = KEEP_DONE_SECONDS) -> int:
+        """Borra trabajos terminados antiguos"""
+        cutoff = datetime.fromtimestamp(time.time() - older_than_s).isoformat(timespec="seconds")
+        with transaction(self.db_path) as conn:
+            return conn.execute(
+                "DELETE FROM jobs WHERE status = 'done' AND updated_at < ?", (cutoff,)
+            ).rowcount
+
+
+def queue_stats(db_path: str = DB_PATH) -> Dict[str, int]:
+    """Trabajos por estado y cantidad en dead_jobs"""
+    conn = get_connection(db_path)
+    try:
+        stats = {"queued": 0, "running": 0, "done": 0}
+        stats.update(dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()))
+        stats["dead"] = conn.execute("SELECT COUNT(*) FROM dead_jobs").fetchone()[0]
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+    return stats
+
+
+def dead_letters(db_path: str = DB_PATH, limit: int = 50) -> List[Dict]:
+    conn = get_connection(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(
+            "SELECT * FROM dead_jobs ORDER BY failed_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
+
+
+def requeue_dead(job_id: int, db_path: str = DB_PATH) -> bool:
+    """Devuelve un trabajo de dead_jobs a la cola con los intentos en cero"""
+    with transaction(db_path) as conn:
+        row = conn.execute(
+            "SELECT kind, payload, idempotency_key, created_at FROM dead_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return False
+        conn.execute("""
+            INSERT INTO jobs
+            (id, kind, payload, idempotency_key, max_attempts, run_after, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, (job_id, row[0], row[1], row[2], MAX_ATTEMPTS, time.time(), row[3], _now()))
+        conn.execute("DELETE FROM dead_jobs WHERE id = ?", (job_id,))
+    return True
@@ -0,0 +1,118 @@
+# keyword_matcher.py
+"""
+Motor de palabras clave compilado para enrutar casos y asignar prioridad.
+
+Todas las tablas de palabras clave se compilan una sola vez en una única
+expresión regular. Texto y palabras se normalizan sin tildes y en minúsculas,
+por lo que "DNI", "dni" y "defuncion" coinciden con "DNI", "dni" y
+"defunción". Una sola pasada devuelve todas las categorías con sus posiciones.
+"""
+
+import re
+import unicodedata
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Set
+
+
+# Letras latinas acentuadas -> letra base (á -> a, Ñ -> N, ü -> u, ...)
+_ACCENT_TABLE = {
+    chr(codepoint): unicodedata.normalize("NFD", chr(codepoint))[0]
+    for codepoint in range(0xC0, 0x250)
+    if unicodedata.normalize("NFD", chr(codepoint))[0] != chr(codepoint)
+}
+_ACCENTED = re.compile("[" + "".join(_ACCENT_TABLE) + "]")
+
+
+def normalize(text: str) -> str:
+    """
+    Quita tildes y pasa a minúsculas conservando la longitud del texto,
+    para que las posiciones encontradas valgan también en el texto original.
+    """
+    # Solo se reemplazan los pocos caracteres acentuados (más rápido que translate)
+    return _ACCENTED.sub(lambda found: _ACCENT_TABLE[found.group()], text).lower()
+
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """
+    Alternancia factorizada por prefijos ("registro(?: civil)?"), así en cada
+    posición el motor descarta casi todas las palabras con el primer carácter.
+    """
+    trie: Dict[str, dict] = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        # Cuantificador voraz: primero intenta la palabra más larga
+        return group + "?" if "" in node else group
+
+    return build(trie)
+
+
+class KeywordMatch(NamedTuple):
+    """Una coincidencia: categoría, palabra clave y posición [start, end)"""
+    category: str
+    keyword: str
+    start: int
+    end: int
+
+
+class KeywordMatcher:
+    """Busca todas las palabras clave de todas las categorías en una pasada"""
+
+    def __init__(self, table: Dict[str, Iterable[str]]):
+        # palabra normalizada -> categorías (una palabra puede estar en varias)
+        self._categories: Dict[str, List[str]] = {}
+        for category, keywords in table.items():
+            for keyword in keywords:
+                categories = self._categories.setdefault(normalize(keyword), [])
+                if category not in categories:
+                    categories.append(category)
+
+        keywords = list(self._categories)
+        # En cada posición el patrón toma la palabra más larga; las más
+        # cortas que empiezan en el mismo lugar son sus prefijos.
+        self._prefixes: Dict[str, List[str]] = {
+            keyword: [other for other in keywords if keyword.startswith(other)]
+            for keyword in keywords
+        }
+        self._prefix_categories: Dict[str, Set[str]] = {
+            keyword: {category for prefix in prefixes for category in self._categories[prefix]}
+            for keyword, prefixes in self._prefixes.items()
+        }
+        # El lookahead de ancho cero prueba cada posición, así también se
+        # encuentran coincidencias solapadas ("registro" dentro de "registro civil").
+        self._pattern = re.compile("(?=(" + _trie_pattern(keywords) + "))") if keywords else None
+
+    def find(self, text: str) -> List[KeywordMatch]:
+        """Todas las coincidencias, ordenadas por posición"""
+        if self._pattern is None or not text:
+            return []
+        matches = []
+        for found in self._pattern.finditer(normalize(text)):
+            start = found.start()
+            for keyword in self._prefixes[found.group(1)]:
+                for category in self._categories[keyword]:
+                    matches.append(KeywordMatch(category, keyword, start, start + len(keyword)))
+        return matches
+
+    def categories(self, text: str) -> Set[str]:
+        """Categorías presentes en el texto"""
+        if self._pattern is None or not text:
+            return set()
+        categories: Set[str] = set()
+        for found in self._pattern.finditer(normalize(text)):
+            categories |= self._prefix_categories[found.group(1)]
+        return categories
+
+    def find_many(self, texts: Iterable[str]) -> Iterator[Set[str]]:
+        """Categorías de cada texto, para procesar grandes volúmenes en lote"""
+        for text in texts:
+            yield self.categories(text)
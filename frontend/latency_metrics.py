@@ -0,0 +1,197 @@
+# latency_metrics.py
+"""
+Histogramas de latencia por hora y por etapa.
+
+Cada petición suma 1 a un contador en memoria (búsqueda del bucket en una
+lista fija de límites + incremento bajo lock: O(1)); un hilo de fondo vuelca
+los incrementos a SQLite cada FLUSH_SECONDS con un UPSERT aditivo, así que
+varios procesos pueden escribir la misma hora sin pisarse y ninguna petición
+espera una escritura en la base.
+
+Etapas: total, classification, retrieval, generation, db_write y ttft
+(tiempo hasta el primer fragmento de una respuesta en streaming).
+La tabla latency_histograms se crea en database.init_metrics_table.
+"""
+
+import atexit
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from database import DB_PATH, get_connection
+
+# Límite superior (ms) de cada bucket; el último es abierto
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2000, 4000, 8000, 15000, 30000, 60000)
+BUCKET_LABELS = [f"≤{b} ms" for b in BUCKETS_MS] + [f">{BUCKETS_MS[-1]} ms"]
+STAGES = ("total", "classification", "retrieval", "generation", "db_write", "ttft")
+FLUSH_SECONDS = 10.0
+
+
+class LatencyRecorder:
+    """Contadores en memoria por (hora, etapa) con volcado periódico a SQLite"""
+
+    def __init__(self, db_path: str = DB_PATH, flush_seconds: float = FLUSH_SECONDS):
+        self.db_path = db_path
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], List[int]] = {}
+        self._pid = None
+
+    def _ensure_flusher(self) -> None:
+        # El hilo se crea en el primer registro de cada proceso (también tras un fork)
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._pending = {}
+            threading.Thread(target=self._run, name="latency-flush", daemon=True).start()
+            atexit.register(self.flush)
+
+    def record(self, stage: str, ms: float) -> None:
+        """Suma una observación al bucket correspondiente de la hora actual"""
+        self._ensure_flusher()
+        bucket = bisect_left(BUCKETS_MS, ms)
+        key = (datetime.now().strftime("%Y-%m-%d %H:00"), stage)
+        with self._lock:
+            counts = self._pending.get(key)
+            if counts is None:
+                counts = self._pending[key] = [0] * len(BUCKET_LABELS)
+            counts[bucket] += 1
+
+    def timed(self, stage: str):
+        """Context manager que registra la duración del bloque"""
+        return _Timer(self, stage)
+
+    def timed_stream(self, stage: str, chunks: Iterator[str], started: Optional[float] = None,
+                     first_chunk_stage: Optional[str] = None) -> Iterator[str]:
+        """
+        Re-emite un stream y registra su duración al terminar; con
+        first_chunk_stage también registra el tiempo hasta el primer fragmento.
+        """
+        started = time.perf_counter() if started is None else started
+        first = True
+        for chunk in chunks:
+            if first and first_chunk_stage:
+                self.record(first_chunk_stage, (time.perf_counter() - started) * 1000)
+            first = False
+            yield chunk
+        self.record(stage, (time.perf_counter() - started) * 1000)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception:
+                pass  # Se reintenta en el próximo ciclo con los contadores acumulados
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        rows = [
+            (hour, stage, bucket, count)
+            for (hour, stage), counts in pending.items()
+            for bucket, count in enumerate(counts)
+            if count
+        ]
+        if not rows:
+            return
+        conn = get_connection(self.db_path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("""
+                INSERT INTO latency_histograms (hour, stage, bucket, count) VALUES (?, ?, ?, ?)
+                ON CONFLICT (hour, stage, bucket) DO UPDATE SET count = count + excluded.count
+            """, rows)
+            conn.execute("COMMIT")
+        except Exception:
+            # Devolver los incrementos para no perderlos (también si BEGIN no pudo tomar el lock)
+            with self._lock:
+                for key, counts in pending.items():
+                    current = self._pending.setdefault(key, [0] * len(BUCKET_LABELS))
+                    for i, count in enumerate(counts):
+                        current[i] += count
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+
+class _Timer:
+    def __init__(self, recorder: LatencyRecorder, stage: str):
+        self.recorder = recorder
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.record(self.stage, (time.perf_counter() - self.started) * 1000)
+        return False
+
+
+def histogram_percentile(counts: List[int], pct: float) -> float:
+    """Percentil estimado interpolando dentro del bucket"""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    target = total * pct / 100
+    seen = 0
+    for i, count in enumerate(counts):
+        if count and seen + count >= target:
+            low = BUCKETS_MS[i - 1] if i else 0
+            high = BUCKETS_MS[i] if i < len(BUCKETS_MS) else BUCKETS_MS[-1] * 2
+            return low + (high - low) * (target - seen) / count
+        seen += count
+    return float(BUCKETS_MS[-1])
+
+
+def load_histograms(since_hour: str, db_path: str = DB_PATH) -> Dict[Tuple[str, str], List[int]]:
+    """Histogramas guardados desde `since_hour` ("YYYY-MM-DD HH:00")"""
+    histograms: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0] * len(BUCKET_LABELS))
+    conn = get_connection(db_path)
+    try:
+        for hour, stage, bucket, count in conn.execute(
+            "SELECT hour, stage, bucket, count FROM latency_histograms WHERE hour >= ?", (since_hour,)
+        ):
+            histograms[(hour, stage)][bucket] += count
+    finally:
+        conn.close()
+    return dict(histograms)
+
+
+def percentile_trends(histograms: Dict[Tuple[str, str], List[int]], stage: str) -> List[Dict]:
+    """p50/p90/p99 por hora para una etapa"""
+    return [
+        {
+            "hora": hour,
+            "p50": histogram_percentile(counts, 50),
+            "p90": histogram_percentile(counts, 90),
+            "p99": histogram_percentile(counts, 99),
+            "peticiones": sum(counts),
+        }
+        for (hour, hist_stage), counts in sorted(histograms.items())
+        if hist_stage == stage
+    ]
+
+
+def distribution(histograms: Dict[Tuple[str, str], List[int]], stage: str) -> List[int]:
+    """Suma de los buckets de una etapa en todas las horas"""
+    totals = [0] * len(BUCKET_LABELS)
+    for (_, hist_stage), counts in histograms.items():
+        if hist_stage == stage:
+            for i, count in enumerate(counts):
+                totals[i] += count
+    return totals
+
+
+# Instancia del proceso
+latency = LatencyRecorder()
@@ -0,0 +1,148 @@
+# notifications.py
+"""
+Trabajos en segundo plano de casos y turnos: correo al ciudadano, webhook
+del departamento y métricas diarias.
+
+Configuración:
+- MIA_SMTP_HOST / MIA_SMTP_PORT (puerto 1025 por defecto, el del servidor
+  local de smtp_stub.py), MIA_SMTP_FROM, MIA_SMTP_USER / MIA_SMTP_PASSWORD
+  y MIA_SMTP_STARTTLS=1 para un servidor real. Sin MIA_SMTP_HOST no se
+  encolan correos
+- MIA_DEPARTMENT_WEBHOOKS: JSON {"LEGAL": "https://...", ...} con el nombre
+  del departamento (DepartmentType) y la URL; "*" vale para todos. Sin URL
+  no se encola el webhook.
+"""
+
+import json
+import os
+import smtplib
+import urllib.error
+import urllib.request
+from email.message import EmailMessage
+from typing import Dict, Optional
+
+from database import update_metrics
+from job_queue import JobQueue, PermanentJobError
+
+SMTP_HOST = os.getenv("MIA_SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("MIA_SMTP_PORT", "1025"))
+SMTP_FROM = os.getenv("MIA_SMTP_FROM", "MIA <no-responder@municipio.local>")
+SMTP_TIMEOUT = 10
+WEBHOOK_TIMEOUT = 10
+
+
+def _department_webhooks() -> Dict[str, str]:
+    try:
+        return json.loads(os.getenv("MIA_DEPARTMENT_WEBHOOKS", "{}"))
+    except ValueError:
+        return {}
+
+
+def webhook_url(department: str) -> Optional[str]:
+    webhooks = _department_webhooks()
+    return webhooks.get(department) or webhooks.get("*")
+
+
+def smtp_configured() -> bool:
+    return bool(os.getenv("MIA_SMTP_HOST"))
+
+
+def send_email(to: str, subject: str, body: str) -> None:
+    message = EmailMessage()
+    message["From"] = SMTP_FROM
+    message["To"] = to
+    message["Subject"] = subject
+    message.set_content(body)
+    try:
+        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=SMTP_TIMEOUT) as smtp:
+            if os.getenv("MIA_SMTP_STARTTLS", "0") == "1":
+                smtp.starttls()
+            if os.getenv("MIA_SMTP_USER"):
+                smtp.login(os.getenv("MIA_SMTP_USER"), os.getenv("MIA_SMTP_PASSWORD", ""))
+            smtp.send_message(message)
+    except smtplib.SMTPRecipientsRefused as e:
+        raise PermanentJobError(f"Destinatario rechazado: {to}") from e
+
+
+def post_webhook(url: str, payload: Dict) -> None:
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=WEBHOOK_TIMEOUT) as response:
+            response.read()
+    except urllib.error.HTTPError as e:
+        # 4xx (salvo 408/429) no se arregla reintentando
+        if 400 <= e.code < 500 and e.code not in (408, 429):
+            raise PermanentJobError(f"Webhook respondió {e.code}") from e
+        raise
+
+
+def register_handlers(queue: JobQueue) -> JobQueue:
+    """Registra los manejadores de notificaciones y métricas en la cola"""
+
+    @queue.handler("send_email")
+    def _send_email(payload: Dict) -> None:
+        send_email(payload["to"], payload["subject"], payload["body"])
+
+    @queue.handler("department_webhook")
+    def _department_webhook(payload: Dict) -> None:
+        url = webhook_url(payload["department"])
+        if url:
+            post_webhook(url, payload)
+
+    @queue.handler("update_metrics")
+    def _update_metrics(payload: Dict) -> None:
+        update_metrics(payload["field"], payload.get("increment", 1), db_path=queue.db_path)
+
+    return queue
+
+
+# ----------------------------------------------------------------------
+# Trabajos de cada evento (se encolan en la transacción que lo registra)
+# ----------------------------------------------------------------------
+def enqueue_case_jobs(queue: JobQueue, case: Dict, conn=None) -> None:
+    """Métrica, correo al ciudadano y webhook del departamento de un caso derivado"""
+    case_id = case["id"]
+    department = case.get("department")
+    department_name = getattr(department, "name", department)
+    department_label = getattr(department, "value", department)
+    queue.enqueue("update_metrics", {"field": "complex_cases"}, f"case:{case_id}:metrics", conn=conn)
+    if case.get("citizen_email") and smtp_configured():
+        queue.enqueue("send_email", {
+            "to": case["citizen_email"],
+            "subject": f"MIA - Caso N° {case_id} derivado",
+            "body": (
+                f"Hola {case.get('citizen_name', '')},\n\n"
+                f"Tu consulta fue registrada como el caso N° {case_id} "
+                f"(prioridad {case.get('priority', '')}) y asignada a {department_label}.\n"
+                "Un agente se comunicará contigo por este medio.\n\n"
+                "MIA - Asistente municipal"
+            ),
+        }, f"case:{case_id}:email", conn=conn)
+    if webhook_url(department_name):
+        queue.enqueue("department_webhook", {
+            "department": department_name,
+            "case": {key: getattr(value, "name", value) for key, value in case.items()},
+        }, f"case:{case_id}:webhook", conn=conn)
+
+
+def enqueue_appointment_jobs(queue: JobQueue, appointment: Dict, conn=None) -> None:
+    """Métrica y correo de confirmación de un turno"""
+    appointment_id = appointment["id"]
+    queue.enqueue("update_metrics", {"field": "appointments"}, f"appointment:{appointment_id}:metrics", conn=conn)
+    if appointment.get("citizen_email") and smtp_configured():
+        queue.enqueue("send_email", {
+            "to": appointment["citizen_email"],
+            "subject": f"MIA - Turno confirmado: {appointment.get('procedure', '')}",
+            "body": (
+                f"Hola {appointment.get('citizen_name', '')},\n\n"
+                f"Tu turno para {appointment.get('procedure', '')} quedó confirmado el "
+                f"{appointment.get('date')} a las {appointment.get('time')}.\n"
+                f"Código de turno: {appointment_id}\n\n"
+                "MIA - Asistente municipal"
+            ),
+        }, f"appointment:{appointment_id}:email", conn=conn)
@@ -0,0 +1,202 @@
+# registries.py
+"""
+Registros en memoria con acceso O(1) por ID e índices secundarios.
+
+Reemplazan las listas que se recorrían linealmente para buscar citas y casos.
+Los registros se modifican a través de `update()` para que los índices
+secundarios (ciudadano, fecha, departamento, estado) se mantengan al día.
+"""
+
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional
+
+KeyFunction = Callable[[Any], Hashable]
+
+
+class IndexedRegistry:
+    """Registro por ID con índices secundarios configurables"""
+
+    def __init__(self, indexes: Dict[str, KeyFunction]):
+        self._by_id: Dict[str, Any] = {}
+        self._key_functions = indexes
+        # índice -> clave -> ids (dict para conservar el orden de inserción)
+        self._indexes: Dict[str, Dict[Hashable, Dict[str, None]]] = {name: {} for name in indexes}
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self._by_id.values())
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self._by_id
+
+    def _index(self, record):
+        for name, key_function in self._key_functions.items():
+            self._indexes[name].setdefault(key_function(record), {})[record.id] = None
+
+    def _unindex(self, record):
+        for name, key_function in self._key_functions.items():
+            bucket = self._indexes[name].get(key_function(record))
+            if bucket is not None:
+                bucket.pop(record.id, None)
+                if not bucket:
+                    del self._indexes[name][key_function(record)]
+
+    def add(self, record):
+        """Agrega (o reemplaza) un registro"""
+        previous = self._by_id.get(record.id)
+        if previous is not None:
+            self._unindex(previous)
+        self._by_id[record.id] = record
+        self._index(record)
+
+    def get(self, record_id: str) -> Optional[Any]:
+        return self._by_id.get(record_id)
+
+    def remove(self, record_id: str) -> Optional[Any]:
+        record = self._by_id.pop(record_id, None)
+        if record is not None:
+            self._unindex(record)
+        return record
+
+    def update(self, record_id: str, **changes) -> Optional[Any]:
+        """Modifica campos de un registro y actualiza sus índices"""
+        record = self._by_id.get(record_id)
+        if record is None:
+            return None
+        self._unindex(record)
+        for field, value in changes.items():
+            setattr(record, field, value)
+        self._index(record)
+        return record
+
+    def find(self, index: str, key: Hashable) -> List[Any]:
+        """Registros cuyo índice `index` vale `key`"""
+        ids = self._indexes[index].get(key, {})
+        return [self._by_id[record_id] for record_id in ids]
+
+    def count(self, index: str, key: Hashable) -> int:
+        return len(self._indexes[index].get(key, {}))
+
+    def keys(self, index: str) -> List[Hashable]:
+        """Valores distintos de un índice"""
+        return list(self._indexes[index])
+
+
+class AppointmentRegistry(IndexedRegistry):
+    """Citas indexadas por ciudadano, fecha y estado"""
+
+    def __init__(self):
+        super().__init__({
+            "citizen": lambda apt: apt.citizen_email,
+            "date": lambda apt: apt.date,
+            "status": lambda apt: apt.status,
+        })
+
+
+class CaseRegistry(IndexedRegistry):
+    """Casos complejos indexados por ciudadano, departamento y estado"""
+
+    def __init__(self):
+        super().__init__({
+            "citizen": lambda case: case.citizen_email,
+            "department": lambda case: case.department,
+            "status": lambda case: case.status,
+        })
+
+
+# ------------------------------------------------------------------
+# Benchmark: python frontend/registries.py [n]
+# ------------------------------------------------------------------
+def _benchmark(n: int = 100_000, lookups: int = 1_000):
+    import gc
+    import random
+    import time
+    import tracemalloc
+    from dataclasses import dataclass
+
+    fields = dict(
+        citizen_name="Ciudadano", procedure="Renovación de DNI", time="09:00",
+        status="scheduled", created_at="2025-11-01T09:00:00", notes="",
+    )
+
+    @dataclass
+    class PlainAppointment:
+        id: str
+        citizen_id: str
+        citizen_name: str
+        citizen_email: str
+        procedure: str
+        date: str
+        time: str
+        status: str
+        created_at: str
+        notes: str = ""
+
+    @dataclass(slots=True)
+    class SlottedAppointment:
+        id: str
+        citizen_id: str
+        citizen_name: str
+        citizen_email: str
+        procedure: str
+        date: str
+        time: str
+        status: str
+        created_at: str
+        notes: str = ""
+
+    def build(cls):
+        return [
+            cls(id=f"APT_{i}", citizen_id=str(i % 5000), citizen_email=f"c{i % 5000}@mail.gov",
+                date=f"2026-{1 + i % 6:02d}-{1 + i % 28:02d}", **fields)
+            for i in range(n)
+        ]
+
+    def measure(factory):
+        gc.collect()
+        tracemalloc.start()
+        container = factory()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return container, size
+
+    targets = [f"APT_{random.randrange(n)}" for _ in range(lookups)]
+
+    plain, plain_bytes = measure(lambda: build(PlainAppointment))
+    start = time.perf_counter()
+    for target in targets:
+        next(apt for apt in plain if apt.id == target)
+    plain_lookup = (time.perf_counter() - start) / lookups
+    del plain
+
+    slotted, slotted_bytes = measure(lambda: build(SlottedAppointment))
+    del slotted
+
+    def build_registry():
+        registry = AppointmentRegistry()
+        for apt in build(SlottedAppointment):
+            registry.add(apt)
+        return registry
+
+    registry, registry_bytes = measure(build_registry)
+    start = time.perf_counter()
+    for target in targets:
+        registry.get(target)
+    registry_lookup = (time.perf_counter() - start) / lookups
+    start = time.perf_counter()
+    for i in range(lookups):
+        registry.find("citizen", f"c{i % 5000}@mail.gov")
+    citizen_lookup = (time.perf_counter() - start) / lookups
+
+    print(f"{n} citas")
+    print(f"  lista + dataclass:     {plain_lookup * 1e6:10.1f} µs/búsqueda por ID  {plain_bytes / 2**20:7.1f} MiB")
+    print(f"  lista + __slots__:     {'':>10}                         {slotted_bytes / 2**20:7.1f} MiB")
+    print(f"  registro + __slots__:  {registry_lookup * 1e6:10.1f} µs/búsqueda por ID  {registry_bytes / 2**20:7.1f} MiB (con índices)")
+    print(f"  registro por ciudadano:{citizen_lookup * 1e6:10.1f} µs/búsqueda")
+
+
+if __name__ == "__main__":
+    import sys
+
+    _benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100_000)
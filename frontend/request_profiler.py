@@ -0,0 +1,228 @@
+# request_profiler.py
+"""
+Perfilado opcional de peticiones con volcado para flamegraphs.
+
+Se activa con MIA_PROFILE_REQUESTS=1 o desde el panel de administración.
+Una fracción de las peticiones (MIA_PROFILE_SAMPLE, por defecto 0.1) se
+perfila con un muestreador: un hilo toma la pila del hilo de la petición
+cada MIA_PROFILE_INTERVAL_MS ms. Cada perfil se guarda en MIA_PROFILE_DIR:
+- .collapsed: pilas colapsadas (flamegraph.pl, speedscope, inferno)
+- .speedscope.json: formato nativo de https://www.speedscope.app
+Solo se conservan los MIA_PROFILE_KEEP más recientes. El nombre del
+archivo incluye la duración, así el panel lista las peticiones más lentas
+de todos los procesos sin otra base de datos.
+
+Las llamadas al LLM corren en hilos del governor: en el perfil aparecen como
+espera dentro de llm_governor.call / stream.
+"""
+
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from typing import Dict, List
+
+PROFILE_DIR = os.getenv(
+    "MIA_PROFILE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles"),
+)
+FORMATS = ("collapsed", "speedscope")
+
+
+class _Sampler(threading.Thread):
+    """Toma la pila de un hilo a intervalos fijos"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(name="request-profiler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                self.samples[tuple(reversed(stack))] += 1
+
+    def stop(self) -> Counter:
+        self._stop_event.set()
+        self.join()
+        return self.samples
+
+
+def _frame_label(frame) -> str:
+    name, filename, line = frame
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+class RequestProfiler:
+    """Decide qué peticiones perfilar y guarda sus perfiles con rotación"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        sample_rate: float = 0.1,
+        interval_ms: float = 5.0,
+        directory: str = PROFILE_DIR,
+        keep: int = 200,
+        formats=FORMATS,
+    ):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.interval = interval_ms / 1000
+        self.directory = directory
+        self.keep = keep
+        self.formats = tuple(formats)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+    @classmethod
+    def from_env(cls) -> "RequestProfiler":
+        return cls(
+            enabled=os.getenv("MIA_PROFILE_REQUESTS", "0") == "1",
+            sample_rate=float(os.getenv("MIA_PROFILE_SAMPLE", "0.1")),
+            interval_ms=float(os.getenv("MIA_PROFILE_INTERVAL_MS", "5")),
+            keep=int(os.getenv("MIA_PROFILE_KEEP", "200")),
+            formats=os.getenv("MIA_PROFILE_FORMAT", ",".join(FORMATS)).split(","),
+        )
+
+    # ------------------------------------------------------------------
+    # Perfilado
+    # ------------------------------------------------------------------
+    @contextmanager
+    def profile(self, label: str):
+        """
+        Perfila el bloque si el perfilador está activo y la petición cae en la
+        muestra. Anidado dentro de otro perfil del mismo hilo no hace nada.
+        """
+        if (
+            not self.enabled
+            or getattr(self._local, "active", False)
+            or random.random() >= self.sample_rate
+        ):
+            yield
+            return
+        self._local.active = True
+        sampler = _Sampler(threading.get_ident(), self.interval)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            samples = sampler.stop()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self._local.active = False
+            try:
+                self._write(label, elapsed_ms, samples)
+            except OSError:
+                pass  # El perfilado nunca debe romper la petición
+
+    def wrap(self, label: str):
+        """Decorador: perfila cada llamada a la función"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.profile(label):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # ------------------------------------------------------------------
+    # Archivos
+    # ------------------------------------------------------------------
+    def _write(self, label: str, elapsed_ms: float, samples: Counter) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._sequence += 1
+            sequence = self._sequence
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        base = os.path.join(
+            self.directory, f"{stamp}_{label}_{elapsed_ms:.0f}ms_{os.getpid()}-{sequence}"
+        )
+        if "collapsed" in self.formats:
+            with open(base + ".collapsed", "w", encoding="utf-8") as f:
+                for stack, count in samples.most_common():
+                    f.write(";".join(_frame_label(frame) for frame in stack) + f" {count}\n")
+        if "speedscope" in self.formats:
+            with open(base + ".speedscope.json", "w", encoding="utf-8") as f:
+                json.dump(self._speedscope(label, elapsed_ms, samples), f)
+        self._rotate()
+
+    def _speedscope(self, label: str, elapsed_ms: float, samples: Counter) -> Dict:
+        frames, index = [], {}
+        stacks, weights = [], []
+        for stack, count in samples.items():
+            ids = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                ids.append(index[frame])
+            stacks.append(ids)
+            weights.append(count * self.interval * 1000)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": f"{label} ({elapsed_ms:.0f} ms)",
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": elapsed_ms,
+                "samples": stacks,
+                "weights": weights,
+            }],
+            "exporter": "mia request_profiler",
+        }
+
+    def _profiles(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        # Un perfil = un nombre base, aunque tenga varios formatos
+        return sorted({name.split(".", 1)[0] for name in names if "ms_" in name})
+
+    def _rotate(self) -> None:
+        profiles = self._profiles()
+        for base in profiles[:max(0, len(profiles) - self.keep)]:
+            for suffix in (".collapsed", ".speedscope.json"):
+                try:
+                    os.remove(os.path.join(self.directory, base + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def slowest(self, n: int = 20) -> List[Dict]:
+        """Peticiones perfiladas más lentas entre las conservadas"""
+        rows = []
+        for base in self._profiles():
+            try:
+                stamp, rest = base.split("_", 1)
+                label, duration, pid = rest.rsplit("_", 2)
+                rows.append({
+                    "fecha": datetime.strptime(stamp, "%Y%m%d-%H%M%S"),
+                    "petición": label,
+                    "duración_ms": float(duration[:-2]),
+                    "proceso": pid.split("-")[0],
+                    "archivo": os.path.join(self.directory, base),
+                })
+            except ValueError:
+                continue
+        return sorted(rows, key=lambda row: row["duración_ms"], reverse=True)[:n]
+
+
+# Instancia del proceso (como el governor del LLM)
+profiler = RequestProfiler.from_env()
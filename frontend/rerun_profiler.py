@@ -0,0 +1,92 @@
+# rerun_profiler.py
+"""
+Perfil del tiempo de servidor de cada rerun de Streamlit.
+
+Cada ejecución del script marca etapas (arranque, estilos, render...) y al
+terminar guarda el total en ms junto con la interacción (sección de la app).
+Se conservan las últimas N ejecuciones por proceso; el panel de
+administración muestra p50/p95 por interacción y etapa.
+
+Para comparar antes/después del cacheo de recursos, ejecutar la app con
+MIA_RERUN_CACHE=0 (sin st.cache_resource) y con el valor por defecto.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class RerunTimer:
+    """Cronómetro de una ejecución del script"""
+
+    def __init__(self, profiler: "RerunProfiler"):
+        self.profiler = profiler
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.stages: Dict[str, float] = {}
+        self.finished = False
+
+    def mark(self, stage: str) -> None:
+        """Cierra la etapa actual: el tiempo desde la marca anterior va a `stage`"""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._last) * 1000
+        self._last = now
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def finish(self, interaction: str, stage: str = "render") -> Optional[Dict]:
+        if self.finished:
+            return None
+        self.finished = True
+        self.mark(stage)
+        return self.profiler.record(interaction, self.total_ms(), self.stages)
+
+
+class RerunProfiler:
+    """Últimas `max_runs` ejecuciones del proceso (compartido entre sesiones)"""
+
+    def __init__(self, max_runs: int = 500):
+        self._runs = deque(maxlen=max_runs)
+        self._lock = threading.Lock()
+
+    def start(self) -> RerunTimer:
+        return RerunTimer(self)
+
+    def record(self, interaction: str, total_ms: float, stages: Dict[str, float]) -> Dict:
+        run = {"ts": time.time(), "interaction": interaction, "total_ms": total_ms, **stages}
+        with self._lock:
+            self._runs.append(run)
+        return run
+
+    def runs(self) -> List[Dict]:
+        with self._lock:
+            return list(self._runs)
+
+    def summary(self) -> List[Dict]:
+        """p50/p95 del total y p50 de cada etapa, por interacción"""
+        by_interaction: Dict[str, List[Dict]] = {}
+        for run in self.runs():
+            by_interaction.setdefault(run["interaction"], []).append(run)
+        rows = []
+        for interaction, runs in sorted(by_interaction.items()):
+            totals = [run["total_ms"] for run in runs]
+            row = {
+                "interacción": interaction,
+                "reruns": len(runs),
+                "p50_ms": _percentile(totals, 50),
+                "p95_ms": _percentile(totals, 95),
+            }
+            stages = {key for run in runs for key in run} - {"ts", "interaction", "total_ms"}
+            for stage in sorted(stages):
+                row[f"{stage}_p50_ms"] = _percentile([run.get(stage, 0.0) for run in runs], 50)
+            rows.append(row)
+        return rows
@@ -0,0 +1,211 @@
+# service.py
+"""
+Capa de servicio de MIA: chat, turnos y estado de casos.
+
+La usan tanto el servidor HTTP (api_server.py) como la app de Streamlit en
+modo local, para que ambos persistan citas, casos y métricas de la misma
+forma. Todas las respuestas son dicts serializables a JSON.
+
+Al derivar un caso o reservar un turno solo se escribe el registro (y sus
+trabajos, en la misma transacción); correos, webhooks y métricas los
+ejecuta la cola de trabajos en segundo plano (job_queue.py).
+"""
+
+import time
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
+
+from appointment_manager import DepartmentType
+from database import (
+    DB_PATH,
+    get_case,
+    insert_appointment,
+    insert_cases,
+    transaction,
+    update_metrics,
+)
+from case_queues import queue_overview
+from job_queue import JobQueue
+from notifications import enqueue_appointment_jobs, enqueue_case_jobs, register_handlers
+from latency_metrics import latency
+from deadline import Deadline, degradation_stats
+
+
+def _serializable_case(case: Optional[Dict]) -> Optional[Dict]:
+    """Reemplaza el Enum del departamento por su nombre visible"""
+    if not case:
+        return case
+    case = dict(case)
+    department = case.get("department")
+    if hasattr(department, "value"):
+        case["department"] = department.value
+    return case
+
+
+class MiaService:
+    """Operaciones de negocio sobre un QueryProcessor ya inicializado"""
+
+    def __init__(self, query_processor, docsearch, db_path: str = DB_PATH, jobs: Optional[JobQueue] = None):
+        self.query_processor = query_processor
+        self.docsearch = docsearch
+        self.db_path = db_path
+        self.jobs = jobs or register_handlers(JobQueue(db_path))
+        # Retoma los trabajos pendientes de ejecuciones anteriores
+        self.jobs.start()
+
+    # ------------------------------------------------------------------
+    # Chat
+    # ------------------------------------------------------------------
+    def chat(
+        self,
+        query: str,
+        citizen_id: str,
+        citizen_name: str,
+        citizen_email: str,
+        stream: bool = False,
+        deadline: Optional[Deadline] = None,
+        session_id: str = "",
+    ) -> Dict:
+        """
+        Procesa una consulta y persiste sus efectos (caso derivado, métricas).
+        Con stream=True, "primary_response" de una consulta informativa es un
+        iterador de fragmentos de texto. Con deadline, la respuesta se degrada
+        si no alcanza el tiempo (ver deadline.py). session_id identifica la
+        conversación para seguir las repreguntas (ver follow_up.py).
+        Registra la latencia total (al terminar el stream, si lo hay), el
+        tiempo hasta el primer fragmento y el de las escrituras en SQLite.
+        """
+        started = time.perf_counter()
+        with latency.timed("db_write"):
+            update_metrics("total_queries", db_path=self.db_path)
+        response_data = self.query_processor.process_query(
+            query=query,
+            docsearch=self.docsearch,
+            citizen_id=citizen_id,
+            citizen_name=citizen_name,
+            citizen_email=citizen_email,
+            stream=stream,
+            deadline=deadline,
+            session_id=session_id,
+        )
+        if response_data.get("case"):
+            # Guardar el caso y encolar sus notificaciones en una sola transacción
+            try:
+                with latency.timed("db_write"), transaction(self.db_path) as conn:
+                    insert_cases([response_data["case"]], self.db_path, conn=conn)
+                    enqueue_case_jobs(self.jobs, response_data["case"], conn=conn)
+            except Exception:
+                # Sin fila en SQLite el caso no existe: se olvida también en memoria
+                self.query_processor.case_router.discard_cases([response_data["case"]["id"]])
+                raise
+            response_data["case"] = _serializable_case(response_data["case"])
+        answer = response_data.get("primary_response")
+        if answer is not None and not isinstance(answer, str):
+            response_data["primary_response"] = latency.timed_stream(
+                "total", answer, started, first_chunk_stage="ttft"
+            )
+        else:
+            latency.record("total", (time.perf_counter() - started) * 1000)
+        return response_data
+
+    # ------------------------------------------------------------------
+    # Turnos
+    # ------------------------------------------------------------------
+    def available_dates(self, procedure: str = "", limit: Optional[int] = None) -> List[str]:
+        dates = self.query_processor.appointment_manager.get_available_dates(procedure, limit=limit)
+        return [str(day) for day in dates]
+
+    def start_times(self, date: str, procedure: str = "") -> List[str]:
+        return self.query_processor.appointment_manager.get_start_times(date, procedure)
+
+    def next_free_slots(self, procedure: str = "", from_date: Optional[str] = None, n: int = 5) -> List[Tuple[str, str]]:
+        return self.query_processor.appointment_manager.next_free_slots(procedure, from_date, n)
+
+    def book(
+        self,
+        citizen_id: str,
+        citizen_name: str,
+        citizen_email: str,
+        procedure: str,
+        date: str,
+        time: str,
+        notes: str = "",
+    ) -> Tuple[bool, str, Optional[Dict]]:
+        """
+        Reserva un turno y guarda la cita; la confirmación por correo sale
+        por la cola de trabajos. Returns: (success, message, appointment)
+        """
+        success, message, appointment = self.query_processor.appointment_manager.schedule_appointment(
+            citizen_id=citizen_id,
+            citizen_name=citizen_name,
+            citizen_email=citizen_email,
+            procedure=procedure,
+            date=date,
+            time=time,
+            notes=notes,
+        )
+        if not success:
+            return False, message, None
+        with transaction(self.db_path) as conn:
+            insert_appointment(appointment, self.db_path, conn=conn)
+            enqueue_appointment_jobs(self.jobs, asdict(appointment), conn=conn)
+        return True, message, asdict(appointment)
+
+    # ------------------------------------------------------------------
+    # Métricas
+    # ------------------------------------------------------------------
+    def llm_metrics(self) -> Dict:
+        """Contadores del governor del LLM (espera en cola, reintentos, circuito), coalescencia, FAQ, degradaciones, repreguntas y caché de embeddings"""
+        from llm import governor
+        from chain import faq_store
+        from vector_db import embeddings
+        return {
+            **governor.metrics(),
+            **self.query_processor.single_flight.stats(),
+            **faq_store.stats(),
+            **degradation_stats(),
+            **self.query_processor.follow_ups.stats(),
+            **embeddings.stats(),
+        }
+
+    def memory_report(self, session_states=()) -> Dict:
+        """Memoria del proceso por componente: modelo, índice, docstore y estado de sesión (MiB)"""
+        from memory_report import rss_breakdown
+        from vector_db import embeddings
+        return rss_breakdown(self.docsearch, embeddings, session_states)
+
+    def tenant_metrics(self) -> List[Dict]:
+        """Índices de municipios en memoria: cargas en frío, aciertos en caliente y desalojos"""
+        from tenants import tenant_cache
+        return tenant_cache.stats()
+
+    # ------------------------------------------------------------------
+    # Casos
+    # ------------------------------------------------------------------
+    def case_status(self, case_id: str) -> Optional[Dict]:
+        """Estado de un caso; si lo creó otro proceso, se lee de SQLite"""
+        case = self.query_processor.case_router.get_case_status(case_id)
+        if case is not None:
+            return _serializable_case(asdict(case))
+        case = get_case(case_id, self.db_path)
+        if case and case.get("department") in DepartmentType.__members__:
+            case["department"] = DepartmentType[case["department"]].value
+        return case
+
+    # ------------------------------------------------------------------
+    # Despacho de casos a funcionarios
+    # ------------------------------------------------------------------
+    def dispatch_overview(self) -> List[Dict]:
+        """Casos pendientes y tiempos de espera por departamento"""
+        return queue_overview(self.db_path)
+
+    def assign_next_case(self, department: str, officer: str) -> Optional[Dict]:
+        """Asigna al funcionario el siguiente caso de su departamento (nombre del Enum, ej. "LEGAL")"""
+        case = self.query_processor.case_router.assign_next_case(DepartmentType[department], officer)
+        return _serializable_case(asdict(case)) if case else None
+
+    def assign_case(self, case_id: str, officer: str) -> Tuple[bool, str]:
+        return self.query_processor.case_router.assign_case(case_id, officer)
+
+    def release_case(self, case_id: str) -> Tuple[bool, str]:
+        return self.query_processor.case_router.release_case(case_id)
@@ -0,0 +1,212 @@
+# single_flight.py
+"""
+Coalescencia de llamadas idénticas en curso ("single flight").
+
+Si llegan varias consultas iguales mientras la primera todavía espera al LLM,
+solo la primera (líder) hace la llamada y las demás esperan su resultado.
+Funciona desde hilos (do, do_stream) y desde corrutinas (do_async); un
+líder síncrono puede servir a seguidores asíncronos y viceversa.
+
+Un resultado degradado (el líder se quedó sin tiempo y usó un respaldo) no
+se comparte: `degraded` indica si lo fue y, en ese caso, cada seguidor
+ejecuta su propia llamada con su propio presupuesto.
+"""
+
+import asyncio
+import hashlib
+import re
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+from keyword_matcher import normalize
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def query_key(query: str, documents: Iterable = ()) -> str:
+    """Clave: consulta normalizada (sin tildes, mayúsculas ni signos) + hash del contexto"""
+    text = " ".join(_PUNCTUATION.sub(" ", normalize(query)).split())
+    digest = hashlib.sha1()
+    for doc in documents:
+        digest.update(getattr(doc, "page_content", str(doc)).encode("utf-8"))
+        digest.update(b"\0")
+    return f"{text}|{digest.hexdigest()}"
+
+
+class _Broadcast:
+    """Reparte los fragmentos de un único stream a todos los consumidores"""
+
+    def __init__(
+        self,
+        source: Iterator[str],
+        on_done: Optional[Callable[["_Broadcast"], None]] = None,
+        degraded: Optional[Callable[[], bool]] = None,
+    ):
+        self.chunks: List[str] = []
+        self.done = False
+        self.error = None
+        self._on_done = on_done
+        self._degraded = degraded
+        self._cond = threading.Condition()
+        threading.Thread(target=self._pump, args=(source,), daemon=True).start()
+
+    def _pump(self, source: Iterator[str]) -> None:
+        try:
+            for chunk in source:
+                with self._cond:
+                    self.chunks.append(chunk)
+                    self._cond.notify_all()
+        except BaseException as e:
+            self.error = e if isinstance(e, Exception) else RuntimeError("interrumpida")
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+            # Aunque nadie termine de leerlo (cliente desconectado)
+            if self._on_done is not None:
+                self._on_done(self)
+
+    def __iter__(self) -> Iterator[str]:
+        position = 0
+        while True:
+            with self._cond:
+                while position >= len(self.chunks) and not self.done:
+                    self._cond.wait()
+                pending = self.chunks[position:]
+                finished = self.done
+            for chunk in pending:
+                yield chunk
+            position += len(pending)
+            if finished and position >= len(self.chunks):
+                if self.error is not None:
+                    raise self.error
+                return
+
+    def degraded(self) -> bool:
+        """¿El líder respondió con un respaldo? (se consulta con el primer fragmento)"""
+        return self._degraded is not None and self._degraded()
+
+
+class SingleFlight:
+    """Tabla de llamadas en curso por clave, con contadores"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, key: str):
+        """Returns: (future, es_líder)"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self._calls[key] = future
+            self.leaders += 1
+            return future, True
+
+    def _finish(self, key: str, future: Future, result=None, error=None, degraded=None) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            # Los seguidores reciben (resultado, ¿degradado?)
+            future.set_result((result, degraded is not None and degraded()))
+
+    def _not_shared(self) -> None:
+        with self._lock:
+            self.coalesced -= 1
+            self.leaders += 1
+
+    def do(self, key: str, fn: Callable[[], object], degraded: Optional[Callable[[], bool]] = None):
+        """
+        Ejecuta fn() o espera el resultado de la llamada idéntica en curso.
+        degraded(): la llamada del líder usó un respaldo (no se comparte)
+        """
+        future, leader = self._join(key)
+        if not leader:
+            result, was_degraded = future.result()
+            if not was_degraded:
+                return result
+            self._not_shared()
+            return fn()
+        try:
+            result = fn()
+        except BaseException as e:
+            # También ante KeyboardInterrupt/SystemExit: los seguidores no pueden quedar colgados
+            self._finish(key, future, error=e if isinstance(e, Exception) else RuntimeError("cancelada"))
+            raise
+        self._finish(key, future, result, degraded=degraded)
+        return result
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable], degraded: Optional[Callable[[], bool]] = None):
+        """Versión para corrutinas: fn() devuelve un awaitable"""
+        future, leader = self._join(key)
+        if not leader:
+            result, was_degraded = await asyncio.wrap_future(future)
+            if not was_degraded:
+                return result
+            self._not_shared()
+            return await fn()
+        try:
+            result = await fn()
+        except BaseException as e:
+            # También ante cancelación: los seguidores no pueden quedar colgados
+            self._finish(key, future, error=e if isinstance(e, Exception) else RuntimeError("cancelada"))
+            raise
+        self._finish(key, future, result, degraded=degraded)
+        return result
+
+    def do_stream(
+        self,
+        key: str,
+        fn: Callable[[], Iterator[str]],
+        degraded: Optional[Callable[[], bool]] = None,
+    ) -> Iterator[str]:
+        """
+        Comparte un stream: el primero lo inicia y los demás reciben los
+        mismos fragmentos (desde el principio) mientras siga en curso.
+        """
+        with self._lock:
+            broadcast = self._streams.get(key)
+            if broadcast is not None and not broadcast.done:
+                self.coalesced += 1
+                return self._follow(broadcast, fn)
+            broadcast = _Broadcast(fn(), on_done=lambda done: self._release(key, done), degraded=degraded)
+            self._streams[key] = broadcast
+            self.leaders += 1
+        return iter(broadcast)
+
+    def _follow(self, broadcast: _Broadcast, fn: Callable[[], Iterator[str]]) -> Iterator[str]:
+        """Fragmentos del líder, salvo que su respuesta sea un respaldo degradado"""
+        chunks = iter(broadcast)
+        for chunk in chunks:
+            # El respaldo se decide antes de emitir el primer fragmento
+            if broadcast.degraded():
+                self._not_shared()
+                yield from fn()
+                return
+            yield chunk
+            break
+        yield from chunks
+
+    def _release(self, key: str, broadcast: _Broadcast) -> None:
+        """Saca el stream de la tabla al terminar o fallar (lo lea o no el líder)"""
+        with self._lock:
+            if self._streams.get(key) is broadcast:
+                del self._streams[key]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            total = self.leaders + self.coalesced
+            return {
+                "llm_calls_issued": self.leaders,
+                "coalesced": self.coalesced,
+                "coalesced_rate": self.coalesced / total if total else 0.0,
+            }
@@ -0,0 +1,252 @@
+# slot_calendar.py
+"""
+Calendario compacto de turnos basado en bitsets.
+
+Cada día de la ventana es un entero de Python donde el bit i representa el
+horario i de la grilla de la oficina. Los días abiertos, feriados y cierres
+parciales son máscaras; las reservas vienen de SlotStore (SQLite), que sigue
+siendo la fuente de verdad para reservar.
+"""
+
+import threading
+import time as _time
+from datetime import date as Date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from slot_store import SlotStore
+
+# Grilla de horarios por defecto (inicio de cada turno de 30 minutos)
+DEFAULT_SLOT_TIMES = [
+    "09:00", "09:30", "10:00", "10:30", "11:00", "11:30",
+    "14:00", "14:30", "15:00", "15:30", "16:00", "16:30",
+]
+SLOT_MINUTES = 30
+WINDOW_DAYS = 183  # Ventana móvil de seis meses
+WORKING_DAYS = (0, 1, 2, 3, 4)  # Lunes a viernes
+
+# Cantidad de turnos consecutivos que requiere cada trámite (por palabra clave)
+PROCEDURE_SLOTS = {
+    "licencia": 2,
+    "construcción": 2,
+    "matrimonio": 2,
+    "habilitación": 2,
+}
+
+
+def slots_for_procedure(procedure: str) -> int:
+    """Turnos consecutivos necesarios para un trámite (1 por defecto)"""
+    procedure_lower = (procedure or "").lower()
+    return max(
+        (slots for keyword, slots in PROCEDURE_SLOTS.items() if keyword in procedure_lower),
+        default=1
+    )
+
+
+def _minutes(time_str: str) -> int:
+    hours, minutes = time_str.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+class SlotCalendar:
+    """Disponibilidad de una oficina como un bitset por día"""
+
+    def __init__(
+        self,
+        slot_store: SlotStore,
+        slot_times: Optional[List[str]] = None,
+        window_days: int = WINDOW_DAYS,
+        working_days: Iterable[int] = WORKING_DAYS,
+        holidays: Iterable[Date] = (),
+        closures: Optional[Dict[Date, Iterable[str]]] = None,
+        refresh_seconds: float = 5.0,
+    ):
+        self.slot_store = slot_store
+        self.slot_times = list(slot_times or DEFAULT_SLOT_TIMES)
+        self.window_days = window_days
+        self.working_days = set(working_days)
+        self.holidays: Set[Date] = set(holidays)
+        self.refresh_seconds = refresh_seconds
+
+        self._index = {t: i for i, t in enumerate(self.slot_times)}
+        self._full_mask = (1 << len(self.slot_times)) - 1
+        # Bit i = el turno i termina justo cuando empieza el i+1 (sin pausa intermedia)
+        self._contiguous = 0
+        for i in range(len(self.slot_times) - 1):
+            if _minutes(self.slot_times[i + 1]) - _minutes(self.slot_times[i]) == SLOT_MINUTES:
+                self._contiguous |= 1 << i
+        self._closures: Dict[Date, int] = {}
+        for day, times in (closures or {}).items():
+            self.add_closure(day, times)
+
+        self._start: Optional[Date] = None
+        self._open: List[int] = []
+        self._booked: List[int] = []
+        self._refreshed_at = 0.0
+        # Las sesiones de Streamlit y los hilos de la API comparten el calendario;
+        # reentrante porque refresh() y _roll() se llaman entre sí
+        self._lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # Máscaras y ventana
+    # ------------------------------------------------------------------
+    def add_holiday(self, day: Date):
+        """Cierra un día completo"""
+        with self._lock:
+            self.holidays.add(day)
+            self._set_open(day)
+
+    def add_closure(self, day: Date, times: Iterable[str]):
+        """Cierra horarios puntuales de un día"""
+        with self._lock:
+            mask = self._closures.get(day, 0)
+            for t in times:
+                if t in self._index:
+                    mask |= 1 << self._index[t]
+            self._closures[day] = mask
+            self._set_open(day)
+
+    def _open_mask(self, day: Date) -> int:
+        if day.weekday() not in self.working_days or day in self.holidays:
+            return 0
+        return self._full_mask & ~self._closures.get(day, 0)
+
+    def _set_open(self, day: Date):
+        offset = self._offset(day)
+        if offset is not None:
+            self._open[offset] = self._open_mask(day)
+
+    def _offset(self, day: Date) -> Optional[int]:
+        if self._start is None:
+            return None
+        offset = (day - self._start).days
+        return offset if 0 <= offset < len(self._open) else None
+
+    def _roll(self):
+        """Avanza la ventana de forma perezosa (primer día = mañana)"""
+        with self._lock:
+            start = datetime.now().date() + timedelta(days=1)
+            if self._start == start:
+                if _time.monotonic() - self._refreshed_at > self.refresh_seconds:
+                    self.refresh()
+                return
+
+            shift = (start - self._start).days if self._start else self.window_days
+            if 0 < shift < self.window_days:
+                # Descartar días vencidos y agregar los nuevos al final
+                del self._open[:shift]
+                del self._booked[:shift]
+            else:
+                self._open, self._booked = [], []
+            self._start = start
+            first_new = len(self._open)
+            for i in range(first_new, self.window_days):
+                self._open.append(self._open_mask(start + timedelta(days=i)))
+                self._booked.append(0)
+            self.refresh()
+
+    def refresh(self):
+        """Relee las reservas de la ventana desde SQLite (una sola consulta)"""
+        with self._lock:
+            if self._start is None:
+                self._roll()
+                return
+            end = self._start + timedelta(days=self.window_days - 1)
+            booked = [0] * self.window_days
+            for day_str, time_str in self.slot_store.booked_between(str(self._start), str(end)):
+                offset = (Date.fromisoformat(day_str) - self._start).days
+                bit = self._index.get(time_str)
+                if bit is not None and 0 <= offset < self.window_days:
+                    booked[offset] |= 1 << bit
+            self._booked = booked
+            self._refreshed_at = _time.monotonic()
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+    def _free(self, offset: int) -> int:
+        return self._open[offset] & ~self._booked[offset]
+
+    def _run_starts(self, free: int, slots: int) -> int:
+        """Bits de inicio de `slots` turnos libres y consecutivos"""
+        starts = free
+        for j in range(1, slots):
+            starts &= (free >> j) & (self._contiguous >> (j - 1))
+        return starts
+
+    def day_slots(self, day: Date) -> Dict[str, bool]:
+        """Horarios de un día (hora -> libre); vacío si el día no atiende"""
+        with self._lock:
+            self._roll()
+            offset = self._offset(day)
+            if offset is None or not self._open[offset]:
+                return {}
+            free = self._free(offset)
+            return {
+                t: bool(free >> i & 1)
+                for i, t in enumerate(self.slot_times)
+                if self._open[offset] >> i & 1
+            }
+
+    def start_times(self, day: Date, slots: int = 1) -> List[str]:
+        """Horarios donde puede empezar un trámite de `slots` turnos"""
+        with self._lock:
+            self._roll()
+            offset = self._offset(day)
+            if offset is None:
+                return []
+            starts = self._run_starts(self._free(offset), slots)
+            return [t for i, t in enumerate(self.slot_times) if starts >> i & 1]
+
+    def next_free_slots(self, slots: int = 1, from_date: Optional[Date] = None, n: int = 5) -> List[Tuple[str, str]]:
+        """Próximos `n` turnos (fecha, hora) con `slots` turnos consecutivos libres"""
+        with self._lock:
+            self._roll()
+            found: List[Tuple[str, str]] = []
+            first = max((from_date - self._start).days, 0) if from_date else 0
+            for offset in range(first, self.window_days):
+                starts = self._run_starts(self._free(offset), slots)
+                while starts and len(found) < n:
+                    low = starts & -starts
+                    day = self._start + timedelta(days=offset)
+                    found.append((str(day), self.slot_times[low.bit_length() - 1]))
+                    starts ^= low
+                if len(found) >= n:
+                    break
+            return found
+
+    def available_dates(self, slots: int = 1, from_date: Optional[Date] = None, limit: Optional[int] = None) -> List[Date]:
+        """Fechas de la ventana con al menos un hueco para el trámite"""
+        with self._lock:
+            self._roll()
+            dates: List[Date] = []
+            first = max((from_date - self._start).days, 0) if from_date else 0
+            for offset in range(first, self.window_days):
+                if self._run_starts(self._free(offset), slots):
+                    dates.append(self._start + timedelta(days=offset))
+                    if limit and len(dates) >= limit:
+                        break
+            return dates
+
+    def slot_times_from(self, start_time: str, slots: int) -> Optional[List[str]]:
+        """Horarios consecutivos que ocupa un trámite que empieza en `start_time`"""
+        index = self._index.get(start_time)
+        if index is None or index + slots > len(self.slot_times):
+            return None
+        if self._run_starts(self._full_mask, slots) >> index & 1 == 0:
+            return None
+        return self.slot_times[index:index + slots]
+
+    def mark_booked(self, day: Date, times: Iterable[str], booked: bool = True):
+        """Refleja localmente una reserva/cancelación ya confirmada en SQLite"""
+        with self._lock:
+            offset = self._offset(day)
+            if offset is None:
+                return
+            mask = 0
+            for t in times:
+                if t in self._index:
+                    mask |= 1 << self._index[t]
+            if booked:
+                self._booked[offset] |= mask
+            else:
+                self._booked[offset] &= ~mask
@@ -0,0 +1,115 @@
+# slot_store.py
+"""
+Estado de los turnos persistido en SQLite y compartido entre procesos.
+
+Cada turno reservado es una fila con clave primaria (office, date, time):
+la restricción de unicidad hace que dos sesiones o procesos nunca puedan
+reservar el mismo horario, sin locks en memoria.
+"""
+
+import sqlite3
+import threading
+from datetime import datetime
+from typing import List, Set, Tuple
+
+from database import DB_PATH, get_connection
+
+DEFAULT_OFFICE = "central"
+
+
+class SlotStore:
+    """Reservas atómicas de turnos por oficina, fecha y hora"""
+
+    def __init__(self, db_path: str = DB_PATH, office: str = DEFAULT_OFFICE):
+        self.db_path = db_path
+        self.office = office
+        self._local = threading.local()
+        self._init_table()
+
+    def _conn(self) -> sqlite3.Connection:
+        """Una conexión por hilo (sqlite3 no comparte conexiones entre hilos)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = get_connection(self.db_path)
+            self._local.conn = conn
+        return conn
+
+    def _init_table(self):
+        conn = self._conn()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS appointment_slots (
+                office TEXT NOT NULL,
+                date TEXT NOT NULL,
+                time TEXT NOT NULL,
+                appointment_id TEXT NOT NULL,
+                booked_at TEXT NOT NULL,
+                PRIMARY KEY (office, date, time)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_appointment_slots_appointment
+            ON appointment_slots (appointment_id)
+        """)
+
+    def booked_times(self, date: str) -> Set[str]:
+        """Horarios ya reservados de una fecha (lectura por prefijo de la clave primaria)"""
+        rows = self._conn().execute(
+            "SELECT time FROM appointment_slots WHERE office = ? AND date = ?",
+            (self.office, date)
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def booked_between(self, start_date: str, end_date: str) -> List[Tuple[str, str]]:
+        """Reservas (date, time) de un rango de fechas, ambos extremos incluidos"""
+        return self._conn().execute(
+            "SELECT date, time FROM appointment_slots "
+            "WHERE office = ? AND date BETWEEN ? AND ?",
+            (self.office, start_date, end_date)
+        ).fetchall()
+
+    def book(self, date: str, time: str, appointment_id: str) -> bool:
+        """
+        Reserva un horario de forma atómica.
+        Returns: True si se reservó, False si otro ciudadano lo tomó antes.
+        """
+        return self.book_many(date, [time], appointment_id)
+
+    def book_many(self, date: str, times: List[str], appointment_id: str) -> bool:
+        """Reserva varios horarios consecutivos: todos o ninguno"""
+        conn = self._conn()
+        booked_at = datetime.now().isoformat()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO appointment_slots (office, date, time, appointment_id, booked_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(self.office, date, time, appointment_id, booked_at) for time in times]
+            )
+        except sqlite3.IntegrityError:
+            conn.execute("ROLLBACK")
+            return False
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return True
+
+    def release(self, appointment_id: str) -> List[Tuple[str, str]]:
+        """Libera los horarios de una cita. Returns: lista de (date, time) liberados"""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT date, time FROM appointment_slots WHERE office = ? AND appointment_id = ?",
+                (self.office, appointment_id)
+            ).fetchall()
+            if rows:
+                conn.execute(
+                    "DELETE FROM appointment_slots WHERE office = ? AND appointment_id = ?",
+                    (self.office, appointment_id)
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
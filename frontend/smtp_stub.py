@@ -0,0 +1,127 @@
+# smtp_stub.py
+"""
+Servidor SMTP local para desarrollo y pruebas: acepta cualquier correo, lo
+guarda en memoria (LocalSMTPServer.messages) y, si se indica, lo agrega a un
+archivo mbox. No entrega nada a Internet.
+
+Uso (desde la raíz del repositorio):
+    python frontend/smtp_stub.py --port 1025 --mbox /tmp/mia.mbox
+
+Desde código (pruebas):
+    server = LocalSMTPServer(("127.0.0.1", 0)); server.start()
+    ... MIA_SMTP_PORT=server.port ...
+    server.messages  # [email.message.EmailMessage]
+    server.reject("malo@ejemplo.com")  # responde 550 a ese destinatario
+"""
+
+import argparse
+import logging
+import mailbox
+import socketserver
+import threading
+from email import message_from_bytes, policy
+from typing import List, Optional, Set
+
+logger = logging.getLogger("mia.smtp")
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Subconjunto de SMTP suficiente para smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT"""
+
+    def _reply(self, line: str) -> None:
+        self.wfile.write(line.encode("ascii") + b"\r\n")
+
+    def handle(self):
+        server: "LocalSMTPServer" = self.server
+        self._reply("220 mia-smtp-stub listo")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self._reply("250 mia-smtp-stub")
+            elif verb == "MAIL":
+                sender, recipients = command.split(":", 1)[1].strip(), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                recipient = command.split(":", 1)[1].strip().strip("<>")
+                if recipient.lower() in server.rejected:
+                    self._reply("550 Destinatario rechazado")
+                else:
+                    recipients.append(recipient)
+                    self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 Fin con <CRLF>.<CRLF>")
+                data = []
+                for raw in self.rfile:
+                    if raw in (b".\r\n", b".\n"):
+                        break
+                    data.append(raw[1:] if raw.startswith(b"..") else raw)
+                server.deliver(sender, recipients, b"".join(data))
+                self._reply("250 OK")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self._reply("250 OK")
+            elif verb == "NOOP":
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Adios")
+                return
+            else:
+                self._reply("502 Comando no implementado")
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """Servidor SMTP en un hilo que guarda los correos recibidos"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 1025), mbox_path: Optional[str] = None):
+        super().__init__(address, _SMTPHandler)
+        self.mbox_path = mbox_path
+        self.messages: List = []
+        self.rejected: Set[str] = set()
+        self._lock = threading.Lock()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def reject(self, address: str) -> None:
+        self.rejected.add(address.lower())
+
+    def deliver(self, sender: str, recipients: List[str], data: bytes) -> None:
+        message = message_from_bytes(data, policy=policy.default)
+        with self._lock:
+            self.messages.append(message)
+            if self.mbox_path:
+                box = mailbox.mbox(self.mbox_path)
+                box.add(message)
+                box.flush()
+        logger.info("Correo de %s para %s: %s", sender, ", ".join(recipients), message["Subject"])
+
+    def start(self) -> "LocalSMTPServer":
+        threading.Thread(target=self.serve_forever, name="smtp-stub", daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor SMTP local de MIA (no entrega correos)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--mbox", help="archivo mbox donde guardar los correos recibidos")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    server = LocalSMTPServer((args.host, args.port), args.mbox)
+    logger.info("SMTP local escuchando en %s:%s", args.host, server.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+# tenancy.py
+"""
+Un MiaService por municipio (ver backend/chatbot/tenants.py).
+
+- El municipio "default" usa el índice que carga chain.py y mia_users.db.
+- Cada otro municipio tiene su base SQLite (mia_<id>.db: turnos, casos,
+  trabajos y métricas propios, con el calendario de su oficina), su persona
+  en el prompt, su índice y su historial de chat y caché de respuestas
+  (separados por id, tenga o no persona). El índice se abre en la primera
+  consulta y la caché de tenants.py puede desalojarlo si otros municipios
+  lo desplazan; el servicio sigue vivo y lo vuelve a cargar en la
+  consulta siguiente.
+
+El municipio se elige con MIA_TENANT (app), el encabezado X-MIA-Tenant o
+el parámetro ?tenant= (api_server.py).
+"""
+
+import os
+import threading
+from typing import Dict, List, Optional
+
+from database import DB_PATH, init_data_tables, init_metrics_table
+from tenants import DEFAULT_TENANT, get_tenant, tenant_docsearch
+
+
+def tenant_db_path(tenant_id: str) -> str:
+    """Base SQLite del municipio (la por defecto para "default")"""
+    if tenant_id == DEFAULT_TENANT:
+        return DB_PATH
+    return os.path.join(os.path.dirname(DB_PATH), f"mia_{tenant_id}.db")
+
+
+class TenantServices:
+    """Servicios por municipio, creados en la primera consulta de cada uno"""
+
+    def __init__(self, default_service):
+        self._services: Dict[str, object] = {DEFAULT_TENANT: default_service}
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id: Optional[str] = None):
+        """MiaService del municipio. ValueError si no está configurado"""
+        tenant_id = tenant_id or DEFAULT_TENANT
+        service = self._services.get(tenant_id)
+        if service is not None:
+            return service
+        with self._lock:
+            service = self._services.get(tenant_id)
+            if service is None:
+                service = self._services[tenant_id] = self._build(tenant_id)
+        return service
+
+    def _build(self, tenant_id: str):
+        from appointment_manager import QueryProcessor
+        from service import MiaService
+        from slot_store import DEFAULT_OFFICE
+
+        try:
+            tenant = get_tenant(tenant_id)
+        except KeyError:
+            raise ValueError(f"Municipio desconocido: {tenant_id}")
+        db_path = tenant_db_path(tenant_id)
+        init_data_tables(db_path)
+        init_metrics_table(db_path)
+        processor = QueryProcessor(
+            db_path,
+            persona=tenant.persona,
+            office=tenant.office or DEFAULT_OFFICE,
+            use_faq=False,
+            tenant_id=tenant_id,
+        )
+        return MiaService(processor, tenant_docsearch(tenant_id), db_path)
+
+    def loaded(self) -> List[str]:
+        return list(self._services)
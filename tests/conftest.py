@@ -0,0 +1,10 @@
+# conftest.py
+"""Pone frontend/ y backend/chatbot/ en sys.path, como hacen app.py y api_server.py"""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (os.path.join(ROOT, "frontend"), os.path.join(ROOT, "backend", "chatbot")):
+    if path not in sys.path:
+        sys.path.append(path)
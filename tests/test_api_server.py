@@ -0,0 +1,73 @@
+# test_api_server.py
+"""Las rutas de casos exigen el token de administración y los cuerpos deben ser objetos JSON"""
+
+import http.client
+import json
+import threading
+
+import pytest
+
+import api_server
+from api_server import MiaHTTPServer, MiaRequestHandler
+
+
+class _Service:
+    def case_status(self, case_id):
+        return {"id": case_id, "status": "pending"}
+
+    def release_case(self, case_id):
+        return True, "Caso liberado"
+
+    def llm_metrics(self):
+        return {}
+
+
+class _Services:
+    def get(self, tenant):
+        return _Service()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(api_server, "API_TOKEN", "secreto")
+    server = MiaHTTPServer(("127.0.0.1", 0), MiaRequestHandler, _Services())
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _request(server, method, path, body=None, token=None):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    try:
+        conn.request(method, path, body=body, headers=headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read().decode("utf-8"))
+    finally:
+        conn.close()
+
+
+def test_case_routes_require_the_token(server):
+    assert _request(server, "GET", "/cases/C-1")[0] == 401
+    assert _request(server, "GET", "/cases/C-1", token="otro")[0] == 401
+    assert _request(server, "POST", "/cases/release", json.dumps({"case_id": "C-1"}))[0] == 401
+    assert _request(server, "GET", "/cases/C-1", token="secreto") == (200, {"id": "C-1", "status": "pending"})
+    assert _request(server, "POST", "/cases/release", json.dumps({"case_id": "C-1"}), token="secreto")[0] == 200
+    # El resto de la API no cambia
+    assert _request(server, "GET", "/metrics/llm")[0] == 200
+
+
+def test_case_routes_disabled_without_token(server, monkeypatch):
+    monkeypatch.setattr(api_server, "API_TOKEN", "")
+    assert _request(server, "GET", "/cases/C-1", token="secreto")[0] == 403
+
+
+@pytest.mark.parametrize("body", ["[]", '"texto"', "42", "null"])
+def test_non_object_body_is_rejected(server, body):
+    status, payload = _request(server, "POST", "/chat", body)
+    assert status == 400
+    assert "objeto JSON" in payload["error"]
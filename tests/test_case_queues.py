@@ -0,0 +1,111 @@
+# test_case_queues.py
+"""El despacho asigna desde SQLite: ve los casos de otros procesos y respeta el envejecimiento"""
+
+import sqlite3
+from datetime import datetime, timedelta
+
+from case_queues import DispatchQueues
+from database import get_case, init_data_tables, insert_cases
+
+
+def _case(case_id: str, priority: str, hours_ago: float, department: str = "LEGAL") -> dict:
+    created_at = (datetime.now() - timedelta(hours=hours_ago)).isoformat()
+    return {
+        "id": case_id,
+        "citizen_email": "vecino@ejemplo.com",
+        "description": "reclamo",
+        "department": department,
+        "priority": priority,
+        "status": "pending",
+        "created_at": created_at,
+    }
+
+
+def _db(tmp_path) -> str:
+    db_path = str(tmp_path / "cases.db")
+    init_data_tables(db_path)
+    return db_path
+
+
+def test_low_case_that_waited_goes_ahead_of_newer_high(tmp_path):
+    db_path = _db(tmp_path)
+    dispatch = DispatchQueues(db_path)
+    insert_cases([
+        _case("new-high", "high", hours_ago=0),
+        _case("old-low", "low", hours_ago=10),
+        _case("recent-low", "low", hours_ago=1),
+        _case("medium", "medium", hours_ago=1),
+    ], db_path)
+
+    # HIGH lleva 8 h de ventaja y MEDIUM 2 h: un LOW de hace 10 h va primero
+    assigned = [dispatch.assign_next("LEGAL", "ana") for _ in range(5)]
+    assert assigned == ["old-low", "new-high", "medium", "recent-low", None]
+
+
+def test_assign_next_sees_cases_saved_by_other_processes(tmp_path):
+    db_path = _db(tmp_path)
+    # Este proceso arrancó con la base vacía; otro guardó los casos después
+    dispatch = DispatchQueues(db_path)
+    insert_cases([
+        _case("legal", "low", hours_ago=1),
+        _case("other-department", "high", hours_ago=20, department="PERMITS"),
+    ], db_path)
+
+    assert dispatch.assign_next("LEGAL", "ana") == "legal"
+    assert get_case("legal", db_path)["assigned_to"] == "ana"
+    assert get_case("other-department", db_path)["status"] == "pending"
+    assert DispatchQueues(db_path).assign_next("LEGAL", "beto") is None
+
+
+def test_assign_next_reads_the_index_without_sorting(tmp_path):
+    db_path = _db(tmp_path)
+    conn = sqlite3.connect(db_path)
+    try:
+        plan = " ".join(row[-1] for row in conn.execute("""
+            EXPLAIN QUERY PLAN
+            SELECT id FROM complex_cases
+            WHERE status = 'pending' AND department = 'LEGAL' AND assigned_to IS NULL
+            ORDER BY queue_key, id
+            LIMIT 1
+        """))
+    finally:
+        conn.close()
+    assert "idx_complex_cases_dispatch" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_release_case_assigned_by_other_process(tmp_path):
+    db_path = _db(tmp_path)
+    insert_cases([_case("c1", "high", hours_ago=1)], db_path)
+    assert DispatchQueues(db_path).assign_next("LEGAL", "ana") == "c1"
+
+    dispatch = DispatchQueues(db_path)
+    assert dispatch.release("c1")
+    assert not dispatch.release("c1")
+    assert get_case("c1", db_path)["assigned_to"] is None
+    assert DispatchQueues(db_path).assign_next("LEGAL", "beto") == "c1"
+    assert dispatch.assign_next("LEGAL", "ana") is None
+
+
+def test_existing_cases_get_their_queue_key(tmp_path):
+    db_path = str(tmp_path / "cases.db")
+    conn = sqlite3.connect(db_path)
+    # Base anterior a las colas: sin asignación ni clave
+    conn.execute("""
+        CREATE TABLE complex_cases (
+            id TEXT PRIMARY KEY, citizen_email TEXT, description TEXT, department TEXT,
+            priority TEXT, status TEXT, created_at TEXT
+        )
+    """)
+    for case in (_case("new-high", "high", hours_ago=0), _case("old-low", "low", hours_ago=10)):
+        conn.execute(
+            "INSERT INTO complex_cases VALUES (?, ?, ?, ?, ?, ?, ?)",
+            tuple(case[key] for key in ("id", "citizen_email", "description", "department",
+                                        "priority", "status", "created_at")),
+        )
+    conn.commit()
+    conn.close()
+
+    init_data_tables(db_path)
+    dispatch = DispatchQueues(db_path)
+    assert [dispatch.assign_next("LEGAL", "ana") for _ in range(2)] == ["old-low", "new-high"]
@@ -0,0 +1,59 @@
+# test_follow_up.py
+"""Repreguntas: continúan el turno anterior, pero un cambio de tema no lo es"""
+
+import pytest
+
+from follow_up import FollowUpTracker, Turn, is_follow_up
+
+PREVIOUS = "¿Qué necesito para renovar el DNI?"
+
+
+@pytest.mark.parametrize("query", [
+    "¿Cuánto cuesta?",
+    "¿Dónde se hace?",
+    "¿Cuánto tarda?",
+    "¿Qué documentos necesito?",
+    "¿Cuánto tarda el DNI?",
+    "¿Y para menores?",
+    "¿Eso se puede hacer online?",
+    "Y los horarios?",
+])
+def test_follow_ups(query):
+    assert is_follow_up(query, PREVIOUS)
+
+
+@pytest.mark.parametrize("query", [
+    "¿Cuánto cuesta el pasaporte?",
+    "¿Qué documentos necesito para la licencia de conducir?",
+    "¿Cómo pago una multa de tránsito?",
+    "¿Dónde se tramita la habilitación comercial?",
+    "Necesito información sobre el estacionamiento medido",
+    "¿y cuánto cuesta el pasaporte?",
+    "y para el pasaporte qué piden",
+    "Pero eso para la licencia de conducir",
+])
+def test_topic_switches_are_not_follow_ups(query):
+    assert not is_follow_up(query, PREVIOUS)
+
+
+def test_question_with_its_own_topic_needs_a_previous_turn_about_it():
+    assert not is_follow_up("¿Qué documentos necesito para el DNI?")
+    assert is_follow_up("¿Qué documentos necesito para el DNI?", PREVIOUS)
+
+
+def test_tracker_matches_only_follow_ups_of_the_same_conversation():
+    tracker = FollowUpTracker()
+    tracker.remember("sesion-a", Turn(PREVIOUS, "simple_info", "Renovación de DNI"))
+
+    assert tracker.match("sesion-a", "¿Cuánto cuesta?").procedure_name == "Renovación de DNI"
+    # Otra pestaña del mismo ciudadano invitado no hereda el turno
+    assert tracker.match("sesion-b", "¿Cuánto cuesta?") is None
+    assert tracker.match("sesion-a", "¿Cuánto cuesta el pasaporte?") is None
+    assert tracker.match("sesion-a", "¿y cuánto cuesta el pasaporte?") is None
+    assert tracker.match("", "¿Cuánto cuesta?") is None
+
+
+def test_expired_turn_is_not_continued():
+    tracker = FollowUpTracker(ttl_s=0.0)
+    tracker.remember("sesion-a", Turn(PREVIOUS, "simple_info", "Renovación de DNI", at=0.0))
+    assert tracker.match("sesion-a", "¿Cuánto cuesta?") is None
@@ -0,0 +1,159 @@
+# test_job_queue.py
+"""La cola de trabajos entrega los correos al servidor SMTP local, reintenta y manda a dead_jobs"""
+
+import socket
+import sqlite3
+import time
+
+import pytest
+
+import notifications
+from database import init_data_tables, init_metrics_table
+from job_queue import JobQueue, dead_letters, queue_stats, requeue_dead
+from smtp_stub import LocalSMTPServer
+
+CASE = {
+    "id": "C-1",
+    "citizen_email": "vecino@ejemplo.com",
+    "citizen_name": "Ana",
+    "department": "LEGAL",
+    "priority": "alta",
+}
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    server = LocalSMTPServer(("127.0.0.1", 0)).start()
+    monkeypatch.setenv("MIA_SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(notifications, "SMTP_HOST", "127.0.0.1")
+    monkeypatch.setattr(notifications, "SMTP_PORT", server.port)
+    monkeypatch.delenv("MIA_DEPARTMENT_WEBHOOKS", raising=False)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def queue(tmp_path):
+    db_path = str(tmp_path / "jobs.db")
+    init_data_tables(db_path)
+    init_metrics_table(db_path)
+    # Sin hilos: las pruebas ejecutan los trabajos con drain()
+    return notifications.register_handlers(
+        JobQueue(db_path, workers=0, max_attempts=3, base_delay=0.05, max_delay=0.1)
+    )
+
+
+def _job(queue: JobQueue, job_id: int) -> dict:
+    conn = sqlite3.connect(queue.db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        return dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+    finally:
+        conn.close()
+
+
+def _closed_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_case_jobs_are_delivered(smtp, queue):
+    notifications.enqueue_case_jobs(queue, CASE)
+    assert queue.drain()
+
+    assert [message["To"] for message in smtp.messages] == ["vecino@ejemplo.com"]
+    assert "C-1" in smtp.messages[0]["Subject"]
+    assert queue.stats() == {"queued": 0, "running": 0, "done": 2, "dead": 0}
+    conn = sqlite3.connect(queue.db_path)
+    try:
+        assert conn.execute("SELECT complex_cases FROM metrics").fetchone() == (1,)
+    finally:
+        conn.close()
+
+
+def test_idempotency_key_deduplicates(smtp, queue):
+    notifications.enqueue_case_jobs(queue, CASE)
+    # El ciudadano reenvía el formulario: mismas claves, ningún trabajo nuevo
+    assert queue.enqueue("send_email", {"to": "x@ejemplo.com", "subject": "", "body": ""},
+                         "case:C-1:email") is None
+    notifications.enqueue_case_jobs(queue, CASE)
+    assert queue.drain()
+
+    assert len(smtp.messages) == 1
+    assert queue.stats()["done"] == 2
+
+
+def test_no_email_jobs_without_smtp(queue, monkeypatch):
+    # Sin MIA_SMTP_HOST cada correo terminaría en dead_jobs tras los reintentos
+    monkeypatch.delenv("MIA_SMTP_HOST", raising=False)
+    monkeypatch.delenv("MIA_DEPARTMENT_WEBHOOKS", raising=False)
+    notifications.enqueue_case_jobs(queue, CASE)
+    notifications.enqueue_appointment_jobs(queue, {"id": "T-1", "citizen_email": "vecino@ejemplo.com"})
+    assert queue.drain()
+
+    assert queue.stats() == {"queued": 0, "running": 0, "done": 2, "dead": 0}
+    conn = sqlite3.connect(queue.db_path)
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM jobs WHERE kind = 'send_email'").fetchone() == (0,)
+    finally:
+        conn.close()
+
+
+def test_retry_with_backoff(smtp, queue, monkeypatch):
+    monkeypatch.setattr(notifications, "SMTP_PORT", _closed_port())
+    job_id = queue.enqueue("send_email", {"to": "vecino@ejemplo.com", "subject": "Hola", "body": "."})
+    before = time.time()
+    assert queue.drain()
+
+    job = _job(queue, job_id)
+    assert job["status"] == "queued"
+    assert job["attempts"] == 1
+    assert job["last_error"].startswith("ConnectionRefusedError")
+    assert before <= job["run_after"] <= time.time() + queue.max_delay
+    assert smtp.messages == []
+
+    # El servidor vuelve: al vencer la espera, el reintento entrega el correo
+    monkeypatch.setattr(notifications, "SMTP_PORT", smtp.port)
+    time.sleep(queue.max_delay)
+    assert queue.drain()
+    job = _job(queue, job_id)
+    assert (job["status"], job["attempts"], job["last_error"]) == ("done", 2, None)
+    assert len(smtp.messages) == 1
+
+
+def test_exhausted_attempts_go_to_dead_jobs(smtp, queue, monkeypatch):
+    monkeypatch.setattr(notifications, "SMTP_PORT", _closed_port())
+    job_id = queue.enqueue("send_email", {"to": "vecino@ejemplo.com", "subject": "Hola", "body": "."})
+    for _ in range(queue.max_attempts):
+        assert queue.drain()
+        time.sleep(queue.max_delay)
+
+    assert queue.stats()["dead"] == 1
+    assert dead_letters(queue.db_path)[0]["id"] == job_id
+    assert dead_letters(queue.db_path)[0]["attempts"] == queue.max_attempts
+
+
+def test_permanent_error_goes_to_dead_jobs_and_requeues(smtp, queue):
+    smtp.reject("malo@ejemplo.com")
+    job_id = queue.enqueue("send_email", {"to": "malo@ejemplo.com", "subject": "Hola", "body": "."},
+                           "appointment:T-1:email")
+    assert queue.drain()
+
+    # Sin reintentos: un destinatario rechazado no se arregla esperando
+    dead = dead_letters(queue.db_path)
+    assert [(job["id"], job["attempts"]) for job in dead] == [(job_id, 1)]
+    assert dead[0]["last_error"].startswith("PermanentJobError")
+    assert queue_stats(queue.db_path)["queued"] == 0
+    assert smtp.messages == []
+
+    # Corregido el destinatario, el trabajo vuelve a la cola con la misma clave
+    smtp.rejected.clear()
+    assert requeue_dead(job_id, queue.db_path)
+    assert not requeue_dead(job_id, queue.db_path)
+    assert queue.drain()
+    assert dead_letters(queue.db_path) == []
+    job = _job(queue, job_id)
+    assert (job["status"], job["attempts"], job["idempotency_key"]) == ("done", 1, "appointment:T-1:email")
+    assert [message["To"] for message in smtp.messages] == ["malo@ejemplo.com"]
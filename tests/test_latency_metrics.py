@@ -0,0 +1,51 @@
+# test_latency_metrics.py
+"""Un volcado que no consigue el lock de SQLite conserva los contadores para el siguiente"""
+
+import sqlite3
+
+import pytest
+
+import database
+from database import init_metrics_table, transaction
+from latency_metrics import LatencyRecorder
+
+
+@pytest.fixture
+def locked_db(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "metrics.db")
+    init_metrics_table(db_path)
+    monkeypatch.setattr(database, "BUSY_TIMEOUT", 0.05)
+    # Otro proceso tiene el lock de escritura
+    holder = sqlite3.connect(db_path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    yield db_path, holder
+    holder.close()
+
+
+def _histogram(db_path: str):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT stage, SUM(count) FROM latency_histograms GROUP BY stage").fetchall()
+    finally:
+        conn.close()
+
+
+def test_flush_keeps_counts_when_the_database_is_locked(locked_db):
+    db_path, holder = locked_db
+    recorder = LatencyRecorder(db_path, flush_seconds=3600)
+    recorder.record("total", 12.0)
+    recorder.record("total", 40.0)
+
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        recorder.flush()
+
+    holder.execute("ROLLBACK")
+    recorder.flush()
+    assert _histogram(db_path) == [("total", 2)]
+
+
+def test_transaction_reports_the_lock_error(locked_db):
+    db_path, _ = locked_db
+    with pytest.raises(sqlite3.OperationalError, match="locked"):
+        with transaction(db_path) as conn:
+            conn.execute("SELECT 1")
@@ -0,0 +1,128 @@
+# test_llm_governor.py
+"""Which failures the LLM governor retries and holds against the provider."""
+import time
+
+import pytest
+
+from llm_governor import CircuitBreaker, LLMGovernor, is_retryable
+
+
+class OutputParserException(ValueError):
+    """Stand-in for langchain_core's parser error (not a provider failure)."""
+
+
+class ProviderError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ServiceUnavailable(Exception):
+    """Named like the google.api_core exception."""
+
+
+def _governor(**kwargs):
+    return LLMGovernor(
+        rate_per_second=1000, burst=1000, timeout=2, max_retries=2, base_delay=0, max_delay=0,
+        breaker=CircuitBreaker(failure_threshold=2, reset_timeout=60), **kwargs,
+    )
+
+
+def _failing(error, calls):
+    def fn():
+        calls.append(1)
+        raise error
+    return fn
+
+
+@pytest.mark.parametrize("error, expected", [
+    (TimeoutError(), True),
+    (ConnectionResetError(), True),
+    (ProviderError("busy", status_code=503), True),
+    (ProviderError("slow down", status_code=429), True),
+    (ProviderError("bad request", status_code=400), False),
+    (ServiceUnavailable("try later"), True),
+    (OutputParserException("Invalid json: costo 500 pesos, deadline mañana"), False),
+    (ValueError("field 503 missing"), False),
+])
+def test_is_retryable_uses_types_and_status(error, expected):
+    assert is_retryable(error) is expected
+
+
+def test_is_retryable_follows_wrapped_cause():
+    wrapper = RuntimeError("provider call failed")
+    wrapper.__cause__ = ProviderError("busy", status_code=502)
+    assert is_retryable(wrapper)
+
+
+def test_parser_errors_are_not_retried_nor_open_the_breaker():
+    governor = _governor()
+    calls = []
+    for _ in range(5):
+        assert governor.call(_failing(OutputParserException("not json"), calls), fallback=lambda: "fb") == "fb"
+    assert len(calls) == 5
+    assert governor.breaker.state == "closed"
+
+
+def test_provider_errors_are_retried_and_open_the_breaker():
+    governor = _governor()
+    calls = []
+    for _ in range(2):
+        governor.call(_failing(ProviderError("busy", status_code=503), calls), fallback=lambda: "fb")
+    assert len(calls) == 2 * 3
+    assert governor.breaker.state == "open"
+    assert governor.call(lambda: "ok", fallback=lambda: "fb") == "fb"
+
+
+def test_non_provider_error_frees_the_half_open_trial():
+    governor = _governor()
+    breaker = governor.breaker
+    breaker.state, breaker._opened_at = "open", 0.0
+    governor.call(_failing(OutputParserException("not json"), []), fallback=lambda: "fb")
+    # The trial slot was released, so the next call can still probe the provider
+    assert governor.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_expired_deadline_frees_the_half_open_trial(streaming):
+    governor = _governor()
+    breaker = governor.breaker
+    breaker.state, breaker._opened_at = "open", 0.0
+    expired = time.monotonic() - 1
+    if streaming:
+        assert list(governor.stream(lambda: iter(["x"]), fallback=lambda: "fb", deadline=expired)) == ["fb"]
+    else:
+        assert governor.call(lambda: "ok", fallback=lambda: "fb", deadline=expired) == "fb"
+    assert breaker.state == "half_open"
+    # The call never reached the provider: the next one gets to run the trial
+    assert governor.call(lambda: "ok") == "ok"
+    assert breaker.state == "closed"
+
+
+def test_backoff_and_retries_stop_at_the_deadline():
+    governor = LLMGovernor(
+        rate_per_second=1000, burst=1000, timeout=2, max_retries=5, base_delay=10, max_delay=10,
+        breaker=CircuitBreaker(failure_threshold=100),
+    )
+    # Jitter aside, every backoff outlasts the budget
+    governor._backoff = lambda attempt: 10
+    calls = []
+    started = time.monotonic()
+    result = governor.call(
+        _failing(ProviderError("busy", status_code=503), calls),
+        fallback=lambda: "fb", deadline=started + 0.2,
+    )
+    assert result == "fb"
+    # The backoff is cut at the deadline and no doomed attempt is submitted after it
+    assert time.monotonic() - started < 1
+    assert len(calls) == 1
+
+
+def test_rate_limit_wait_is_bounded_by_the_deadline():
+    governor = LLMGovernor(rate_per_second=0.1, burst=1, timeout=2, max_retries=0)
+    assert governor.call(lambda: "ok") == "ok"
+    started = time.monotonic()
+    assert governor.call(lambda: "ok", fallback=lambda: "fb", deadline=started + 0.2) == "fb"
+    assert time.monotonic() - started < 1
+    assert governor.metrics()["timeouts"] == 1
@@ -0,0 +1,127 @@
+# test_single_flight.py
+"""Las llamadas coalescidas no dejan entradas colgadas en SingleFlight"""
+
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def _wait_until(condition, timeout: float = 2.0) -> bool:
+    limit = time.monotonic() + timeout
+    while time.monotonic() < limit:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_abandoned_stream_is_released_when_it_finishes():
+    flight = SingleFlight()
+    stream = flight.do_stream("k", lambda: iter(["a", "b"]))
+    next(stream)  # El líder lee un fragmento y abandona el stream
+    assert _wait_until(lambda: not flight._streams)
+
+
+def test_failed_stream_is_released_and_error_reaches_consumers():
+    flight = SingleFlight()
+
+    def failing():
+        yield "a"
+        raise RuntimeError("LLM caído")
+
+    stream = flight.do_stream("k", failing)
+    with pytest.raises(RuntimeError):
+        list(stream)
+    assert _wait_until(lambda: not flight._streams)
+    # Una nueva consulta igual arranca su propio stream
+    assert list(flight.do_stream("k", lambda: iter(["ok"]))) == ["ok"]
+
+
+def test_do_releases_followers_on_base_exception():
+    flight = SingleFlight()
+    started = threading.Event()
+    outcome = []
+
+    def leader():
+        def fn():
+            started.set()
+            time.sleep(0.1)
+            raise KeyboardInterrupt
+        try:
+            flight.do("k", fn)
+        except KeyboardInterrupt:
+            pass
+
+    def follower():
+        started.wait()
+        try:
+            outcome.append(flight.do("k", lambda: "propio"))
+        except RuntimeError as e:
+            outcome.append(e)
+
+    threads = [threading.Thread(target=leader), threading.Thread(target=follower)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=2)
+    assert not any(thread.is_alive() for thread in threads)
+    assert len(outcome) == 1 and not flight._calls
+
+
+def _leader_and_follower(call_leader, call_follower):
+    """Corre el líder y, mientras está en curso, un seguidor con la misma clave"""
+    results = {}
+    leader = threading.Thread(target=lambda: results.update(leader=call_leader()))
+    leader.start()
+    time.sleep(0.05)
+    results["follower"] = call_follower()
+    leader.join(timeout=2)
+    return results
+
+
+def test_degraded_result_is_not_shared():
+    flight = SingleFlight()
+
+    def slow_fallback():
+        time.sleep(0.2)
+        return "respaldo"
+
+    results = _leader_and_follower(
+        lambda: flight.do("k", slow_fallback, degraded=lambda: True),
+        lambda: flight.do("k", lambda: "propia", degraded=lambda: False),
+    )
+    assert results == {"leader": "respaldo", "follower": "propia"}
+
+
+def test_good_result_is_shared():
+    flight = SingleFlight()
+
+    def slow_answer():
+        time.sleep(0.2)
+        return "respuesta"
+
+    results = _leader_and_follower(
+        lambda: flight.do("k", slow_answer, degraded=lambda: False),
+        lambda: flight.do("k", lambda: "propia"),
+    )
+    assert results == {"leader": "respuesta", "follower": "respuesta"}
+    assert flight.stats()["coalesced"] == 1
+
+
+def test_degraded_stream_is_not_shared():
+    flight = SingleFlight()
+    degraded = threading.Event()
+
+    def leader_stream():
+        time.sleep(0.2)
+        degraded.set()  # El respaldo se marca antes de emitir su único fragmento
+        yield "pasajes"
+
+    results = _leader_and_follower(
+        lambda: list(flight.do_stream("k", leader_stream, degraded=degraded.is_set)),
+        lambda: list(flight.do_stream("k", lambda: iter(["propia"]))),
+    )
+    assert results == {"leader": ["pasajes"], "follower": ["propia"]}
@@ -0,0 +1,40 @@
+# test_slot_calendar.py
+"""El calendario compartido entre hilos refleja exactamente las reservas confirmadas"""
+
+import threading
+
+from slot_calendar import SlotCalendar
+from slot_store import SlotStore
+
+WORKERS = 8
+
+
+def test_concurrent_refresh_and_mark_booked(tmp_path):
+    store = SlotStore(db_path=str(tmp_path / "slots.db"))
+    calendar = SlotCalendar(store, refresh_seconds=0.0)
+    dates = calendar.available_dates(limit=WORKERS)
+    barrier = threading.Barrier(WORKERS)
+    errors = []
+
+    def worker(n: int):
+        day = dates[n]
+        barrier.wait()
+        try:
+            for t in calendar.slot_times:
+                if store.book_many(str(day), [t], f"w{n}-{t}"):
+                    calendar.mark_booked(day, [t])
+                # Fuerza relecturas concurrentes con las marcas locales
+                calendar.next_free_slots(n=3)
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(WORKERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    for day in dates:
+        assert calendar.day_slots(day) == {t: False for t in calendar.slot_times}
+        assert calendar.start_times(day) == []
@@ -0,0 +1,86 @@
+# test_slot_store.py
+"""Reservas concurrentes contra un mismo archivo SQLite: ningún horario se reserva dos veces"""
+
+import multiprocessing as mp
+import threading
+from collections import Counter
+
+from slot_store import SlotStore
+
+DATE = "2030-03-04"
+TIMES = [f"{hour:02d}:{minute:02d}" for hour in range(8, 14) for minute in (0, 15, 30, 45)]
+ATTEMPTS = 60
+
+
+def _blocks(worker: int):
+    """Bloques de dos horarios consecutivos, solapados entre contendientes"""
+    for attempt in range(ATTEMPTS):
+        start = (worker * 7 + attempt) % (len(TIMES) - 1)
+        yield f"w{worker}-a{attempt}", TIMES[start:start + 2]
+
+
+def _contend(db_path: str, worker: int, barrier, results) -> None:
+    store = SlotStore(db_path=db_path)
+    barrier.wait()
+    for appointment_id, times in _blocks(worker):
+        if store.book_many(DATE, times, appointment_id):
+            results.append((appointment_id, tuple(times)))
+
+
+def _process_contender(db_path, worker, barrier, queue):
+    won = []
+    _contend(db_path, worker, barrier, won)
+    queue.put(won)
+
+
+def _assert_each_slot_booked_once(db_path, won):
+    store = SlotStore(db_path=db_path)
+    rows = store._conn().execute(
+        "SELECT time, appointment_id FROM appointment_slots WHERE date = ?", (DATE,)
+    ).fetchall()
+    per_slot = Counter(time for time, _ in rows)
+    assert per_slot and max(per_slot.values()) == 1
+    # Cada reserva ganada tiene todos sus horarios (todo o nada) y nada más
+    booked = {}
+    for time, appointment_id in rows:
+        booked.setdefault(appointment_id, set()).add(time)
+    assert booked == {appointment_id: set(times) for appointment_id, times in won}
+    # Ningún horario aparece en dos reservas ganadas
+    claimed = Counter(time for _, times in won for time in times)
+    assert max(claimed.values()) == 1
+
+
+def test_threads_never_double_book(tmp_path):
+    db_path = str(tmp_path / "slots.db")
+    SlotStore(db_path=db_path)
+    workers = 8
+    barrier = threading.Barrier(workers)
+    won = []
+    threads = [
+        threading.Thread(target=_contend, args=(db_path, worker, barrier, won))
+        for worker in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    _assert_each_slot_booked_once(db_path, won)
+
+
+def test_processes_never_double_book(tmp_path):
+    db_path = str(tmp_path / "slots.db")
+    SlotStore(db_path=db_path)
+    ctx = mp.get_context("fork")
+    workers = 4
+    barrier = ctx.Barrier(workers)
+    queue = ctx.Queue()
+    procs = [
+        ctx.Process(target=_process_contender, args=(db_path, worker, barrier, queue))
+        for worker in range(workers)
+    ]
+    for proc in procs:
+        proc.start()
+    won = [booking for _ in procs for booking in queue.get(timeout=60)]
+    for proc in procs:
+        proc.join()
+    _assert_each_slot_booked_once(db_path, won)